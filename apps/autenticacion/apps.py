@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AutenticacionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.autenticacion'
+
+    def ready(self):
+        # Invalidación del índice facial al guardar/eliminar descriptores
+        from . import signals  # noqa: F401
@@ -205,6 +205,15 @@ class AdminUserEditForm(UserEditForm):
                 self.fields['license_number'].initial = self.instance.license_number
 
 
+# Ubicación de la casa (opcional) en la edición del perfil: la llena el navegador con
+# su geolocalización y sirve para recibir solo las alertas de mascotas perdidas cercanas
+HOME_LOCATION_FIELDS = ['home_latitude', 'home_longitude']
+HOME_LOCATION_WIDGETS = {
+    'home_latitude': forms.HiddenInput(),
+    'home_longitude': forms.HiddenInput(),
+}
+
+
 class VeterinarianUserForm(BaseUserForm):
     """Formulario específico para usuarios veterinarios con campos adicionales"""
     
@@ -242,7 +251,8 @@ class VeterinarianEditForm(UserEditForm, VeterinarianUserForm):
     """Formulario para editar usuarios veterinarios"""
     
     class Meta(VeterinarianUserForm.Meta):
-        pass
+        fields = VeterinarianUserForm.Meta.fields + HOME_LOCATION_FIELDS
+        widgets = {**VeterinarianUserForm.Meta.widgets, **HOME_LOCATION_WIDGETS}
 
 
 class OwnerUserForm(BaseUserForm):
@@ -270,7 +280,8 @@ class OwnerEditForm(UserEditForm, OwnerUserForm):
     """Formulario para editar usuarios dueños"""
     
     class Meta(OwnerUserForm.Meta):
-        pass
+        fields = OwnerUserForm.Meta.fields + HOME_LOCATION_FIELDS
+        widgets = {**OwnerUserForm.Meta.widgets, **HOME_LOCATION_WIDGETS}
 
 
 class UserPasswordChangeForm(forms.Form):
@@ -2,6 +2,9 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
+from django.core.validators import MinValueValidator, MaxValueValidator
+
+from apps.autenticacion.utils import geohash
 
 class User(AbstractUser):
     # Opciones de roles
@@ -41,6 +44,29 @@ class User(AbstractUser):
     
     email = models.EmailField('Email', unique=True)
     
+    # Ubicación de la casa (opcional): las alertas de mascotas perdidas solo llegan
+    # a los usuarios cercanos. El geohash se calcula al guardar (ver utils.geohash)
+    home_latitude = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)],
+        verbose_name="Latitud de la casa"
+    )
+    home_longitude = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)],
+        verbose_name="Longitud de la casa"
+    )
+    home_geohash = models.CharField(
+        max_length=12,
+        blank=True,
+        default='',
+        db_index=True,
+        editable=False,
+        verbose_name="Geohash de la casa"
+    )
+    
     class Meta:
         verbose_name = "Usuario"
         verbose_name_plural = "Usuarios"
@@ -48,6 +74,16 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
     
+    def save(self, *args, **kwargs):
+        if self.home_latitude is not None and self.home_longitude is not None:
+            self.home_geohash = geohash.codificar(self.home_latitude, self.home_longitude)
+        else:
+            self.home_geohash = ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'home_latitude', 'home_longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'home_geohash'}
+        super().save(*args, **kwargs)
+    
     @property
     def is_admin(self):
         return self.role == self.Role.ADMIN
@@ -155,12 +191,12 @@ class UserFaceEmbedding(models.Model):
         self.successful_logins += 1
         self.last_successful_login = timezone.now()
         self.failed_attempts = 0
-        self.save()
+        self.save(update_fields=['successful_logins', 'last_successful_login', 'failed_attempts'])
     
     def increment_failed_attempt(self):
         """Incrementa el contador de intentos fallidos"""
         self.failed_attempts += 1
-        self.save()
+        self.save(update_fields=['failed_attempts'])
     
     @property
     def login_enabled(self):
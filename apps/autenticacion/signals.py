@@ -0,0 +1,25 @@
+"""
+Señales de la app de autenticación
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import UserFaceEmbedding
+from .utils.indice_facial import get_indice_facial
+
+# Campos que cambian el contenido del índice facial
+CAMPOS_INDICE_FACIAL = {'descriptor_data', 'is_active', 'allow_login'}
+
+
+@receiver(post_save, sender=UserFaceEmbedding)
+def invalidar_indice_facial_al_guardar(sender, instance, update_fields=None, **kwargs):
+    # Las actualizaciones de estadísticas (logins, intentos) no afectan a la matriz
+    if update_fields is not None and not CAMPOS_INDICE_FACIAL & set(update_fields):
+        return
+    transaction.on_commit(get_indice_facial().invalidar)
+
+
+@receiver(post_delete, sender=UserFaceEmbedding)
+def invalidar_indice_facial_al_eliminar(sender, instance, **kwargs):
+    transaction.on_commit(get_indice_facial().invalidar)
@@ -6,12 +6,229 @@ import cv2
 import numpy as np
 import json
 import base64
+import threading
 from pathlib import Path
 from django.conf import settings
 import logging
 
+from apps.mascota.services.carga_diferida import diferido
+
 logger = logging.getLogger(__name__)
 
+# Vecinos del LBP 3x3 (dy, dx) en orden de bit: bit 7 = arriba-izquierda, en sentido horario
+LBP_VECINOS = ((-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1))
+
+
+def _tablas_lbp():
+    """
+    Tablas código LBP (0-255) -> etiqueta para las variantes uniformes.
+
+    Un patrón es uniforme si tiene como máximo 2 transiciones 0/1 recorriendo
+    el círculo de vecinos (58 de los 256 códigos de 8 bits).
+    """
+    codigos = np.arange(256, dtype=np.uint16)
+    rotados = ((codigos << 1) | (codigos >> 7)) & 0xFF
+    transiciones = np.unpackbits((codigos ^ rotados).astype(np.uint8)[:, None], axis=1).sum(axis=1)
+    unos = np.unpackbits(codigos.astype(np.uint8)[:, None], axis=1).sum(axis=1)
+    uniformes = transiciones <= 2
+
+    # 'uniforme': una etiqueta por patrón uniforme (0-57) y una compartida para el resto (58)
+    uniforme = np.full(256, 58, dtype=np.uint8)
+    uniforme[uniformes] = np.arange(int(uniformes.sum()), dtype=np.uint8)
+    # 'uniforme_ri' (invariante a rotación): número de unos si es uniforme (0-8), si no 9
+    uniforme_ri = np.where(uniformes, unos, 9).astype(np.uint8)
+    return {'uniforme': (uniforme, 59), 'uniforme_ri': (uniforme_ri, 10)}
+
+
+LBP_TABLAS = _tablas_lbp()
+
+
+class FaceDescriptorExtractor:
+    """
+    Descriptor facial (LBP + HOG simplificado + Gabor + landmarks) de una ROI 128x128.
+    
+    El banco de kernels de Gabor se calcula una sola vez y cada hilo reutiliza sus
+    propios buffers de trabajo (escala de grises, Sobel, ángulos, filtrado, LBP),
+    así las capturas repetidas del registro y del login no vuelven a reservar
+    memoria. Una misma instancia puede compartirse entre hilos.
+    """
+    
+    # Variantes del histograma LBP: 'clasico' (256 códigos, el descriptor usa los 64 primeros bins),
+    # 'uniforme' (59 bins) o 'uniforme_ri' (10 bins, invariante a rotación). Ocupan los mismos
+    # 64 valores del descriptor; descriptores de variantes distintas no son comparables
+    LBP_MODOS = ('clasico', 'uniforme', 'uniforme_ri')
+    LBP_BINS_DESCRIPTOR = 64
+    
+    # Orientaciones del banco de Gabor (kernel 21x21, sigma 5, lambda 10, gamma 0.5)
+    GABOR_ORIENTACIONES = (0, np.pi/4, np.pi/2, 3*np.pi/4)
+    
+    def __init__(self, lbp_modo='clasico'):
+        if lbp_modo not in self.LBP_MODOS:
+            raise ValueError(f"Variante de LBP no soportada: {lbp_modo}")
+        self.lbp_modo = lbp_modo
+        self.gabor_bank = tuple(
+            cv2.getGaborKernel((21, 21), 5, theta, 10, 0.5, 0)
+            for theta in self.GABOR_ORIENTACIONES
+        )
+        self._local = threading.local()
+    
+    def _buffers(self, shape):
+        """
+        Buffers de trabajo del hilo actual para imágenes de tamaño `shape` (alto, ancho)
+        
+        Returns:
+            dict: Arrays reutilizables; el LBP conserva su borde de 1 píxel en 0
+        """
+        cache = getattr(self._local, 'buffers', None)
+        if cache is None:
+            cache = self._local.buffers = {}
+        buffers = cache.get(shape)
+        if buffers is None:
+            h, w = shape
+            interior = (max(h - 2, 0), max(w - 2, 0))
+            buffers = cache[shape] = {
+                'gray': np.empty(shape, dtype=np.uint8),
+                'gx': np.empty(shape, dtype=np.float32),
+                'gy': np.empty(shape, dtype=np.float32),
+                'mag': np.empty(shape, dtype=np.float32),
+                'ang': np.empty(shape, dtype=np.float32),
+                'filtered': np.empty(shape, dtype=np.float32),
+                'lbp': np.zeros(shape, dtype=np.uint8),
+                'cmp': np.empty(interior, dtype=bool),
+                'bits': np.empty(interior, dtype=np.uint8),
+            }
+        return buffers
+    
+    def compute_lbp(self, gray_image):
+        """
+        Calcula Local Binary Pattern
+        
+        Args:
+            gray_image: Imagen en escala de grises
+            
+        Returns:
+            numpy.ndarray: Imagen con patrones LBP (array nuevo)
+        """
+        return self._lbp_into(gray_image, self._buffers(gray_image.shape)).copy()
+    
+    def _lbp_into(self, gray_image, buffers):
+        """
+        LBP sobre los buffers del hilo: compara cada vecino con el píxel central
+        desplazando la imagen completa (8 comparaciones vectorizadas en lugar de un
+        bucle por píxel). El borde de 1 píxel queda en 0, igual que en la versión
+        por bucles.
+        """
+        h, w = gray_image.shape
+        lbp = buffers['lbp']
+        if h < 3 or w < 3:
+            return lbp
+        
+        center = gray_image[1:h-1, 1:w-1]
+        code = lbp[1:h-1, 1:w-1]
+        code.fill(0)
+        cmp, bits = buffers['cmp'], buffers['bits']
+        for bit, (dy, dx) in zip(range(7, -1, -1), LBP_VECINOS):
+            np.greater_equal(gray_image[1+dy:h-1+dy, 1+dx:w-1+dx], center, out=cmp)
+            np.left_shift(cmp.view(np.uint8), bit, out=bits)
+            code |= bits
+        return lbp
+    
+    def _uniform_lbp_histogram(self, lbp):
+        """
+        Histograma normalizado de la variante uniforme del LBP
+        
+        Args:
+            lbp: Imagen LBP clásica
+            
+        Returns:
+            numpy.ndarray: LBP_BINS_DESCRIPTOR valores (los bins sobrantes en 0)
+        """
+        table, bins = LBP_TABLAS[self.lbp_modo]
+        # Sin el borde: no tiene vecinos y su código 0 no es un patrón real
+        labels = table[lbp[1:-1, 1:-1]]
+        hist = np.bincount(labels.ravel(), minlength=bins).astype(np.float32)
+        hist = hist / (hist.sum() + 1e-7)
+        return np.pad(hist, (0, self.LBP_BINS_DESCRIPTOR - bins))
+    
+    def extract(self, face_roi, landmarks):
+        """
+        Genera un descriptor robusto combinando múltiples características
+        
+        Args:
+            face_roi: Región del rostro normalizada (BGR)
+            landmarks: Puntos de referencia faciales
+            
+        Returns:
+            list: Descriptor facial normalizado
+        """
+        buffers = self._buffers(face_roi.shape[:2])
+        
+        # Convertir a escala de grises
+        gray = cv2.cvtColor(face_roi, cv2.COLOR_BGR2GRAY, dst=buffers['gray'])
+        
+        # 1. Histograma de LBP (Local Binary Patterns)
+        lbp = self._lbp_into(gray, buffers)
+        if self.lbp_modo == 'clasico':
+            hist_lbp = cv2.calcHist([lbp], [0], None, [256], [0, 256])
+            hist_lbp = hist_lbp.flatten() / (hist_lbp.sum() + 1e-7)
+        else:
+            hist_lbp = self._uniform_lbp_histogram(lbp)
+        
+        # 2. Histograma de gradientes orientados (HOG simplificado)
+        gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, dst=buffers['gx'], ksize=3)
+        gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, dst=buffers['gy'], ksize=3)
+        _, ang = cv2.cartToPolar(gx, gy, magnitude=buffers['mag'], angle=buffers['ang'])
+        hist_hog = cv2.calcHist([ang], [0], None, [18], [0, 2*np.pi])
+        hist_hog = hist_hog.flatten() / (hist_hog.sum() + 1e-7)
+        
+        # 3. Características de textura (banco de Gabor con diferentes orientaciones)
+        gabor_features = []
+        for kernel in self.gabor_bank:
+            filtered = cv2.filter2D(gray, cv2.CV_32F, kernel, dst=buffers['filtered'])
+            gabor_features.extend([filtered.mean(), filtered.std()])
+        gabor_features = np.array(gabor_features)
+        gabor_features = gabor_features / (np.linalg.norm(gabor_features) + 1e-7)
+        
+        # 4. Características geométricas de landmarks
+        if landmarks and len(landmarks) >= 5:
+            landmarks_arr = np.array(landmarks, dtype=np.float32)
+            # Normalizar landmarks relativos al centro
+            center = landmarks_arr.mean(axis=0)
+            landmarks_norm = (landmarks_arr - center) / (np.linalg.norm(landmarks_arr - center) + 1e-7)
+            geometric_features = landmarks_norm.flatten()
+        else:
+            geometric_features = np.zeros(10)
+        
+        # Combinar todas las características
+        descriptor = np.concatenate([
+            hist_lbp[:64],  # 64 bins del LBP
+            hist_hog,       # 18 bins del HOG
+            gabor_features, # 8 características Gabor
+            geometric_features  # 10 características geométricas
+        ])
+        
+        # Normalizar descriptor final
+        descriptor = descriptor / (np.linalg.norm(descriptor) + 1e-7)
+        
+        return descriptor.tolist()
+    
+    def extract_batch(self, face_rois, landmarks_list=None):
+        """
+        Genera los descriptores de varias ROIs (p. ej. los cuadros de una captura)
+        reutilizando el banco de kernels y los buffers del hilo
+        
+        Args:
+            face_rois: Lista de regiones del rostro normalizadas
+            landmarks_list: Landmarks de cada ROI (opcional)
+            
+        Returns:
+            list: Descriptores en el mismo orden
+        """
+        if landmarks_list is None:
+            landmarks_list = [None] * len(face_rois)
+        return [self.extract(roi, landmarks) for roi, landmarks in zip(face_rois, landmarks_list)]
+
+
 class FacialRecognitionSystem:
     """Sistema de reconocimiento facial para autenticación de usuarios"""
     
@@ -26,8 +243,19 @@ class FacialRecognitionSystem:
     # Parámetros para comparación de rostros
     SIMILARITY_THRESHOLD = 0.65  # Umbral para considerar rostros similares
     
+    # Variantes del histograma LBP (ver FaceDescriptorExtractor)
+    LBP_MODOS = FaceDescriptorExtractor.LBP_MODOS
+    
+    # Tamaño de la ROI normalizada del rostro
+    ROI_SIZE = (128, 128)
+    
     def __init__(self):
         """Inicializa el detector de rostros con YuNet"""
+        lbp_modo = getattr(settings, 'FACIAL_LBP_MODO', 'clasico')
+        if lbp_modo not in self.LBP_MODOS:
+            raise ValueError(f"FACIAL_LBP_MODO no soportado: {lbp_modo}")
+        self.descriptor_extractor = FaceDescriptorExtractor(lbp_modo)
+        
         try:
             # Cargar el modelo YuNet
             self.detector = cv2.FaceDetectorYN.create(
@@ -114,6 +342,53 @@ class FacialRecognitionSystem:
             logger.error(f"Error en detección de rostros: {e}")
             return None, [], 0.0
     
+    @property
+    def lbp_modo(self):
+        """Variante de LBP del descriptor"""
+        return self.descriptor_extractor.lbp_modo
+    
+    @lbp_modo.setter
+    def lbp_modo(self, value):
+        self.descriptor_extractor.lbp_modo = value
+    
+    def _detect_face_roi(self, image_data):
+        """
+        Detecta el rostro principal y extrae su ROI normalizada
+        
+        Returns:
+            tuple: (roi 128x128, face_info, confianza) o None si no hay rostro suficiente
+        """
+        image, faces, confidence = self.detect_faces(image_data)
+        
+        if not faces or confidence < self.CONFIDENCE_THRESHOLD:
+            return None
+        
+        face_info = faces[0]
+        x, y, w, h = face_info['bbox']
+        
+        # Extraer región del rostro con margen
+        margin = 20
+        x1 = max(0, x - margin)
+        y1 = max(0, y - margin)
+        x2 = min(image.shape[1], x + w + margin)
+        y2 = min(image.shape[0], y + h + margin)
+        
+        face_roi = image[y1:y2, x1:x2]
+        
+        # Redimensionar a tamaño estándar
+        face_roi = cv2.resize(face_roi, self.ROI_SIZE)
+        
+        return face_roi, face_info, confidence
+    
+    def _descriptor_data(self, descriptor, face_info, confidence):
+        return {
+            'descriptor': descriptor,
+            'bbox': face_info['bbox'],
+            'confidence': confidence,
+            'landmarks': face_info['landmarks'],
+            'lbp': self.lbp_modo
+        }
+    
     def extract_face_descriptor(self, image_data):
         """
         Extrae un descriptor facial de la imagen
@@ -125,35 +400,15 @@ class FacialRecognitionSystem:
             dict: Diccionario con el descriptor y metadatos
         """
         try:
-            image, faces, confidence = self.detect_faces(image_data)
-            
-            if not faces or confidence < self.CONFIDENCE_THRESHOLD:
+            detected = self._detect_face_roi(image_data)
+            if detected is None:
                 return None
-            
-            face_info = faces[0]
-            x, y, w, h = face_info['bbox']
-            
-            # Extraer región del rostro con margen
-            margin = 20
-            x1 = max(0, x - margin)
-            y1 = max(0, y - margin)
-            x2 = min(image.shape[1], x + w + margin)
-            y2 = min(image.shape[0], y + h + margin)
-            
-            face_roi = image[y1:y2, x1:x2]
-            
-            # Redimensionar a tamaño estándar
-            face_roi = cv2.resize(face_roi, (128, 128))
+            face_roi, face_info, confidence = detected
             
             # Generar descriptor basado en múltiples características
             descriptor = self._generate_descriptor(face_roi, face_info['landmarks'])
             
-            return {
-                'descriptor': descriptor,
-                'bbox': face_info['bbox'],
-                'confidence': confidence,
-                'landmarks': face_info['landmarks']
-            }
+            return self._descriptor_data(descriptor, face_info, confidence)
             
         except Exception as e:
             logger.error(f"Error al extraer descriptor facial: {e}")
@@ -161,7 +416,7 @@ class FacialRecognitionSystem:
     
     def _generate_descriptor(self, face_roi, landmarks):
         """
-        Genera un descriptor robusto combinando múltiples características
+        Genera el descriptor facial de una ROI normalizada (ver FaceDescriptorExtractor.extract)
         
         Args:
             face_roi: Región del rostro normalizada
@@ -170,52 +425,7 @@ class FacialRecognitionSystem:
         Returns:
             list: Descriptor facial normalizado
         """
-        # Convertir a escala de grises
-        gray = cv2.cvtColor(face_roi, cv2.COLOR_BGR2GRAY)
-        
-        # 1. Histograma de LBP (Local Binary Patterns)
-        lbp = self._compute_lbp(gray)
-        hist_lbp = cv2.calcHist([lbp], [0], None, [256], [0, 256])
-        hist_lbp = hist_lbp.flatten() / (hist_lbp.sum() + 1e-7)
-        
-        # 2. Histograma de gradientes orientados (HOG simplificado)
-        gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
-        gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
-        mag, ang = cv2.cartToPolar(gx, gy)
-        hist_hog = cv2.calcHist([ang], [0], None, [18], [0, 2*np.pi])
-        hist_hog = hist_hog.flatten() / (hist_hog.sum() + 1e-7)
-        
-        # 3. Características de textura (Gabor simplificado con diferentes escalas)
-        gabor_features = []
-        for theta in [0, np.pi/4, np.pi/2, 3*np.pi/4]:
-            kernel = cv2.getGaborKernel((21, 21), 5, theta, 10, 0.5, 0)
-            filtered = cv2.filter2D(gray, cv2.CV_32F, kernel)
-            gabor_features.extend([filtered.mean(), filtered.std()])
-        gabor_features = np.array(gabor_features)
-        gabor_features = gabor_features / (np.linalg.norm(gabor_features) + 1e-7)
-        
-        # 4. Características geométricas de landmarks
-        if landmarks and len(landmarks) >= 5:
-            landmarks_arr = np.array(landmarks, dtype=np.float32)
-            # Normalizar landmarks relativos al centro
-            center = landmarks_arr.mean(axis=0)
-            landmarks_norm = (landmarks_arr - center) / (np.linalg.norm(landmarks_arr - center) + 1e-7)
-            geometric_features = landmarks_norm.flatten()
-        else:
-            geometric_features = np.zeros(10)
-        
-        # Combinar todas las características
-        descriptor = np.concatenate([
-            hist_lbp[:64],  # 64 bins del LBP
-            hist_hog,       # 18 bins del HOG
-            gabor_features, # 8 características Gabor
-            geometric_features  # 10 características geométricas
-        ])
-        
-        # Normalizar descriptor final
-        descriptor = descriptor / (np.linalg.norm(descriptor) + 1e-7)
-        
-        return descriptor.tolist()
+        return self.descriptor_extractor.extract(face_roi, landmarks)
     
     def _compute_lbp(self, gray_image):
         """
@@ -227,24 +437,16 @@ class FacialRecognitionSystem:
         Returns:
             numpy.ndarray: Imagen con patrones LBP
         """
-        h, w = gray_image.shape
-        lbp = np.zeros_like(gray_image)
-        
-        for i in range(1, h-1):
-            for j in range(1, w-1):
-                center = gray_image[i, j]
-                code = 0
-                code |= (gray_image[i-1, j-1] >= center) << 7
-                code |= (gray_image[i-1, j] >= center) << 6
-                code |= (gray_image[i-1, j+1] >= center) << 5
-                code |= (gray_image[i, j+1] >= center) << 4
-                code |= (gray_image[i+1, j+1] >= center) << 3
-                code |= (gray_image[i+1, j] >= center) << 2
-                code |= (gray_image[i+1, j-1] >= center) << 1
-                code |= (gray_image[i, j-1] >= center) << 0
-                lbp[i, j] = code
+        return self.descriptor_extractor.compute_lbp(gray_image)
+    
+    def is_compatible(self, descriptor_data):
+        """
+        Indica si un descriptor almacenado se generó con la misma variante de LBP
         
-        return lbp
+        Args:
+            descriptor_data: Diccionario deserializado (sin clave 'lbp' = clásico)
+        """
+        return descriptor_data.get('lbp', 'clasico') == self.lbp_modo
     
     def compare_faces(self, descriptor1, descriptor2):
         """
@@ -343,5 +545,5 @@ class FacialRecognitionSystem:
         return json.loads(descriptor_json)
 
 
-# Instancia global del sistema de reconocimiento
-facial_system = FacialRecognitionSystem()
+# Instancia global del sistema de reconocimiento: YuNet se carga en el primer uso, no al importar
+facial_system = diferido('detector_facial', FacialRecognitionSystem)
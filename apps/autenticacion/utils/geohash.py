@@ -0,0 +1,126 @@
+"""
+Geohash en Python puro para búsquedas por cercanía sin extensiones GIS.
+
+Cada ubicación se guarda con su geohash (cadena base32 donde un prefijo común
+indica la misma celda de la grilla). Para encontrar los puntos a menos de
+`radio_km` de un centro basta con consultar por prefijo las pocas celdas que
+cubren la caja envolvente del círculo, con la precisión más fina que mantiene
+acotada la cantidad de celdas; la distancia exacta (haversine) se comprueba
+después solo sobre esos candidatos.
+"""
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION_MAXIMA = 12
+RADIO_TIERRA_KM = 6371.0088
+KM_POR_GRADO = math.pi * RADIO_TIERRA_KM / 180
+# Máximo de prefijos por consulta de cercanía
+MAX_CELDAS = 16
+
+
+def codificar(latitud, longitud, precision=PRECISION_MAXIMA):
+    """
+    Geohash de una coordenada
+
+    Args:
+        latitud: Grados en [-90, 90]
+        longitud: Grados en [-180, 180]
+        precision: Caracteres del geohash (1 a 12)
+
+    Returns:
+        str: Geohash
+    """
+    lat_min, lat_max = -90.0, 90.0
+    lon_min, lon_max = -180.0, 180.0
+    caracteres = []
+    bits = 0
+    valor = 0
+    par = True  # Los bits alternan longitud (pares) y latitud (impares)
+    while len(caracteres) < precision:
+        if par:
+            medio = (lon_min + lon_max) / 2
+            if longitud >= medio:
+                valor = (valor << 1) | 1
+                lon_min = medio
+            else:
+                valor <<= 1
+                lon_max = medio
+        else:
+            medio = (lat_min + lat_max) / 2
+            if latitud >= medio:
+                valor = (valor << 1) | 1
+                lat_min = medio
+            else:
+                valor <<= 1
+                lat_max = medio
+        par = not par
+        bits += 1
+        if bits == 5:
+            caracteres.append(BASE32[valor])
+            bits = 0
+            valor = 0
+    return ''.join(caracteres)
+
+
+def dimensiones_celda(precision):
+    """Alto y ancho en grados de una celda de `precision` caracteres"""
+    bits = 5 * precision
+    bits_latitud = bits // 2
+    bits_longitud = bits - bits_latitud
+    return 180.0 / (2 ** bits_latitud), 360.0 / (2 ** bits_longitud)
+
+
+def celdas_cercanas(latitud, longitud, radio_km, max_celdas=MAX_CELDAS):
+    """
+    Prefijos de geohash que cubren el círculo de `radio_km` alrededor del punto
+
+    Se usa la precisión más fina con la que la caja envolvente del círculo
+    queda cubierta por a lo sumo `max_celdas` celdas (cada celda es una
+    condición LIKE 'prefijo%' en la consulta).
+
+    Returns:
+        list: Geohashes de las celdas (sin repetidos), o [''] si el radio es tan
+        grande que abarca todo el mapa
+    """
+    lat_min, lat_max, lon_min, lon_max = caja_envolvente(latitud, longitud, radio_km)
+    for precision in range(PRECISION_MAXIMA, 0, -1):
+        alto, ancho = dimensiones_celda(precision)
+        filas = math.ceil((lat_max - lat_min) / alto) + 1
+        columnas = math.ceil((lon_max - lon_min) / ancho) + 1
+        if filas * columnas <= max_celdas:
+            break
+    else:
+        return ['']
+
+    # Recorrer la caja en pasos de una celda (más el borde final) toca todas las celdas que la cubren
+    latitudes = [min(lat_min + k * alto, lat_max) for k in range(filas)] + [lat_max]
+    longitudes = [min(lon_min + k * ancho, lon_max) for k in range(columnas)] + [lon_max]
+    celdas = []
+    for lat in latitudes:
+        for lon in longitudes:
+            celda = codificar(lat, lon, precision)
+            if celda not in celdas:
+                celdas.append(celda)
+    return celdas
+
+
+def caja_envolvente(latitud, longitud, radio_km):
+    """(lat_min, lat_max, lon_min, lon_max) del círculo; sin acotar la longitud cerca de los polos o del antimeridiano"""
+    d_lat = radio_km / KM_POR_GRADO
+    lat_min, lat_max = max(-90.0, latitud - d_lat), min(90.0, latitud + d_lat)
+    coseno = math.cos(math.radians(max(abs(lat_min), abs(lat_max))))
+    if coseno < 1e-6:
+        return lat_min, lat_max, -180.0, 180.0
+    d_lon = radio_km / (KM_POR_GRADO * coseno)
+    if longitud - d_lon < -180 or longitud + d_lon > 180:
+        return lat_min, lat_max, -180.0, 180.0
+    return lat_min, lat_max, longitud - d_lon, longitud + d_lon
+
+
+def distancia_km(lat1, lon1, lat2, lon2):
+    """Distancia haversine en kilómetros"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * math.asin(min(1.0, math.sqrt(a)))
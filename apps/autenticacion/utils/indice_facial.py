@@ -0,0 +1,123 @@
+"""
+Índice en memoria de los descriptores faciales habilitados para login.
+
+En lugar de recorrer UserFaceEmbedding y deserializar cada descriptor en cada
+intento de login, se mantiene una matriz float32 (N x 100) con sus normas
+precalculadas y el login se resuelve con un único producto matriz-vector.
+
+La matriz se invalida al guardar o eliminar un UserFaceEmbedding (ver
+apps.autenticacion.signals) y, para los demás procesos del servidor, cuando
+cambia la huella (conteo, última actualización) de los descriptores activos.
+"""
+import json
+import logging
+import threading
+
+import numpy as np
+from django.db.models import Count, Max
+
+logger = logging.getLogger(__name__)
+
+
+class IndiceFacial:
+    """Matriz de descriptores faciales con búsqueda coseno top-1"""
+
+    # Longitud del descriptor de FacialRecognitionSystem._generate_descriptor
+    DIMENSION = 100
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (ids de UserFaceEmbedding, matriz N x DIMENSION, normas); se reemplaza completa
+        self._datos = (
+            np.empty(0, dtype=np.int64),
+            np.empty((0, self.DIMENSION), dtype=np.float32),
+            np.empty(0, dtype=np.float32),
+        )
+        self._huella = None
+        self._valido = False
+        # Aumenta con cada invalidación para descartar construcciones ya desactualizadas
+        self._generacion = 0
+
+    def _queryset(self):
+        from ..models import UserFaceEmbedding
+        return UserFaceEmbedding.objects.filter(is_active=True, allow_login=True)
+
+    def _huella_bd(self):
+        estado = self._queryset().aggregate(total=Count('id'), ultima=Max('updated_at'))
+        return estado['total'], estado['ultima']
+
+    def invalidar(self):
+        """Fuerza la reconstrucción en la próxima búsqueda"""
+        with self._lock:
+            self._generacion += 1
+            self._valido = False
+
+    def sincronizar(self):
+        """Reconstruye la matriz si fue invalidada o si la base de datos cambió"""
+        huella = self._huella_bd()
+        with self._lock:
+            if self._valido and huella == self._huella:
+                return
+            generacion = self._generacion
+            datos = self._construir()
+            self._datos = datos
+            self._huella = huella
+            self._valido = generacion == self._generacion
+
+    def _construir(self):
+        from .facial_recognition import facial_system
+
+        ids, filas = [], []
+        for embedding_id, descriptor_data in self._queryset().values_list('id', 'descriptor_data').iterator():
+            try:
+                datos = json.loads(descriptor_data)
+                descriptor = datos['descriptor']
+            except (ValueError, KeyError, TypeError) as e:
+                logger.error(f"Descriptor facial {embedding_id} ilegible: {e}")
+                continue
+            if not facial_system.is_compatible(datos):
+                logger.warning(f"Descriptor facial {embedding_id} generado con otra variante de LBP; debe registrarse de nuevo")
+                continue
+            if len(descriptor) != self.DIMENSION:
+                logger.warning(f"Descriptor facial {embedding_id} con dimensión {len(descriptor)}; se omite")
+                continue
+            ids.append(embedding_id)
+            filas.append(descriptor)
+
+        matriz = np.asarray(filas, dtype=np.float32).reshape(-1, self.DIMENSION)
+        normas = np.linalg.norm(matriz, axis=1)
+        logger.info(f"Índice facial construido con {len(ids)} descriptores")
+        return np.asarray(ids, dtype=np.int64), matriz, normas
+
+    def buscar(self, descriptor, umbral):
+        """
+        Busca el descriptor almacenado más similar (similitud coseno).
+
+        Args:
+            descriptor: Descriptor capturado (lista de DIMENSION valores)
+            umbral: Similitud mínima para considerar coincidencia
+
+        Returns:
+            tuple: (id de UserFaceEmbedding o None si no alcanza el umbral, mejor similitud)
+        """
+        self.sincronizar()
+        ids, matriz, normas = self._datos
+        if not ids.size:
+            return None, 0.0
+
+        consulta = np.asarray(descriptor, dtype=np.float32)
+        # Misma fórmula que FacialRecognitionSystem.compare_faces
+        similitudes = matriz @ consulta / (normas * np.linalg.norm(consulta) + 1e-7)
+        mejor = int(np.argmax(similitudes))
+        similitud = float(similitudes[mejor])
+        if similitud >= umbral:
+            return int(ids[mejor]), similitud
+        return None, similitud
+
+
+_indice = IndiceFacial()
+
+
+def get_indice_facial():
+    """Obtiene el índice facial del proceso"""
+    return _indice
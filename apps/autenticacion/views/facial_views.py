@@ -16,6 +16,7 @@ import logging
 
 from apps.autenticacion.models import User, UserFaceEmbedding
 from apps.autenticacion.utils.facial_recognition import facial_system
+from apps.autenticacion.utils.indice_facial import get_indice_facial
 
 logger = logging.getLogger(__name__)
 
@@ -194,36 +195,18 @@ class VerifyFacialLoginView(View):
                     'message': 'No se detectó ningún rostro. Por favor, intenta nuevamente.'
                 })
             
-            # Buscar coincidencia en la base de datos
+            # Buscar coincidencia: un único producto contra la matriz de descriptores activos
             best_match = None
-            best_similarity = 0.0
-            
-            # Obtener todos los usuarios con biometría activa
-            active_embeddings = UserFaceEmbedding.objects.filter(
-                is_active=True,
-                allow_login=True
-            ).select_related('user')
-            
-            for embedding in active_embeddings:
-                try:
-                    # Deserializar descriptor almacenado
-                    stored_descriptor = facial_system.deserialize_descriptor(
-                        embedding.descriptor_data
-                    )
-                    
-                    # Comparar rostros
-                    similarity, is_match = facial_system.compare_faces(
-                        captured_descriptor['descriptor'],
-                        stored_descriptor['descriptor']
-                    )
-                    
-                    if is_match and similarity > best_similarity:
-                        best_similarity = similarity
-                        best_match = embedding
-                        
-                except Exception as e:
-                    logger.error(f"Error al comparar con usuario {embedding.user.username}: {e}")
-                    continue
+            best_match_id, best_similarity = get_indice_facial().buscar(
+                captured_descriptor['descriptor'],
+                facial_system.SIMILARITY_THRESHOLD
+            )
+            if best_match_id is not None:
+                best_match = UserFaceEmbedding.objects.select_related('user').filter(
+                    id=best_match_id,
+                    is_active=True,
+                    allow_login=True
+                ).first()
             
             if best_match:
                 # Autenticar al usuario
@@ -240,7 +223,8 @@ class VerifyFacialLoginView(View):
                 best_match.successful_logins += 1
                 best_match.last_successful_login = timezone.now()
                 best_match.failed_attempts = 0
-                best_match.save()
+                # Solo estadísticas: no invalida el índice facial
+                best_match.save(update_fields=['successful_logins', 'last_successful_login', 'failed_attempts'])
                 
                 # Iniciar sesión
                 login(request, user, backend='django.contrib.auth.backends.ModelBackend')
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
-from apps.mascota.models import Mascota, ImagenMascota, ModeloGlobal, EmbeddingStore, RegistroReconocimiento
+from apps.mascota.models import Mascota, ImagenMascota, ModeloGlobal, EmbeddingStore, RegistroReconocimiento, TrabajoBiometrico, EnvioMasivo, NotificacionSaliente
 
 # Registro de modelos para el panel administrativo
 
@@ -144,3 +144,32 @@ class RegistroReconocimientoAdmin(admin.ModelAdmin):
     mascota_predicha_nombre.short_description = 'Mascota'
     confianza_percent.short_description = 'Confianza'
     preview_imagen.short_description = 'Imagen'
+
+
+@admin.register(TrabajoBiometrico)
+class TrabajoBiometricoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'imagen', 'mascota', 'estado', 'intentos', 'proximo_intento', 'finalizado')
+    list_filter = ('estado', 'creado')
+    search_fields = ('mascota__nombre',)
+    readonly_fields = ('creado', 'actualizado', 'iniciado', 'finalizado', 'ultimo_error')
+
+
+@admin.register(EnvioMasivo)
+class EnvioMasivoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tipo', 'mascota', 'estado', 'progreso_percent', 'enviados', 'fallidos', 'total_destinatarios', 'creado')
+    list_filter = ('estado', 'tipo', 'creado')
+    search_fields = ('mascota__nombre', 'asunto')
+    readonly_fields = ('creado', 'actualizado', 'iniciado', 'finalizado', 'ultimo_error', 'enviados', 'fallidos', 'ultimo_usuario_id')
+    exclude = ('mensaje_html',)
+    
+    def progreso_percent(self, obj):
+        return f"{obj.progreso:.0f}%"
+    progreso_percent.short_description = 'Progreso'
+
+
+@admin.register(NotificacionSaliente)
+class NotificacionSalienteAdmin(admin.ModelAdmin):
+    list_display = ('id', 'evento', 'mascota', 'destinatario', 'estado', 'coalescidos', 'intentos', 'proximo_intento', 'enviado_en')
+    list_filter = ('estado', 'evento', 'creado')
+    search_fields = ('mascota__nombre', 'destinatario')
+    readonly_fields = ('clave_deduplicacion', 'coalescidos', 'creado', 'actualizado', 'iniciado', 'enviado_en', 'ultimo_error')
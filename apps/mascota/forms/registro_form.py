@@ -2,7 +2,7 @@
 from django import forms
 from django.core.exceptions import ValidationError
 from apps.mascota.models import Mascota
-from apps.mascota.services.ai_predictor import predictor
+from apps.mascota.services import clases_ia
 
 
 class MascotaRegistroForm(forms.ModelForm):
@@ -98,7 +98,8 @@ class MascotaRegistroForm(forms.ModelForm):
         self.fields['nombre'].required = True
         
         # Personalizar choices para etapa_vida usando las del modelo de IA
-        ai_stage_choices = predictor.get_stage_choices_for_django()
+        # (clases_ia no importa torch; el predictor solo se importa al predecir)
+        ai_stage_choices = clases_ia.get_stage_choices_for_django()
         # Agregar opción vacía al inicio
         stage_choices = [('', 'Seleccionar etapa de vida')] + ai_stage_choices
         self.fields['etapa_vida'].choices = stage_choices
@@ -148,6 +149,7 @@ class MascotaRegistroForm(forms.ModelForm):
         
         try:
             # Usar el predictor para obtener las predicciones
+            from apps.mascota.services.ai_predictor import predictor
             predictions = predictor.predict_from_image_file(foto)
             
             if predictions['success']:
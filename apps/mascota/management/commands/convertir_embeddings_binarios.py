@@ -0,0 +1,88 @@
+# apps/mascota/management/commands/convertir_embeddings_binarios.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.mascota.models import EmbeddingStore
+from apps.mascota.services.vector_codec import codificar_vector
+
+
+class Command(BaseCommand):
+    help = (
+        "Convierte los embeddings guardados como lista JSON al formato binario "
+        "(vector_binario) y libera la columna JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dtype',
+            choices=['float32', 'float16'],
+            default=None,
+            help="Tipo de dato de destino (por defecto settings.BIOMETRIA_EMBEDDING_DTYPE)",
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=500,
+            help="Cantidad de filas convertidas por transacción",
+        )
+        parser.add_argument(
+            '--conservar-json',
+            action='store_true',
+            help="No vaciar la columna JSON después de convertir",
+        )
+
+    def handle(self, *args, **options):
+        dtype = options['dtype'] or getattr(settings, 'BIOMETRIA_EMBEDDING_DTYPE', 'float32')
+        lote = options['lote']
+        if lote <= 0:
+            raise CommandError("--lote debe ser mayor que 0")
+
+        pendientes = EmbeddingStore.objects.filter(
+            vector_binario__isnull=True,
+            vector__isnull=False,
+        ).order_by('id')
+
+        total = pendientes.count()
+        if not total:
+            self.stdout.write("No hay embeddings pendientes de conversión")
+            return
+
+        self.stdout.write(f"Convirtiendo {total} embeddings a {dtype}...")
+
+        campos = ['vector_binario', 'dimension']
+        if not options['conservar_json']:
+            campos.append('vector')
+
+        ultimo_id = 0
+        convertidos = 0
+        invalidos = 0
+        while True:
+            filas = list(
+                pendientes.filter(id__gt=ultimo_id).only('id', 'vector', 'dimension')[:lote]
+            )
+            if not filas:
+                break
+            ultimo_id = filas[-1].id
+
+            actualizar = []
+            for emb in filas:
+                if not isinstance(emb.vector, list) or not emb.vector:
+                    invalidos += 1
+                    self.stderr.write(f"Embedding {emb.id}: vector JSON vacío o inválido, se omite")
+                    continue
+                emb.vector_binario = codificar_vector(emb.vector, dtype=dtype)
+                emb.dimension = len(emb.vector)
+                if not options['conservar_json']:
+                    emb.vector = None
+                actualizar.append(emb)
+
+            with transaction.atomic():
+                EmbeddingStore.objects.bulk_update(actualizar, campos)
+
+            convertidos += len(actualizar)
+            self.stdout.write(f"  {convertidos}/{total}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Conversión completada: {convertidos} convertidos, {invalidos} omitidos"
+        ))
@@ -0,0 +1,109 @@
+# apps/mascota/management/commands/destilar_condicion_corporal.py
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.mascota.models import ImagenMascota
+from apps.mascota.services.destilacion_condicion import (
+    DEPS_INSTALLED,
+    destilar_cabeza_condicion,
+    guardar_cabeza,
+)
+from apps.mascota.services.imagen_decodificada import ImagenDecodificada
+
+EXTENSIONES_IMAGEN = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+
+class Command(BaseCommand):
+    help = (
+        "Destila el modelo de condición corporal (resnet50) en una cabeza sobre el tronco "
+        "resnet18 multitarea, de modo que raza, etapa de vida y condición corporal se "
+        "predigan con un solo backbone (IA_PREDICTOR_FUSIONADO=True)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--directorio',
+            default=None,
+            help="Directorio de imágenes de perros (por defecto las imágenes almacenadas de las mascotas)",
+        )
+        parser.add_argument('--imagenes', type=int, default=1000, help="Máximo de imágenes usadas")
+        parser.add_argument('--epocas', type=int, default=40, help="Épocas de entrenamiento de la cabeza")
+        parser.add_argument('--temperatura', type=float, default=2.0, help="Temperatura de la destilación")
+        parser.add_argument(
+            '--coincidencia-minima',
+            type=float,
+            default=0.9,
+            help="Coincidencia mínima con el modelo de condición corporal en las imágenes apartadas",
+        )
+        parser.add_argument(
+            '--forzar',
+            action='store_true',
+            help="Guardar la cabeza aunque no alcance la coincidencia mínima",
+        )
+
+    def handle(self, *args, **options):
+        if not DEPS_INSTALLED:
+            raise CommandError("Faltan dependencias del predictor (torch, torchvision)")
+        from apps.mascota.services.ai_predictor import AIPredictor
+
+        # Maestro y tronco en eager, cada uno desde su checkpoint .pth
+        predictor = AIPredictor(modo='eager', fusionado=False)
+        if predictor.multitask_model is None or predictor.body_condition_model is None:
+            raise CommandError("Se necesitan ambos checkpoints .pth en models/ para destilar")
+
+        tensores = self._cargar_tensores(predictor, options['directorio'], options['imagenes'])
+        if len(tensores) < 10:
+            raise CommandError(f"Se necesitan al menos 10 imágenes y solo hay {len(tensores)}")
+        self.stdout.write(f"Destilando sobre {len(tensores)} imágenes (y sus reflejos)...")
+
+        inicio = time.time()
+        cabeza, metricas = destilar_cabeza_condicion(
+            predictor,
+            tensores,
+            epocas=options['epocas'],
+            temperatura=options['temperatura'],
+        )
+        self.stdout.write(
+            f"Coincidencia con el modelo de condición corporal: {metricas['coincidencia']:.1%} "
+            f"(|Δp| medio {metricas['delta_prob_medio']:.3f}, "
+            f"{metricas['imagenes_validacion']} imágenes apartadas, {time.time() - inicio:.1f}s)"
+        )
+        if metricas['coincidencia'] < options['coincidencia_minima'] and not options['forzar']:
+            raise CommandError(
+                f"La coincidencia {metricas['coincidencia']:.1%} es menor que "
+                f"{options['coincidencia_minima']:.0%}; no se guardó la cabeza (usa --forzar para guardarla)"
+            )
+
+        guardar_cabeza(cabeza, metricas, predictor.fused_model_path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Cabeza destilada guardada en {predictor.fused_model_path}. "
+            "Actívala con IA_PREDICTOR_FUSIONADO=True y compárala con "
+            "manage.py optimizar_predictor --fusionado."
+        ))
+
+    def _cargar_tensores(self, predictor, directorio, limite):
+        if directorio:
+            if not os.path.isdir(directorio):
+                raise CommandError(f"No existe el directorio {directorio}")
+            fuentes = [
+                os.path.join(directorio, n)
+                for n in sorted(os.listdir(directorio))
+                if n.lower().endswith(EXTENSIONES_IMAGEN)
+            ][:limite]
+        else:
+            fuentes = [
+                imagen.imagen
+                for imagen in ImagenMascota.objects.only('id', 'imagen').order_by('-id')[:limite]
+            ]
+
+        tensores = []
+        for fuente in fuentes:
+            try:
+                imagen = ImagenDecodificada.desde_archivo(fuente)
+                tensor = imagen.preprocesado(predictor.CLAVE_PREPROCESADO, predictor.transform)
+                tensores.append(tensor.unsqueeze(0))
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f"{getattr(fuente, 'name', fuente)} omitida: {e}"))
+        return tensores
@@ -0,0 +1,156 @@
+# apps/mascota/management/commands/exportar_extractor.py
+import time
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.mascota.models import ImagenMascota, ModeloGlobal
+from apps.mascota.services.biometria import DEPS_INSTALLED, BiometriaService
+from apps.mascota.services.exportacion_extractor import (
+    EXTENSIONES,
+    FORMATO_ONNX,
+    FORMATO_TORCHSCRIPT,
+    ExtractorExportado,
+    exportar_onnx,
+    exportar_torchscript,
+    verificar_paridad,
+)
+from apps.mascota.services.imagen_decodificada import ImagenDecodificada
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta el extractor de características del ModeloGlobal a TorchScript u ONNX "
+        "(opcionalmente int8 dinámico; requiere onnxruntime), verifica la paridad de los "
+        "embeddings contra el extractor eager y lo guarda en vectorizer_file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--version',
+            type=int,
+            default=None,
+            help="Versión de ModeloGlobal (por defecto el modelo activo)",
+        )
+        parser.add_argument(
+            '--formato',
+            choices=[FORMATO_TORCHSCRIPT, FORMATO_ONNX],
+            default=FORMATO_ONNX,
+            help="Formato del artefacto",
+        )
+        parser.add_argument(
+            '--int8',
+            action='store_true',
+            help="Cuantización dinámica int8 (solo ONNX)",
+        )
+        parser.add_argument(
+            '--imagenes',
+            type=int,
+            default=32,
+            help="Imágenes biométricas almacenadas usadas en la verificación de paridad",
+        )
+        parser.add_argument(
+            '--coseno-minimo',
+            type=float,
+            default=0.99,
+            help="Similitud coseno mínima exigida entre embeddings eager y exportados",
+        )
+        parser.add_argument(
+            '--forzar',
+            action='store_true',
+            help="Guardar el artefacto aunque no supere la verificación de paridad",
+        )
+
+    def handle(self, *args, **options):
+        if not DEPS_INSTALLED:
+            raise CommandError("Faltan dependencias de biometría (torch, torchvision)")
+
+        formato = options['formato']
+        int8 = options['int8']
+        if int8 and formato != FORMATO_ONNX:
+            # La cuantización dinámica de torch solo afecta a capas Linear/LSTM,
+            # que el extractor convolucional no tiene
+            raise CommandError("--int8 solo está disponible con --formato onnx")
+
+        if options['version'] is None:
+            modelo_global = ModeloGlobal.get_active_model()
+        else:
+            modelo_global = ModeloGlobal.objects.filter(version=options['version']).first()
+        if modelo_global is None:
+            raise CommandError("No se encontró el ModeloGlobal indicado")
+
+        extractor = modelo_global.extractor_caracteristicas
+        self.stdout.write(f"Exportando '{extractor}' de ModeloGlobal v{modelo_global.version} a {formato}{' int8' if int8 else ''}...")
+
+        # Servicio propio con el extractor eager (no el del registro, que podría usar uno exportado)
+        servicio = BiometriaService(modelo_extractor=extractor)
+        inicio = time.time()
+        if formato == FORMATO_TORCHSCRIPT:
+            contenido = exportar_torchscript(servicio)
+        else:
+            contenido = exportar_onnx(servicio, int8=int8)
+        self.stdout.write(f"Artefacto generado en {time.time() - inicio:.1f}s ({len(contenido) / 1e6:.1f} MB)")
+
+        exportado = ExtractorExportado(contenido, formato)
+        paridad = self._verificar_paridad(servicio, exportado, options['imagenes'])
+        if paridad is None:
+            self.stdout.write(self.style.WARNING("No hay imágenes biométricas para verificar la paridad"))
+        else:
+            self.stdout.write(
+                f"Paridad sobre {paridad['imagenes']} imágenes: coseno mínimo {paridad['coseno_minimo']:.5f}, "
+                f"medio {paridad['coseno_medio']:.5f}, p5 {paridad['coseno_p5']:.5f} "
+                f"(eager {paridad['ms_eager']:.1f} ms/img, exportado {paridad['ms_exportado']:.1f} ms/img)"
+            )
+            if paridad['coseno_minimo'] < options['coseno_minimo'] and not options['forzar']:
+                raise CommandError(
+                    f"El coseno mínimo {paridad['coseno_minimo']:.5f} es menor que "
+                    f"{options['coseno_minimo']}; el artefacto no se guardó (usa --forzar para guardarlo)"
+                )
+
+        nombre = f"extractor_{extractor}_v{modelo_global.version}{'_int8' if int8 else ''}.{EXTENSIONES[formato]}"
+        if modelo_global.vectorizer_file:
+            # Reemplaza el artefacto exportado anteriormente para esta versión
+            modelo_global.vectorizer_file.delete(save=False)
+        modelo_global.vectorizer_file.save(nombre, ContentFile(contenido), save=False)
+        metricas = dict(modelo_global.metricas or {})
+        metricas['extractor_exportado'] = {
+            'formato': formato,
+            'int8': int8,
+            'archivo': modelo_global.vectorizer_file.name,
+            'paridad': paridad,
+            'exportado': timezone.now().isoformat(),
+        }
+        modelo_global.metricas = metricas
+        modelo_global.save(update_fields=['vectorizer_file', 'metricas', 'updated_at'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Extractor exportado guardado en {modelo_global.vectorizer_file.name}. "
+            "Actívalo con BIOMETRIA_EXTRACTOR_EXPORTADO=True."
+        ))
+
+    def _verificar_paridad(self, servicio, exportado, cantidad):
+        imagenes = []
+        consulta = (
+            ImagenMascota.objects
+            .filter(is_biometrica=True, procesada=True)
+            .order_by('-id')[:cantidad]
+        )
+        for imagen in consulta:
+            try:
+                imagenes.append(servicio.procesar_imagen(ImagenDecodificada.desde_archivo(imagen.imagen)))
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f"Imagen {imagen.id} omitida: {e}"))
+        if not imagenes:
+            return None
+
+        paridad = verificar_paridad(servicio, exportado, imagenes)
+
+        # Latencia por imagen de cada extractor sobre el mismo lote
+        for clave, extractor in (('ms_eager', None), ('ms_exportado', exportado)):
+            servicio.extractor_exportado = extractor
+            inicio = time.perf_counter()
+            servicio.extraer_embeddings_batch(imagenes)
+            paridad[clave] = (time.perf_counter() - inicio) * 1000 / len(imagenes)
+        servicio.extractor_exportado = None
+        return paridad
@@ -0,0 +1,145 @@
+# apps/mascota/management/commands/medir_alertas_geograficas.py
+import bisect
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.autenticacion.utils import geohash
+from apps.mascota.models import EnvioMasivo, Mascota
+from apps.mascota.services import envios_masivos
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark del alcance de las alertas de mascota perdida: costo de elegir "
+        "destinatarios recorriendo todos los usuarios frente al índice de geohash. "
+        "Por defecto usa usuarios sintéticos en memoria; con --bd mide las consultas "
+        "reales sobre las mascotas perdidas con coordenadas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--usuarios',
+            default='1000,10000,100000',
+            help="Tamaños de población sintética separados por comas",
+        )
+        parser.add_argument('--alertas', type=int, default=50, help="Alertas simuladas por tamaño")
+        parser.add_argument(
+            '--radio',
+            type=float,
+            default=getattr(settings, 'ALERTAS_RADIO_KM', 5.0),
+            help="Radio de la alerta en km (por defecto ALERTAS_RADIO_KM)",
+        )
+        parser.add_argument(
+            '--extension',
+            type=float,
+            default=100.0,
+            help="Lado en km de la región donde se reparten los usuarios sintéticos",
+        )
+        parser.add_argument('--centro', default='-2.1894,-79.8891', help="Centro de la región 'lat,lon'")
+        parser.add_argument('--bd', action='store_true', help="Medir sobre la base de datos en lugar de datos sintéticos")
+
+    def handle(self, *args, **options):
+        if options['radio'] <= 0:
+            raise CommandError("--radio debe ser mayor que 0")
+        if options['bd']:
+            self._medir_bd(options['radio'])
+        else:
+            self._medir_sintetico(options)
+
+    def _medir_sintetico(self, options):
+        try:
+            lat0, lon0 = (float(v) for v in options['centro'].split(','))
+            tamanos = [int(v) for v in options['usuarios'].split(',') if v.strip()]
+        except ValueError:
+            raise CommandError("--centro debe ser 'lat,lon' y --usuarios una lista de enteros")
+
+        radio = options['radio']
+        mitad_lat = options['extension'] / 2 / geohash.KM_POR_GRADO
+        mitad_lon = mitad_lat / max(math.cos(math.radians(lat0)), 1e-6)
+        rng = random.Random(0)
+        self.stdout.write(
+            f"Radio {radio:g} km, región de {options['extension']:g} km, {options['alertas']} alertas por tamaño "
+            f"(celdas de geohash de {len(geohash.celdas_cercanas(lat0, lon0, radio)[0])} caracteres)"
+        )
+
+        for total in tamanos:
+            puntos = [
+                (lat0 + rng.uniform(-mitad_lat, mitad_lat), lon0 + rng.uniform(-mitad_lon, mitad_lon))
+                for _ in range(total)
+            ]
+            # Equivalente en memoria del índice B-tree sobre User.home_geohash
+            indice = sorted((geohash.codificar(lat, lon), i) for i, (lat, lon) in enumerate(puntos))
+            claves = [clave for clave, _ in indice]
+            alertas = [puntos[rng.randrange(total)] for _ in range(options['alertas'])]
+
+            inicio = time.perf_counter()
+            esperados = []
+            for lat, lon in alertas:
+                esperados.append({
+                    i for i, (la, lo) in enumerate(puntos) if geohash.distancia_km(lat, lon, la, lo) <= radio
+                })
+            ms_todos = (time.perf_counter() - inicio) * 1000 / len(alertas)
+
+            inicio = time.perf_counter()
+            revisados = 0
+            obtenidos = []
+            for lat, lon in alertas:
+                cercanos = set()
+                lat_min, lat_max, lon_min, lon_max = geohash.caja_envolvente(lat, lon, radio)
+                for celda in geohash.celdas_cercanas(lat, lon, radio):
+                    desde = bisect.bisect_left(claves, celda)
+                    hasta = bisect.bisect_left(claves, celda + '~')
+                    for _, i in indice[desde:hasta]:
+                        revisados += 1
+                        la, lo = puntos[i]
+                        # Como la consulta: caja envolvente y después distancia exacta
+                        if lat_min <= la <= lat_max and lon_min <= lo <= lon_max \
+                                and geohash.distancia_km(lat, lon, la, lo) <= radio:
+                            cercanos.add(i)
+                obtenidos.append(cercanos)
+            ms_geo = (time.perf_counter() - inicio) * 1000 / len(alertas)
+
+            if obtenidos != esperados:
+                raise CommandError(f"El índice de geohash no coincide con el recorrido completo ({total} usuarios)")
+            destinatarios = sum(len(c) for c in obtenidos) / len(alertas)
+            self.stdout.write(
+                f"{total:>8} usuarios: todos {ms_todos:8.2f} ms/alerta ({total} revisados) | "
+                f"geohash {ms_geo:6.2f} ms/alerta ({revisados / len(alertas):.0f} revisados, "
+                f"{destinatarios:.0f} destinatarios)"
+            )
+
+    def _medir_bd(self, radio):
+        mascotas = list(
+            Mascota.objects
+            .filter(latitud_perdida__isnull=False, longitud_perdida__isnull=False)
+            .select_related('propietario')
+            .order_by('-updated_at')[:20]
+        )
+        if not mascotas:
+            raise CommandError("No hay mascotas reportadas con coordenadas")
+
+        for mascota in mascotas:
+            global_ = EnvioMasivo(mascota=mascota)
+            inicio = time.perf_counter()
+            todos = sum(1 for _ in envios_masivos.iterar_destinatarios(global_))
+            ms_todos = (time.perf_counter() - inicio) * 1000
+
+            geografico = EnvioMasivo(
+                mascota=mascota,
+                latitud=mascota.latitud_perdida,
+                longitud=mascota.longitud_perdida,
+                radio_km=radio,
+            )
+            inicio = time.perf_counter()
+            candidatos = envios_masivos.destinatarios(geografico).count()
+            cercanos = sum(1 for _ in envios_masivos.iterar_destinatarios(geografico))
+            ms_geo = (time.perf_counter() - inicio) * 1000
+
+            self.stdout.write(
+                f"{mascota.nombre} ({mascota.id}): todos {todos} usuarios en {ms_todos:.1f} ms | "
+                f"geohash {candidatos} candidatos, {cercanos} destinatarios en {ms_geo:.1f} ms"
+            )
@@ -0,0 +1,63 @@
+# apps/mascota/management/commands/medir_urls_firmadas.py
+import time
+
+from django.core.files.storage import storages
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.autenticacion.models import User
+from apps.mascota.models import ImagenMascota, Mascota
+from apps.mascota.services.almacenamiento_azure import AzureStorageConCache
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la caché de URLs firmadas de Azure: genera las URLs de las fotos de "
+        "mascotas, imágenes biométricas y fotos de usuarios como lo hace un listado, "
+        "primero con la caché vacía y después repitiendo la página."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=200, help="Filas de cada modelo por página")
+        parser.add_argument('--repeticiones', type=int, default=5, help="Veces que se repite la página con la caché llena")
+
+    def handle(self, *args, **options):
+        # Misma instancia que usan los ImageField (default_storage)
+        storage = storages['default']
+        if not isinstance(storage, AzureStorageConCache):
+            raise CommandError(
+                'STORAGES["default"] no usa AzureStorageConCache '
+                '(apps.mascota.services.almacenamiento_azure.AzureStorageConCache)'
+            )
+
+        filas = options['filas']
+        campos = [
+            *(m.foto_perfil for m in Mascota.objects.exclude(foto_perfil='').exclude(foto_perfil__isnull=True)[:filas]),
+            *(i.imagen for i in ImagenMascota.objects.exclude(imagen='')[:filas]),
+            *(u.image for u in User.objects.exclude(image='').exclude(image__isnull=True)[:filas]),
+        ]
+        if not campos:
+            raise CommandError("No hay imágenes guardadas para generar URLs")
+
+        for nombre in {campo.name for campo in campos}:
+            storage.invalidar_url(nombre)
+        storage.reiniciar_estadisticas()
+
+        inicio = time.perf_counter()
+        for campo in campos:
+            campo.url
+        ms_fria = (time.perf_counter() - inicio) * 1000
+
+        inicio = time.perf_counter()
+        for _ in range(options['repeticiones']):
+            for campo in campos:
+                campo.url
+        ms_caliente = (time.perf_counter() - inicio) * 1000 / max(1, options['repeticiones'])
+
+        stats = storage.estadisticas()
+        self.stdout.write(f"{len(campos)} URLs por página ({len(set(c.name for c in campos))} blobs distintos)")
+        self.stdout.write(f"Caché vacía:  {ms_fria:8.2f} ms/página ({ms_fria / len(campos):.3f} ms/URL)")
+        self.stdout.write(f"Caché llena:  {ms_caliente:8.2f} ms/página ({ms_caliente / len(campos):.3f} ms/URL)")
+        self.stdout.write(
+            f"Aciertos {stats['aciertos']}, firmas {stats['fallos']} ({stats['tasa_aciertos']:.1%} de aciertos), "
+            f"{stats['ms_por_firma']:.3f} ms por firma, {stats['ms_ahorrados']:.1f} ms de firma ahorrados"
+        )
@@ -0,0 +1,202 @@
+# apps/mascota/management/commands/optimizar_predictor.py
+import os
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.mascota.models import Mascota
+from apps.mascota.services import optimizacion_predictor
+from apps.mascota.services.optimizacion_predictor import MODO_EAGER, MODO_INT8_ESTATICO, MODOS
+
+# Tareas del predictor: (clave, atributo de clases, campo de Mascota), en el orden de AIPredictor.forward_tensor
+TAREAS = (
+    ('raza', 'breed_classes', 'raza'),
+    ('etapa', 'stage_classes', 'etapa_vida'),
+    ('condicion', 'body_condition_classes', 'estado_corporal'),
+)
+EXTENSIONES_IMAGEN = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera la variante int8 estática de los modelos de AIPredictor y compara cada modo "
+        "(eager, torchscript, int8_dinamico, int8_estatico) contra los checkpoints .pth: "
+        "coincidencia con eager, precisión frente a los datos registrados y latencia por imagen."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--directorio',
+            default=None,
+            help="Directorio de imágenes (por defecto las fotos de perfil de las mascotas, con sus etiquetas)",
+        )
+        parser.add_argument('--imagenes', type=int, default=64, help="Máximo de imágenes evaluadas")
+        parser.add_argument('--modos', default=','.join(MODOS), help="Modos a comparar separados por comas")
+        parser.add_argument(
+            '--generar-int8',
+            action='store_true',
+            help="Calibra y guarda los artefactos int8 estáticos (<modelo>_int8.pt) antes de comparar",
+        )
+        parser.add_argument('--lote-calibracion', type=int, default=8, help="Imágenes por lote de calibración")
+        parser.add_argument(
+            '--fusionado',
+            action='store_true',
+            help="Evaluar (y generar int8) el modelo fusionado de tronco compartido en lugar de los dos modelos",
+        )
+
+    def handle(self, *args, **options):
+        if not optimizacion_predictor.DEPS_INSTALLED:
+            raise CommandError("Faltan dependencias del predictor (torch, torchvision)")
+        from apps.mascota.services.ai_predictor import AIPredictor
+
+        modos = [m.strip() for m in options['modos'].split(',') if m.strip()]
+        desconocidos = set(modos) - set(MODOS)
+        if desconocidos:
+            raise CommandError(f"Modos no soportados: {', '.join(sorted(desconocidos))}")
+        fusionado = options['fusionado']
+
+        # La referencia siempre son los dos checkpoints .pth en eager
+        base = AIPredictor(modo=MODO_EAGER, fusionado=False)
+        if base.multitask_model is None and base.body_condition_model is None:
+            raise CommandError("No se pudo cargar ningún checkpoint .pth desde models/")
+        origen = base
+        if fusionado:
+            origen = AIPredictor(modo=MODO_EAGER, fusionado=True)
+            if origen.fused_model is None:
+                raise CommandError("No hay modelo fusionado; genéralo con manage.py destilar_condicion_corporal")
+
+        muestras = self._cargar_muestras(options['directorio'], options['imagenes'])
+        if not muestras:
+            raise CommandError("No hay imágenes para evaluar")
+        tensores = [base.transform(imagen).unsqueeze(0) for imagen, _ in muestras]
+        self.stdout.write(f"{len(tensores)} imágenes cargadas")
+
+        if options['generar_int8']:
+            self._generar_int8(origen, tensores, options['lote_calibracion'])
+
+        etiquetas = [e for _, e in muestras]
+        referencia, latencias = self._inferir(base, tensores)
+        self._reportar('eager (.pth)', base, referencia, referencia, latencias, etiquetas)
+
+        for modo in modos:
+            if modo == MODO_EAGER and not fusionado:
+                continue
+            if modo == MODO_EAGER:
+                predictor = origen
+            else:
+                predictor = AIPredictor(modo=modo, fusionado=fusionado)
+            nombre = f"{modo}{' fusionado' if fusionado else ''}"
+            if predictor.modo != modo or (fusionado and predictor.fused_model is None):
+                self.stdout.write(self.style.WARNING(f"{nombre}: no disponible (ver log); se omite"))
+                continue
+
+            salidas, latencias = self._inferir(predictor, tensores)
+            self._reportar(nombre, predictor, salidas, referencia, latencias, etiquetas)
+
+        if options['generar_int8'] and MODO_INT8_ESTATICO in modos:
+            self.stdout.write(
+                "Nota: las métricas de int8_estatico incluyen las imágenes usadas en la calibración."
+            )
+
+    def _cargar_muestras(self, directorio, limite):
+        """Retorna [(imagen PIL, etiquetas por tarea o {})]"""
+        from PIL import Image
+
+        muestras = []
+        if directorio:
+            if not os.path.isdir(directorio):
+                raise CommandError(f"No existe el directorio {directorio}")
+            nombres = sorted(
+                n for n in os.listdir(directorio) if n.lower().endswith(EXTENSIONES_IMAGEN)
+            )[:limite]
+            for nombre in nombres:
+                try:
+                    muestras.append((Image.open(os.path.join(directorio, nombre)).convert('RGB'), {}))
+                except Exception as e:
+                    self.stdout.write(self.style.WARNING(f"{nombre} omitida: {e}"))
+            return muestras
+
+        consulta = (
+            Mascota.objects
+            .exclude(foto_perfil='').exclude(foto_perfil__isnull=True)
+            .only('id', 'foto_perfil', 'raza', 'etapa_vida', 'estado_corporal')
+            .order_by('-id')[:limite]
+        )
+        for mascota in consulta:
+            etiquetas = {
+                clave: (getattr(mascota, campo) or '').strip().lower()
+                for clave, _, campo in TAREAS
+            }
+            try:
+                with mascota.foto_perfil.open('rb') as f:
+                    muestras.append((Image.open(f).convert('RGB'), etiquetas))
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f"Mascota {mascota.id} omitida: {e}"))
+        return muestras
+
+    def _generar_int8(self, base, tensores, tamano_lote):
+        import torch
+
+        lotes = [
+            torch.cat(tensores[i:i + tamano_lote])
+            for i in range(0, len(tensores), max(1, tamano_lote))
+        ]
+        for atributo, ruta in base._optimizable_models():
+            modelo = getattr(base, atributo)
+            if modelo is None:
+                continue
+            inicio = time.time()
+            cuantizado = optimizacion_predictor.cuantizar_estatico(modelo, lotes)
+            destino = optimizacion_predictor.ruta_int8(ruta)
+            optimizacion_predictor.guardar(cuantizado, destino)
+            self.stdout.write(self.style.SUCCESS(
+                f"{atributo}: int8 estático guardado en {destino} "
+                f"({os.path.getsize(destino) / 1e6:.1f} MB frente a {os.path.getsize(ruta) / 1e6:.1f} MB, "
+                f"{time.time() - inicio:.1f}s)"
+            ))
+
+    def _inferir(self, predictor, tensores):
+        """Probabilidades por tarea (N, clases) y latencia por imagen (ms) con lote 1, como en el registro"""
+        import torch
+
+        salidas = {clave: [] for clave, _, _ in TAREAS}
+        latencias = []
+        with torch.inference_mode():
+            # Calentamiento (las primeras llamadas de TorchScript optimizan el grafo)
+            for _ in range(3):
+                predictor.forward_tensor(tensores[0].to(predictor.device))
+
+            for tensor in tensores:
+                entrada = tensor.to(predictor.device)
+                inicio = time.perf_counter()
+                logits = predictor.forward_tensor(entrada)
+                latencias.append((time.perf_counter() - inicio) * 1000)
+
+                for (clave, _, _), logits_tarea in zip(TAREAS, logits):
+                    if logits_tarea is not None:
+                        salidas[clave].append(torch.softmax(logits_tarea, dim=1)[0].cpu().numpy())
+
+        return {clave: np.stack(v) for clave, v in salidas.items() if v}, np.array(latencias)
+
+    def _reportar(self, modo, predictor, salidas, referencia, latencias, etiquetas):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{modo}: {latencias.mean():.1f} ms/img (p95 {np.percentile(latencias, 95):.1f} ms)"
+        ))
+        for clave, atributo_clases, _ in TAREAS:
+            if clave not in salidas:
+                continue
+            probs = salidas[clave]
+            predichas = probs.argmax(axis=1)
+            linea = (
+                f"  {clave:<10} coincidencia con eager {np.mean(predichas == referencia[clave].argmax(axis=1)):.1%}"
+                f", |Δp| máx {np.abs(probs - referencia[clave]).max():.4f}"
+            )
+
+            clases = getattr(predictor, atributo_clases)
+            reales = [clases.index(e[clave]) if e.get(clave) in clases else -1 for e in etiquetas]
+            validas = np.array(reales) >= 0
+            if validas.any():
+                precision = np.mean(predichas[validas] == np.array(reales)[validas])
+                linea += f", precisión {precision:.1%} sobre {int(validas.sum())} etiquetadas"
+            self.stdout.write(linea)
@@ -0,0 +1,63 @@
+# apps/mascota/management/commands/precargar_modelos.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.mascota.services.carga_diferida import precargar
+
+
+class Command(BaseCommand):
+    help = (
+        "Carga los modelos de IA (predictor del registro, validador canino, detector facial y, "
+        "opcionalmente, el modelo biométrico activo) y muestra cuánto tarda cada uno. Descarga "
+        "además los pesos preentrenados a la caché local, así el primer request no los espera."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--modelos',
+            default=None,
+            help="Modelos diferidos separados por comas (por defecto todos)",
+        )
+        parser.add_argument(
+            '--biometria',
+            action='store_true',
+            help="Cargar también el extractor y el clasificador del ModeloGlobal activo",
+        )
+
+    def handle(self, *args, **options):
+        nombres = None
+        if options['modelos']:
+            nombres = [n.strip() for n in options['modelos'].split(',') if n.strip()]
+
+        errores = 0
+        for nombre, resultado in precargar(nombres).items():
+            if isinstance(resultado, Exception):
+                errores += 1
+                self.stdout.write(self.style.ERROR(f"{nombre}: {resultado}"))
+            else:
+                self.stdout.write(f"{nombre}: {resultado:.2f}s")
+
+        if options['biometria']:
+            errores += self._precargar_biometria()
+
+        if errores:
+            raise CommandError(f"{errores} modelos no se pudieron cargar")
+        self.stdout.write(self.style.SUCCESS("Modelos precargados"))
+
+    def _precargar_biometria(self) -> int:
+        from apps.mascota.models import ModeloGlobal
+        from apps.mascota.services.registro_modelos import get_registro_modelos
+
+        modelo_global = ModeloGlobal.get_active_model()
+        if modelo_global is None:
+            self.stdout.write(self.style.WARNING("biometria: no hay ModeloGlobal activo"))
+            return 0
+        inicio = time.perf_counter()
+        try:
+            get_registro_modelos().obtener(modelo_global)
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"biometria v{modelo_global.version}: {e}"))
+            return 1
+        self.stdout.write(f"biometria v{modelo_global.version}: {time.perf_counter() - inicio:.2f}s")
+        return 0
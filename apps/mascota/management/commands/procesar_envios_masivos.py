@@ -0,0 +1,75 @@
+# apps/mascota/management/commands/procesar_envios_masivos.py
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.mascota.services.envios_masivos import (
+    procesar_envio,
+    reclamar_envio,
+    tamano_lote_por_defecto,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker de los envíos masivos de email (alertas de mascota perdida): envía los "
+        "lotes pendientes reutilizando una conexión por lote y retoma los envíos "
+        "interrumpidos o reprogramados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=tamano_lote_por_defecto(),
+            help="Destinatarios por conexión (por defecto EMAIL_ENVIOS_LOTE)",
+        )
+        parser.add_argument(
+            '--backend',
+            default=None,
+            help="Backend de email a usar en lugar de EMAIL_BACKEND "
+                 "(p. ej. django.core.mail.backends.console.EmailBackend)",
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=5.0,
+            help="Segundos de espera cuando no hay envíos pendientes",
+        )
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help="Procesar lo pendiente y terminar",
+        )
+
+    def handle(self, *args, **options):
+        if options['lote'] <= 0:
+            raise CommandError("--lote debe ser mayor que 0")
+
+        self._detener = False
+        signal.signal(signal.SIGTERM, self._solicitar_detencion)
+        signal.signal(signal.SIGINT, self._solicitar_detencion)
+
+        self.stdout.write(f"Worker de envíos masivos iniciado (lotes de {options['lote']})")
+        while not self._detener:
+            envio = reclamar_envio()
+            if envio is None:
+                if options['una_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+
+            inicio = time.time()
+            envio = procesar_envio(envio, options['lote'], options['backend'])
+            self.stdout.write(
+                f"Envío {envio.id} ({envio.get_estado_display()}): {envio.enviados} enviados, "
+                f"{envio.fallidos} fallidos de {envio.total_destinatarios} ({envio.progreso:.0f}%) "
+                f"en {time.time() - inicio:.1f}s"
+            )
+
+        self.stdout.write(self.style.SUCCESS("Worker de envíos masivos detenido"))
+
+    def _solicitar_detencion(self, signum, frame):
+        self.stdout.write("Deteniendo worker al terminar el envío actual...")
+        self._detener = True
@@ -0,0 +1,65 @@
+# apps/mascota/management/commands/procesar_notificaciones.py
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.mascota.services.notificaciones import procesar_lote
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker de la bandeja de salida de notificaciones de mascotas perdidas: envía por "
+        "lotes las confirmaciones, alertas y avisos de mascota encontrada, respetando el "
+        "límite por destinatario y reintentando los fallidos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=None,
+            help="Notificaciones por lote (por defecto NOTIFICACIONES_LOTE)",
+        )
+        parser.add_argument(
+            '--backend',
+            default=None,
+            help="Backend de email a usar en lugar de EMAIL_BACKEND "
+                 "(p. ej. django.core.mail.backends.console.EmailBackend)",
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=5.0,
+            help="Segundos de espera cuando la bandeja está vacía",
+        )
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help="Procesar lo pendiente y terminar",
+        )
+
+    def handle(self, *args, **options):
+        if options['lote'] is not None and options['lote'] <= 0:
+            raise CommandError("--lote debe ser mayor que 0")
+
+        self._detener = False
+        signal.signal(signal.SIGTERM, self._solicitar_detencion)
+        signal.signal(signal.SIGINT, self._solicitar_detencion)
+
+        self.stdout.write("Worker de notificaciones iniciado")
+        while not self._detener:
+            inicio = time.time()
+            procesadas = procesar_lote(options['lote'], options['backend'])
+            if not procesadas:
+                if options['una_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+            self.stdout.write(f"{procesadas} notificaciones procesadas en {time.time() - inicio:.1f}s")
+
+        self.stdout.write(self.style.SUCCESS("Worker de notificaciones detenido"))
+
+    def _solicitar_detencion(self, signum, frame):
+        self.stdout.write("Deteniendo worker al terminar el lote actual...")
+        self._detener = True
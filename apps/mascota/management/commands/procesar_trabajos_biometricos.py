@@ -0,0 +1,136 @@
+# apps/mascota/management/commands/procesar_trabajos_biometricos.py
+import logging
+import multiprocessing
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from apps.mascota.services.trabajos_biometricos import (
+    ejecutar_lote,
+    finalizar_trabajos,
+    reclamar_trabajos,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _inicializar_proceso():
+    """Prepara Django en cada proceso del pool (contexto 'spawn')"""
+    import django
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker de la cola de procesamiento biométrico: extrae los embeddings "
+        "de las imágenes encoladas usando un pool de procesos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--procesos',
+            type=int,
+            default=getattr(settings, 'BIOMETRIA_WORKER_PROCESOS', 2),
+            help="Procesos del pool (0 = procesar en este mismo proceso)",
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=8,
+            help="Imágenes por tarea enviada a cada proceso",
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=5.0,
+            help="Segundos de espera cuando la cola está vacía",
+        )
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help="Procesar lo pendiente y terminar",
+        )
+
+    def handle(self, *args, **options):
+        procesos = options['procesos']
+        lote = options['lote']
+        if procesos < 0 or lote <= 0:
+            raise CommandError("--procesos debe ser >= 0 y --lote mayor que 0")
+
+        self._detener = False
+        signal.signal(signal.SIGTERM, self._solicitar_detencion)
+        signal.signal(signal.SIGINT, self._solicitar_detencion)
+
+        self._procesos = procesos
+        self._pool = self._crear_pool()
+
+        self.stdout.write(f"Worker biométrico iniciado ({procesos or 'sin'} procesos, lotes de {lote})")
+        try:
+            while not self._detener:
+                procesados = self._ciclo(max(procesos, 1) * lote, lote)
+                if not procesados:
+                    if options['una_vez']:
+                        break
+                    time.sleep(options['intervalo'])
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+
+        self.stdout.write(self.style.SUCCESS("Worker biométrico detenido"))
+
+    def _crear_pool(self):
+        if not self._procesos:
+            return None
+        # 'spawn' evita heredar hilos de torch y conexiones abiertas del proceso padre
+        return ProcessPoolExecutor(
+            max_workers=self._procesos,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_inicializar_proceso,
+        )
+
+    def _solicitar_detencion(self, signum, frame):
+        self.stdout.write("Deteniendo worker al terminar el ciclo actual...")
+        self._detener = True
+
+    def _ciclo(self, limite, lote) -> int:
+        """Reclama, ejecuta y finaliza un grupo de trabajos. Retorna cuántos procesó"""
+        trabajos = reclamar_trabajos(limite)
+        if not trabajos:
+            return 0
+
+        imagenes_ids = [trabajo.imagen_id for trabajo in trabajos]
+        lotes = [imagenes_ids[i:i + lote] for i in range(0, len(imagenes_ids), lote)]
+
+        errores = {}
+        if self._pool is None:
+            for ids in lotes:
+                errores.update(ejecutar_lote(ids))
+        else:
+            # No compartir la conexión del padre mientras los hijos trabajan
+            connections.close_all()
+            pool_roto = False
+            futuros = {self._pool.submit(ejecutar_lote, ids): ids for ids in lotes}
+            for futuro, ids in futuros.items():
+                try:
+                    errores.update(futuro.result())
+                except Exception as e:
+                    pool_roto = pool_roto or isinstance(e, BrokenProcessPool)
+                    logger.error(f"Proceso del pool falló con el lote {ids}: {e}")
+                    errores.update({imagen_id: f"Error en el proceso worker: {e}" for imagen_id in ids})
+
+            if pool_roto:
+                # Un proceso murió (p. ej. sin memoria): el pool ya no acepta tareas
+                logger.warning("Reiniciando el pool de procesos biométricos")
+                self._pool.shutdown(wait=False)
+                self._pool = self._crear_pool()
+
+        finalizar_trabajos(trabajos, errores)
+
+        completados = sum(1 for error in errores.values() if not error)
+        self.stdout.write(f"{completados}/{len(trabajos)} imágenes procesadas")
+        return len(trabajos)
@@ -0,0 +1,107 @@
+# apps/mascota/management/commands/reporte_ann.py
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.mascota.services.indice_embeddings import get_indice_embeddings
+from apps.mascota.services.indice_ivfpq import IndiceIVFPQ
+from apps.mascota.services.puntuacion import MotorPuntuacion, puntuar_candidatos
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara la búsqueda exacta con el índice aproximado IVF-PQ sobre los "
+        "embeddings actuales: recall@k, coincidencia de la mascota predicha y "
+        "latencia por consulta para varios valores de nprobe."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--extractor', default='efficientnet_b0', help="Extractor de los embeddings")
+        parser.add_argument('--consultas', type=int, default=200, help="Embeddings apartados como consultas")
+        parser.add_argument('--nprobe', default='1,2,4,8,16,32', help="Valores de nprobe separados por comas")
+        parser.add_argument('--listas', type=int, default=None, help="Listas invertidas (por defecto ~4·√N)")
+        parser.add_argument('--m', type=int, default=16, help="Subvectores de la cuantización de producto")
+        parser.add_argument('--candidatos', type=int, default=200, help="Candidatos por consulta")
+        parser.add_argument('--k', type=int, default=10, help="Vecinos considerados en el recall")
+
+    def handle(self, *args, **options):
+        try:
+            valores_nprobe = sorted({int(v) for v in options['nprobe'].split(',') if v.strip()})
+        except ValueError:
+            raise CommandError("--nprobe debe ser una lista de enteros separados por comas")
+        k = options['k']
+
+        indice = get_indice_embeddings(options['extractor'])
+        indice.sincronizar()
+        ids, etiquetas, matriz, normas = indice.instantanea()
+        n = ids.shape[0]
+        n_consultas = min(options['consultas'], n // 10)
+        if n_consultas < 1:
+            raise CommandError(f"Hay muy pocos embeddings ({n}) para el reporte")
+
+        # Las consultas se apartan del conjunto indexado (si no, su vecino exacto sería ella misma)
+        rng = np.random.default_rng(0)
+        apartadas = np.zeros(n, dtype=bool)
+        apartadas[rng.choice(n, size=n_consultas, replace=False)] = True
+        consultas = np.asarray(matriz[apartadas], dtype=np.float32)
+        ids, etiquetas = ids[~apartadas], etiquetas[~apartadas]
+        matriz, normas = np.asarray(matriz[~apartadas]), normas[~apartadas]
+        posicion = {emb_id: fila for fila, emb_id in enumerate(ids.tolist())}
+
+        self.stdout.write(f"{ids.shape[0]} embeddings indexados, {n_consultas} consultas, dimensión {matriz.shape[1]}")
+
+        # Referencia exacta
+        motor = MotorPuntuacion(matriz, etiquetas, normas)
+        latencias_exactas = []
+        predicciones_exactas = []
+        for consulta in consultas:
+            inicio = time.perf_counter()
+            predicciones_exactas.append(motor.predecir(consulta)[0][0])
+            latencias_exactas.append(time.perf_counter() - inicio)
+        similitudes, _ = motor.similitudes(consultas)
+        vecinos_exactos = np.argsort(-similitudes, axis=1)[:, :k]
+
+        inicio = time.perf_counter()
+        ann = IndiceIVFPQ(n_listas=options['listas'], m=options['m'], candidatos=options['candidatos'])
+        ann.construir(ids, etiquetas, matriz)
+        self.stdout.write(
+            f"IVF-PQ construido en {time.perf_counter() - inicio:.1f}s: {ann.n_listas} listas, "
+            f"{ann.codigos.nbytes / 1024:.0f} KiB de códigos "
+            f"(matriz exacta: {matriz.nbytes / 1024:.0f} KiB)"
+        )
+
+        self.stdout.write(self._fila('búsqueda', f"recall@{k}", 'misma mascota', 'media (ms)', 'p95 (ms)'))
+        self.stdout.write(self._fila(
+            'exacta', '1.000', '1.000',
+            f"{np.mean(latencias_exactas) * 1000:.2f}", f"{np.percentile(latencias_exactas, 95) * 1000:.2f}",
+        ))
+
+        for nprobe in valores_nprobe:
+            aciertos_recall = 0
+            coincidencias = 0
+            latencias = []
+            for i, consulta in enumerate(consultas):
+                inicio = time.perf_counter()
+                ids_cand, _, _ = ann.buscar(consulta, nprobe=nprobe)[0]
+                # Re-puntuación exacta de los candidatos, igual que IndiceEmbeddings.predecir_aproximado
+                filas = np.fromiter((posicion[e] for e in ids_cand.tolist()), dtype=np.int64, count=ids_cand.size)
+                sims = (matriz[filas] @ consulta) / (normas[filas] * np.linalg.norm(consulta))
+                prediccion = puntuar_candidatos(etiquetas[filas], sims)[0] if filas.size else -1
+                latencias.append(time.perf_counter() - inicio)
+
+                mejores = filas[np.argsort(-sims)[:k]]
+                aciertos_recall += np.isin(vecinos_exactos[i], mejores).sum()
+                coincidencias += prediccion == predicciones_exactas[i]
+
+            self.stdout.write(self._fila(
+                f"ivfpq nprobe={nprobe}",
+                f"{aciertos_recall / (n_consultas * k):.3f}",
+                f"{coincidencias / n_consultas:.3f}",
+                f"{np.mean(latencias) * 1000:.2f}",
+                f"{np.percentile(latencias, 95) * 1000:.2f}",
+            ))
+
+    @staticmethod
+    def _fila(*columnas):
+        return f"{columnas[0]:<20}" + ''.join(f"{c:>16}" for c in columnas[1:])
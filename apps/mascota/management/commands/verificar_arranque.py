@@ -0,0 +1,62 @@
+# apps/mascota/management/commands/verificar_arranque.py
+import json
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Módulos que no deben importarse al arrancar Django (solo al usar los modelos de IA)
+MODULOS_PESADOS = ('torch', 'torchvision', 'sklearn', 'onnxruntime')
+
+# Se ejecuta en un intérprete nuevo: en este proceso Django ya está inicializado
+SCRIPT_ARRANQUE = """
+import json, os, sys, time
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+inicio = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns  # importa todas las vistas
+print(json.dumps({
+    'segundos': time.perf_counter() - inicio,
+    'pesados': [m for m in %r if m in sys.modules],
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide en un proceso nuevo cuánto tarda Django en inicializarse e importar todas las "
+        "vistas, y falla si supera el presupuesto o si se importan torch, torchvision, "
+        "scikit-learn u onnxruntime (los modelos de IA deben cargarse en el primer uso)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--presupuesto',
+            type=float,
+            default=3.0,
+            help="Segundos máximos de arranque",
+        )
+
+    def handle(self, *args, **options):
+        proceso = subprocess.run(
+            [sys.executable, '-c', SCRIPT_ARRANQUE % (MODULOS_PESADOS,)],
+            cwd=str(settings.BASE_DIR),
+            capture_output=True,
+            text=True,
+        )
+        if proceso.returncode != 0:
+            raise CommandError(f"El arranque falló:\n{proceso.stderr}")
+        resultado = json.loads(proceso.stdout.strip().splitlines()[-1])
+
+        self.stdout.write(f"Arranque de Django + URLs: {resultado['segundos']:.2f}s")
+        problemas = []
+        if resultado['pesados']:
+            problemas.append(f"se importaron al arrancar: {', '.join(resultado['pesados'])}")
+        if resultado['segundos'] > options['presupuesto']:
+            problemas.append(f"superó el presupuesto de {options['presupuesto']:.2f}s")
+        if problemas:
+            raise CommandError("; ".join(problemas))
+        self.stdout.write(self.style.SUCCESS("Arranque dentro del presupuesto"))
@@ -2,6 +2,7 @@
 from django.conf import settings
 from django.db import models
 from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator, MaxValueValidator
 import os
 import uuid
@@ -111,6 +112,9 @@ class Mascota(models.Model):
         default=False, 
         help_text="Indica si la mascota ha sido reportada como perdida"
     )
+    # Dónde se perdió (opcional): la alerta se envía solo a los usuarios cercanos
+    latitud_perdida = models.FloatField(null=True, blank=True)
+    longitud_perdida = models.FloatField(null=True, blank=True)
     
     def get_biometric_image_count(self):
         """Retorna el número de imágenes biométricas de la mascota"""
@@ -306,12 +310,28 @@ class Mascota(models.Model):
                     os.remove(self.foto_perfil.path)
             except Exception as e:
                 print(f"Error al eliminar foto de perfil: {e}")
-                
+
+        mascota_id = self.id
+
         # Llamar al delete del padre
-        super().delete(*args, **kwargs)
+        resultado = super().delete(*args, **kwargs)
+
+        # Retirar sus embeddings del índice de reconocimiento en memoria
+        from apps.mascota.services.indice_embeddings import descartar_mascota
+        descartar_mascota(mascota_id)
+
+        return resultado
         
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Lista y API de mascotas perdidas: paginación por cursor sobre (updated_at, id)
+            models.Index(
+                fields=["-updated_at", "-id"],
+                name="mascota_perdidas_keyset_idx",
+                condition=models.Q(reportar_perdida=True),
+            ),
+        ]
         verbose_name = "Mascota"
         verbose_name_plural = "Mascotas"
 
@@ -499,8 +519,19 @@ class EmbeddingStore(models.Model):
         on_delete=models.CASCADE, 
         related_name="embeddings"
     )
-    # Guardamos el vector como lista serializada (JSONField)
-    vector = models.JSONField(help_text="Vector de características (embedding) serializado")
+    # Formato anterior: lista de floats en JSON. Solo se conserva para filas
+    # que aún no se han convertido con `manage.py convertir_embeddings_binarios`
+    vector = models.JSONField(
+        null=True,
+        blank=True,
+        help_text="Vector de características en JSON (formato anterior)"
+    )
+    # Vector como bytes float32/float16 con cabecera de tipo y dimensión (ver services/vector_codec.py)
+    vector_binario = models.BinaryField(
+        null=True,
+        blank=True,
+        help_text="Vector de características (embedding) en formato binario"
+    )
     dimension = models.PositiveIntegerField(
         default=1280,
         help_text="Dimensión del vector de características"
@@ -530,6 +561,29 @@ class EmbeddingStore(models.Model):
     def __str__(self):
         return f"Embedding {self.id} - Mascota {self.mascota.nombre}"
     
+    @property
+    def array(self):
+        """
+        Vector como np.ndarray. Para filas binarias es una vista de solo lectura
+        (np.frombuffer) sin copia; las filas JSON se convierten a float32.
+        """
+        from apps.mascota.services.vector_codec import vector_desde_campos
+        return vector_desde_campos(self.vector_binario, self.vector)
+    
+    def asignar_vector(self, vector, dtype=None):
+        """
+        Guarda el vector en formato binario y limpia la copia JSON.
+        
+        Args:
+            vector: Lista o array con el embedding
+            dtype: 'float32' o 'float16'; por defecto settings.BIOMETRIA_EMBEDDING_DTYPE
+        """
+        from apps.mascota.services.vector_codec import codificar_vector
+        dtype = dtype or getattr(settings, 'BIOMETRIA_EMBEDDING_DTYPE', 'float32')
+        self.vector_binario = codificar_vector(vector, dtype=dtype)
+        self.vector = None
+        self.dimension = len(vector)
+    
     class Meta:
         ordering = ["-creado"]
         verbose_name = "Embedding"
@@ -591,3 +645,219 @@ class RegistroReconocimiento(models.Model):
         ordering = ["-fecha"]
         verbose_name = "Registro de Reconocimiento"
         verbose_name_plural = "Registros de Reconocimientos"
+
+
+class TrabajoBiometrico(models.Model):
+    """
+    Cola persistente para extraer los embeddings de una imagen biométrica.
+    Hay un solo trabajo por imagen; lo ejecuta el comando
+    `manage.py procesar_trabajos_biometricos` fuera del ciclo de la petición.
+    """
+    ESTADO_PENDIENTE = 'pendiente'
+    ESTADO_PROCESANDO = 'procesando'
+    ESTADO_COMPLETADO = 'completado'
+    ESTADO_FALLIDO = 'fallido'
+    ESTADO_CHOICES = [
+        (ESTADO_PENDIENTE, 'Pendiente'),
+        (ESTADO_PROCESANDO, 'Procesando'),
+        (ESTADO_COMPLETADO, 'Completado'),
+        (ESTADO_FALLIDO, 'Fallido'),
+    ]
+    
+    imagen = models.OneToOneField(
+        ImagenMascota,
+        on_delete=models.CASCADE,
+        related_name='trabajo_biometrico'
+    )
+    mascota = models.ForeignKey(
+        Mascota,
+        on_delete=models.CASCADE,
+        related_name='trabajos_biometricos'
+    )
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADO_CHOICES,
+        default=ESTADO_PENDIENTE
+    )
+    intentos = models.PositiveSmallIntegerField(default=0)
+    max_intentos = models.PositiveSmallIntegerField(default=5)
+    proximo_intento = models.DateTimeField(
+        default=timezone.now,
+        help_text="No se ejecuta antes de esta fecha (espera entre reintentos)"
+    )
+    iniciado = models.DateTimeField(null=True, blank=True)
+    finalizado = models.DateTimeField(null=True, blank=True)
+    ultimo_error = models.TextField(blank=True, default='')
+    creado = models.DateTimeField(default=timezone.now)
+    actualizado = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Trabajo {self.id} - Imagen {self.imagen_id} ({self.estado})"
+    
+    class Meta:
+        ordering = ["proximo_intento", "id"]
+        indexes = [
+            models.Index(fields=["estado", "proximo_intento"]),
+        ]
+        verbose_name = "Trabajo Biométrico"
+        verbose_name_plural = "Trabajos Biométricos"
+
+
+class EnvioMasivo(models.Model):
+    """
+    Envío de un mismo email a muchos usuarios (p. ej. la alerta de mascota perdida).
+    El contenido se renderiza una sola vez al crearlo; los lotes los envía un
+    worker en segundo plano, que guarda el progreso tras cada lote para poder
+    retomarlo desde el último destinatario si se interrumpe.
+    """
+    TIPO_ALERTA_PERDIDA = 'alerta_perdida'
+    TIPO_CHOICES = [
+        (TIPO_ALERTA_PERDIDA, 'Alerta de mascota perdida'),
+    ]
+    
+    ESTADO_PENDIENTE = 'pendiente'
+    ESTADO_ENVIANDO = 'enviando'
+    ESTADO_COMPLETADO = 'completado'
+    ESTADO_FALLIDO = 'fallido'
+    ESTADO_CANCELADO = 'cancelado'
+    ESTADO_CHOICES = [
+        (ESTADO_PENDIENTE, 'Pendiente'),
+        (ESTADO_ENVIANDO, 'Enviando'),
+        (ESTADO_COMPLETADO, 'Completado'),
+        (ESTADO_FALLIDO, 'Fallido'),
+        (ESTADO_CANCELADO, 'Cancelado'),
+    ]
+    
+    tipo = models.CharField(max_length=30, choices=TIPO_CHOICES, default=TIPO_ALERTA_PERDIDA)
+    mascota = models.ForeignKey(
+        Mascota,
+        on_delete=models.CASCADE,
+        related_name='envios_masivos'
+    )
+    asunto = models.CharField(max_length=255)
+    # Alcance geográfico: solo usuarios con casa a menos de `radio_km` del punto
+    # (sin coordenadas se envía a todos los usuarios)
+    latitud = models.FloatField(null=True, blank=True)
+    longitud = models.FloatField(null=True, blank=True)
+    radio_km = models.FloatField(null=True, blank=True)
+    mensaje_texto = models.TextField()
+    mensaje_html = models.TextField(blank=True, default='')
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADO_CHOICES,
+        default=ESTADO_PENDIENTE
+    )
+    # Progreso: los destinatarios se recorren por id ascendente
+    total_destinatarios = models.PositiveIntegerField(default=0)
+    enviados = models.PositiveIntegerField(default=0)
+    fallidos = models.PositiveIntegerField(default=0)
+    ultimo_usuario_id = models.BigIntegerField(
+        default=0,
+        help_text="Id del último usuario de un lote ya enviado (el envío se retoma desde aquí)"
+    )
+    intentos = models.PositiveSmallIntegerField(default=0)
+    max_intentos = models.PositiveSmallIntegerField(default=5)
+    proximo_intento = models.DateTimeField(
+        default=timezone.now,
+        help_text="No se ejecuta antes de esta fecha (espera entre reintentos)"
+    )
+    iniciado = models.DateTimeField(null=True, blank=True)
+    finalizado = models.DateTimeField(null=True, blank=True)
+    ultimo_error = models.TextField(blank=True, default='')
+    creado = models.DateTimeField(default=timezone.now)
+    actualizado = models.DateTimeField(auto_now=True)
+    
+    @property
+    def progreso(self):
+        """Porcentaje de destinatarios procesados (enviados o fallidos)"""
+        if not self.total_destinatarios:
+            return 100.0 if self.estado == self.ESTADO_COMPLETADO else 0.0
+        return min(100.0, 100.0 * (self.enviados + self.fallidos) / self.total_destinatarios)
+    
+    def __str__(self):
+        return f"Envío {self.id} - {self.get_tipo_display()} de {self.mascota_id} ({self.estado})"
+    
+    class Meta:
+        ordering = ["proximo_intento", "id"]
+        indexes = [
+            models.Index(fields=["estado", "proximo_intento"]),
+        ]
+        verbose_name = "Envío Masivo"
+        verbose_name_plural = "Envíos Masivos"
+
+
+class NotificacionSaliente(models.Model):
+    """
+    Bandeja de salida transaccional de las notificaciones de mascotas perdidas.
+    Los servicios la escriben en la misma transacción que el cambio de estado de
+    la mascota y un worker la vacía por lotes, fuera del ciclo de la petición.
+    Los eventos repetidos de una mascota dentro de la misma ventana de tiempo
+    comparten `clave_deduplicacion` y se combinan en una sola fila.
+    """
+    EVENTO_CONFIRMACION_PERDIDA = 'confirmacion_perdida'
+    EVENTO_ALERTA_PERDIDA = 'alerta_perdida'
+    EVENTO_MASCOTA_ENCONTRADA = 'mascota_encontrada'
+    EVENTO_CHOICES = [
+        (EVENTO_CONFIRMACION_PERDIDA, 'Confirmación de reporte de pérdida'),
+        (EVENTO_ALERTA_PERDIDA, 'Alerta de mascota perdida'),
+        (EVENTO_MASCOTA_ENCONTRADA, 'Mascota encontrada'),
+    ]
+    
+    ESTADO_PENDIENTE = 'pendiente'
+    ESTADO_ENVIANDO = 'enviando'
+    ESTADO_ENVIADO = 'enviado'
+    ESTADO_FALLIDO = 'fallido'
+    ESTADO_DESCARTADO = 'descartado'
+    ESTADO_CHOICES = [
+        (ESTADO_PENDIENTE, 'Pendiente'),
+        (ESTADO_ENVIANDO, 'Enviando'),
+        (ESTADO_ENVIADO, 'Enviado'),
+        (ESTADO_FALLIDO, 'Fallido'),
+        (ESTADO_DESCARTADO, 'Descartado'),
+    ]
+    
+    mascota = models.ForeignKey(
+        Mascota,
+        on_delete=models.CASCADE,
+        related_name='notificaciones_salientes'
+    )
+    evento = models.CharField(max_length=30, choices=EVENTO_CHOICES)
+    destinatario = models.EmailField(
+        blank=True,
+        default='',
+        help_text="Email al que se envía (vacío para las alertas masivas); sujeto al límite por destinatario"
+    )
+    datos = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    clave_deduplicacion = models.CharField(max_length=100, unique=True)
+    coalescidos = models.PositiveIntegerField(
+        default=0,
+        help_text="Eventos repetidos combinados en esta notificación"
+    )
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADO_CHOICES,
+        default=ESTADO_PENDIENTE
+    )
+    intentos = models.PositiveSmallIntegerField(default=0)
+    max_intentos = models.PositiveSmallIntegerField(default=5)
+    proximo_intento = models.DateTimeField(
+        default=timezone.now,
+        help_text="No se ejecuta antes de esta fecha (reintentos y límite por destinatario)"
+    )
+    iniciado = models.DateTimeField(null=True, blank=True)
+    enviado_en = models.DateTimeField(null=True, blank=True)
+    ultimo_error = models.TextField(blank=True, default='')
+    creado = models.DateTimeField(default=timezone.now)
+    actualizado = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Notificación {self.id} - {self.get_evento_display()} de {self.mascota_id} ({self.estado})"
+    
+    class Meta:
+        ordering = ["proximo_intento", "id"]
+        indexes = [
+            models.Index(fields=["estado", "proximo_intento"]),
+            models.Index(fields=["destinatario", "enviado_en"]),
+        ]
+        verbose_name = "Notificación Saliente"
+        verbose_name_plural = "Notificaciones Salientes"
@@ -7,6 +7,10 @@ import os
 from django.conf import settings
 import logging
 
+from .imagen_decodificada import ImagenDecodificada
+from . import clases_ia, optimizacion_predictor
+from .carga_diferida import diferido
+
 logger = logging.getLogger(__name__)
 
 class MultiTaskDogModel(nn.Module):
@@ -62,10 +66,85 @@ class BodyConditionModel(nn.Module):
         return self.resnet(x)
 
 
+class BodyConditionHead(nn.Module):
+    """Cabeza de condición corporal sobre las 512 características del tronco resnet18 multitarea"""
+    def __init__(self, num_classes=3):
+        super(BodyConditionHead, self).__init__()
+        self.classifier = nn.Sequential(
+            nn.Dropout(0.3),
+            nn.Linear(512, 256),
+            nn.ReLU(),
+            nn.Linear(256, num_classes)
+        )
+    
+    def forward(self, features):
+        return self.classifier(features)
+
+
+class FusedDogModel(nn.Module):
+    """
+    Tronco resnet18 del modelo multitarea compartido por las tres cabezas
+    (raza, etapa de vida y condición corporal). La cabeza de condición corporal
+    se destila del BodyConditionModel (manage.py destilar_condicion_corporal),
+    así que cada predicción ejecuta un solo backbone en lugar de resnet18 + resnet50.
+    """
+    def __init__(self, multitask_model, body_condition_head):
+        super(FusedDogModel, self).__init__()
+        self.features = multitask_model.features
+        self.breed_classifier = multitask_model.breed_classifier
+        self.stage_classifier = multitask_model.stage_classifier
+        self.body_condition_head = body_condition_head
+    
+    def forward(self, x):
+        features = self.features(x)
+        features = features.view(features.size(0), -1)
+        return (
+            self.breed_classifier(features),
+            self.stage_classifier(features),
+            self.body_condition_head(features)
+        )
+
+
+class _FusedMultitaskView(nn.Module):
+    """Expone las salidas de raza y etapa del modelo fusionado con la interfaz de MultiTaskDogModel"""
+    def __init__(self, fused_model):
+        super(_FusedMultitaskView, self).__init__()
+        self.fused_model = fused_model
+    
+    def forward(self, x):
+        breed_output, stage_output, _ = self.fused_model(x)
+        return breed_output, stage_output
+
+
+class _FusedBodyConditionView(nn.Module):
+    """Expone la salida de condición corporal del modelo fusionado con la interfaz de BodyConditionModel"""
+    def __init__(self, fused_model):
+        super(_FusedBodyConditionView, self).__init__()
+        self.fused_model = fused_model
+    
+    def forward(self, x):
+        return self.fused_model(x)[2]
+
+
 class AIPredictor:
     """Servicio de predicción de IA para mascotas"""
     
-    def __init__(self):
+    # Clave del tensor preprocesado (Resize 224x224) en ImagenDecodificada
+    CLAVE_PREPROCESADO = 'redimension_224'
+    
+    # Clases de cada modelo (ver clases_ia, importable sin torch)
+    BREED_CLASSES = clases_ia.BREED_CLASSES
+    STAGE_CLASSES = clases_ia.STAGE_CLASSES
+    BODY_CONDITION_CLASSES = clases_ia.BODY_CONDITION_CLASSES
+    
+    def __init__(self, modo=None, fusionado=None):
+        # Modo de inferencia: eager, torchscript, int8_dinamico o int8_estatico
+        self.modo = modo or getattr(settings, 'IA_PREDICTOR_MODO', optimizacion_predictor.MODO_EAGER)
+        
+        # Tronco compartido para las tres tareas (requiere la cabeza destilada)
+        self.fusionado = getattr(settings, 'IA_PREDICTOR_FUSIONADO', False) if fusionado is None else fusionado
+        self.fused_model = None
+        
         # Modelo multi-task (raza y etapa de vida)
         self.multitask_model = None
         
@@ -78,11 +157,13 @@ class AIPredictor:
         # Rutas de los modelos
         self.multitask_model_path = os.path.join(settings.BASE_DIR, 'models', 'final_multitask_dog_model.pth')
         self.body_condition_model_path = os.path.join(settings.BASE_DIR, 'models', 'dog_body_condition_classifier.pth')
+        # Cabeza de condición corporal destilada sobre el tronco multitarea
+        self.fused_model_path = os.path.join(settings.BASE_DIR, 'models', 'dog_fused_model.pth')
         
         # Definir las clases (deben coincidir con el entrenamiento)
-        self.breed_classes = ['bulldog', 'chihuahua', 'golden retriever']  # alfabético
-        self.stage_classes = ['adulto', 'cachorro', 'joven', 'senior']     # alfabético
-        self.body_condition_classes = ['delgado', 'normal', 'obeso']       # condición corporal
+        self.breed_classes = list(self.BREED_CLASSES)
+        self.stage_classes = list(self.STAGE_CLASSES)
+        self.body_condition_classes = list(self.BODY_CONDITION_CLASSES)
         
         # Umbral de confianza mínimo para aceptar predicciones
         # Las razas entrenadas (Chihuahua, Golden Retriever, Bulldog) suelen tener
@@ -99,11 +180,48 @@ class AIPredictor:
         
         # Cargar ambos modelos al inicializar
         self._load_models()
+        self._aplicar_modo()
+    
+    def _aplicar_modo(self):
+        """Reemplaza los modelos eager por su variante optimizada según self.modo"""
+        if self.modo == optimizacion_predictor.MODO_EAGER:
+            return
+        if self.modo not in optimizacion_predictor.MODOS:
+            logger.warning(f"Modo de predictor desconocido '{self.modo}'; se usará eager")
+            self.modo = optimizacion_predictor.MODO_EAGER
+            return
+        
+        optimizados = {}
+        for atributo, ruta in self._optimizable_models():
+            modelo = getattr(self, atributo)
+            if modelo is None:
+                continue
+            try:
+                optimizados[atributo] = optimizacion_predictor.optimizar(modelo, self.modo, ruta, self.device)
+            except Exception as e:
+                # Sin todas las variantes se mantiene eager para no mezclar dispositivos
+                logger.warning(f"No se pudo preparar {atributo} en modo {self.modo} ({e}); se usará eager")
+                self.modo = optimizacion_predictor.MODO_EAGER
+                return
+        
+        for atributo, modelo in optimizados.items():
+            if atributo == 'fused_model':
+                self._set_fused_model(modelo)
+            else:
+                setattr(self, atributo, modelo)
+        if self.modo in optimizacion_predictor.MODOS_INT8:
+            # Los operadores cuantizados solo existen en CPU
+            self.device = torch.device("cpu")
+        logger.info(f"✅ Predictor en modo {self.modo}")
     
     def _load_models(self):
         """Carga ambos modelos entrenados"""
         multitask_loaded = self._load_multitask_model()
-        body_condition_loaded = self._load_body_condition_model()
+        if multitask_loaded and self.fusionado and self._load_fused_model():
+            # La condición corporal sale del tronco multitarea; no hace falta el resnet50
+            body_condition_loaded = True
+        else:
+            body_condition_loaded = self._load_body_condition_model()
         
         if multitask_loaded:
             logger.info("✅ Modelo multitarea cargado correctamente")
@@ -117,6 +235,55 @@ class AIPredictor:
         
         return multitask_loaded or body_condition_loaded
     
+    def _load_fused_model(self):
+        """Construye el modelo fusionado con el tronco multitarea y la cabeza destilada"""
+        if not os.path.exists(self.fused_model_path):
+            logger.warning(f"Cabeza de condición corporal destilada no encontrada en: {self.fused_model_path}")
+            return False
+        
+        try:
+            checkpoint = torch.load(self.fused_model_path, map_location=self.device)
+            head = BodyConditionHead(len(self.body_condition_classes))
+            head.load_state_dict(checkpoint['body_condition_head'])
+            fused_model = FusedDogModel(self.multitask_model, head).to(self.device)
+            fused_model.eval()
+        except Exception as e:
+            logger.error(f"Error cargando el modelo fusionado: {e}")
+            return False
+        
+        self._set_fused_model(fused_model)
+        logger.info(f"✅ Modelo fusionado cargado (coincidencia con el modelo de condición corporal: {checkpoint.get('metricas', {}).get('coincidencia', 'n/d')})")
+        return True
+    
+    def _set_fused_model(self, fused_model):
+        """Asigna el modelo fusionado y las vistas que usan el resto del predictor"""
+        self.fused_model = fused_model
+        self.multitask_model = _FusedMultitaskView(fused_model)
+        self.body_condition_model = _FusedBodyConditionView(fused_model)
+    
+    def _optimizable_models(self):
+        """[(atributo, ruta del checkpoint)] de los modelos que se ejecutan en la predicción"""
+        if self.fused_model is not None:
+            return [('fused_model', self.fused_model_path)]
+        return [('multitask_model', self.multitask_model_path),
+                ('body_condition_model', self.body_condition_model_path)]
+    
+    def forward_tensor(self, input_tensor):
+        """
+        Ejecuta los modelos sobre un lote preprocesado.
+        
+        Returns:
+            tuple: (logits de raza, de etapa, de condición corporal); None para los no disponibles
+        """
+        if self.fused_model is not None:
+            return self.fused_model(input_tensor)
+        breed_outputs = stage_outputs = body_outputs = None
+        if self.multitask_model is not None:
+            breed_outputs, stage_outputs = self.multitask_model(input_tensor)
+        if self.body_condition_model is not None:
+            body_outputs = self.body_condition_model(input_tensor)
+        return breed_outputs, stage_outputs, body_outputs
+    
     def _load_multitask_model(self):
         """Carga el modelo multitarea (raza y etapa de vida)"""
         try:
@@ -327,7 +494,7 @@ class AIPredictor:
         Predice raza, etapa de vida y condición corporal desde un archivo de imagen Django
         
         Args:
-            image_file: Archivo de imagen Django (UploadedFile)
+            image_file: Archivo de imagen Django (UploadedFile) o ImagenDecodificada
             
         Returns:
             dict: Diccionario con las predicciones y confianzas
@@ -343,6 +510,11 @@ class AIPredictor:
             }
         
         try:
+            if isinstance(image_file, ImagenDecodificada):
+                # Reutilizar la decodificación y el tensor 224x224 ya calculados en el request
+                input_tensor = image_file.preprocesado(self.CLAVE_PREPROCESADO, self.transform)
+                return self._predict_from_pil_image(image_file.pil, input_tensor=input_tensor)
+            
             # Abrir la imagen desde el archivo
             image = Image.open(image_file).convert("RGB")
             return self._predict_from_pil_image(image)
@@ -388,12 +560,13 @@ class AIPredictor:
                 'error': f'Error procesando imagen: {str(e)}'
             }
     
-    def _predict_from_pil_image(self, image):
+    def _predict_from_pil_image(self, image, input_tensor=None):
         """
         Realiza la predicción desde una imagen PIL usando ambos modelos
         
         Args:
             image: Imagen PIL
+            input_tensor: Tensor (3, 224, 224) ya preprocesado de la imagen (opcional)
             
         Returns:
             dict: Diccionario con las predicciones y confianzas
@@ -413,7 +586,9 @@ class AIPredictor:
             
             # Aplicar transformaciones
             try:
-                input_tensor = self.transform(image).unsqueeze(0).to(self.device)
+                if input_tensor is None:
+                    input_tensor = self.transform(image)
+                input_tensor = input_tensor.unsqueeze(0).to(self.device)
             except Exception as e:
                 logger.error(f"Error al transformar imagen: {e}")
                 return {
@@ -423,12 +598,24 @@ class AIPredictor:
             
             predictions = {}
             
+            # Con el modelo fusionado el tronco se ejecuta una sola vez para las tres tareas
+            fused_outputs = None
+            if self.fused_model is not None:
+                try:
+                    with torch.inference_mode():
+                        fused_outputs = self.fused_model(input_tensor)
+                except Exception as e:
+                    logger.error(f"Error en predicción con modelo fusionado: {e}")
+            
             # Predicción con modelo multitarea (raza y etapa de vida)
             if self.multitask_model:
                 try:
                     logger.info("Realizando predicción con modelo multitarea...")
-                    with torch.no_grad():
-                        breed_outputs, stage_outputs = self.multitask_model(input_tensor)
+                    with torch.inference_mode():
+                        if fused_outputs is not None:
+                            breed_outputs, stage_outputs = fused_outputs[0], fused_outputs[1]
+                        else:
+                            breed_outputs, stage_outputs = self.multitask_model(input_tensor)
                         
                         # Aplicar softmax para obtener probabilidades
                         breed_probs = torch.softmax(breed_outputs, dim=1)
@@ -523,16 +710,19 @@ class AIPredictor:
                     # Asegurar que el modelo está en modo evaluación
                     self.body_condition_model.eval()
                     
-                    # Verificar que esté en el dispositivo correcto
-                    if next(self.body_condition_model.parameters()).device != self.device:
+                    # Verificar que esté en el dispositivo correcto (los módulos congelados no exponen parámetros)
+                    if self.modo == optimizacion_predictor.MODO_EAGER and next(self.body_condition_model.parameters()).device != self.device:
                         logger.info(f"Moviendo modelo de condición corporal al dispositivo {self.device}")
                         self.body_condition_model = self.body_condition_model.to(self.device)
                     
-                    with torch.no_grad():
+                    with torch.inference_mode():
                         # Log detallado para diagnóstico
                         logger.debug(f"Ejecutando forward pass del modelo de condición corporal. Input shape: {input_tensor.shape}")
                         
-                        body_outputs = self.body_condition_model(input_tensor)
+                        if fused_outputs is not None:
+                            body_outputs = fused_outputs[2]
+                        else:
+                            body_outputs = self.body_condition_model(input_tensor)
                         logger.debug(f"Output del modelo: shape={body_outputs.shape}")
                         
                         # Aplicar softmax para obtener probabilidades
@@ -577,7 +767,7 @@ class AIPredictor:
                         simple_model = self.body_condition_model.to("cpu")
                         simple_input = self.transform(image).unsqueeze(0).to("cpu")
                         
-                        with torch.no_grad():
+                        with torch.inference_mode():
                             simple_output = simple_model(simple_input)
                             simple_probs = torch.softmax(simple_output, dim=1)
                             simple_pred_idx = torch.argmax(simple_probs, dim=1).item()
@@ -670,32 +860,10 @@ class AIPredictor:
         else:
             return 'low'
     
-    def get_breed_choices_for_django(self):
-        """Retorna las opciones de raza en formato Django choices"""
-        choices = []
-        for breed in self.breed_classes:
-            # Capitalizar para mostrar mejor
-            display_name = breed.replace('_', ' ').title()
-            choices.append((breed, display_name))
-        return choices
-    
-    def get_stage_choices_for_django(self):
-        """Retorna las opciones de etapa en formato Django choices"""
-        choices = []
-        for stage in self.stage_classes:
-            # Capitalizar para mostrar mejor
-            display_name = stage.capitalize()
-            choices.append((stage, display_name))
-        return choices
-    
-    def get_body_condition_choices_for_django(self):
-        """Retorna las opciones de condición corporal en formato Django choices"""
-        choices = []
-        for condition in self.body_condition_classes:
-            # Capitalizar para mostrar mejor
-            display_name = condition.capitalize()
-            choices.append((condition, display_name))
-        return choices
+    # Opciones para formularios (los formularios usan clases_ia directamente)
+    get_breed_choices_for_django = staticmethod(clases_ia.get_breed_choices_for_django)
+    get_stage_choices_for_django = staticmethod(clases_ia.get_stage_choices_for_django)
+    get_body_condition_choices_for_django = staticmethod(clases_ia.get_body_condition_choices_for_django)
     
     def get_body_condition_display_name(self, condition_internal):
         """Convierte el nombre interno de condición corporal a nombre para mostrar"""
@@ -716,58 +884,63 @@ class AIPredictor:
         return descriptions.get(condition_internal, 'Condición corporal no determinada.')
 
 
-# Instancia global del predictor con manejo de errores mejorado
-try:
-    predictor = AIPredictor()
-except Exception as e:
-    logger.error(f"Error crítico inicializando predictor global: {e}")
-    # Crear un predictor en modo seguro que se inicializará bajo demanda
-    class SafePredictor:
-        def __init__(self):
-            self._real_predictor = None
-            self._init_attempts = 0
-            self._max_attempts = 3
-            
-        def _ensure_predictor(self):
-            if self._real_predictor is None and self._init_attempts < self._max_attempts:
-                try:
-                    logger.info(f"Intento {self._init_attempts + 1} de inicializar predictor bajo demanda")
-                    self._real_predictor = AIPredictor()
-                    logger.info("Predictor inicializado correctamente bajo demanda")
-                except Exception as init_error:
-                    logger.error(f"Error inicializando predictor bajo demanda: {init_error}")
-                self._init_attempts += 1
-            return self._real_predictor
-                
-        def predict_from_image_file(self, *args, **kwargs):
-            predictor = self._ensure_predictor()
-            if predictor:
-                return predictor.predict_from_image_file(*args, **kwargs)
-            return {'success': False, 'error': 'Servicio de predicción no disponible temporalmente'}
-            
-        def predict_from_image_path(self, *args, **kwargs):
-            predictor = self._ensure_predictor()
-            if predictor:
-                return predictor.predict_from_image_path(*args, **kwargs)
-            return {'success': False, 'error': 'Servicio de predicción no disponible temporalmente'}
-            
-        def get_breed_choices_for_django(self):
-            predictor = self._ensure_predictor()
-            if predictor:
-                return predictor.get_breed_choices_for_django()
-            return [('no_disponible', 'No disponible')]
-            
-        def get_stage_choices_for_django(self):
-            predictor = self._ensure_predictor()
-            if predictor:
-                return predictor.get_stage_choices_for_django()
-            return [('no_disponible', 'No disponible')]
-            
-        def get_body_condition_choices_for_django(self):
-            predictor = self._ensure_predictor()
-            if predictor:
-                return predictor.get_body_condition_choices_for_django()
-            return [('no_disponible', 'No disponible')]
-            
-    # Usar el predictor seguro en caso de error
-    predictor = SafePredictor()
\ No newline at end of file
+class SafePredictor:
+    """Predictor en modo seguro que reintenta inicializar AIPredictor bajo demanda"""
+    def __init__(self):
+        self._real_predictor = None
+        self._init_attempts = 0
+        self._max_attempts = 3
+        
+    def _ensure_predictor(self):
+        if self._real_predictor is None and self._init_attempts < self._max_attempts:
+            try:
+                logger.info(f"Intento {self._init_attempts + 1} de inicializar predictor bajo demanda")
+                self._real_predictor = AIPredictor()
+                logger.info("Predictor inicializado correctamente bajo demanda")
+            except Exception as init_error:
+                logger.error(f"Error inicializando predictor bajo demanda: {init_error}")
+            self._init_attempts += 1
+        return self._real_predictor
+            
+    def predict_from_image_file(self, *args, **kwargs):
+        predictor = self._ensure_predictor()
+        if predictor:
+            return predictor.predict_from_image_file(*args, **kwargs)
+        return {'success': False, 'error': 'Servicio de predicción no disponible temporalmente'}
+        
+    def predict_from_image_path(self, *args, **kwargs):
+        predictor = self._ensure_predictor()
+        if predictor:
+            return predictor.predict_from_image_path(*args, **kwargs)
+        return {'success': False, 'error': 'Servicio de predicción no disponible temporalmente'}
+        
+    def get_breed_choices_for_django(self):
+        predictor = self._ensure_predictor()
+        if predictor:
+            return predictor.get_breed_choices_for_django()
+        return [('no_disponible', 'No disponible')]
+        
+    def get_stage_choices_for_django(self):
+        predictor = self._ensure_predictor()
+        if predictor:
+            return predictor.get_stage_choices_for_django()
+        return [('no_disponible', 'No disponible')]
+        
+    def get_body_condition_choices_for_django(self):
+        predictor = self._ensure_predictor()
+        if predictor:
+            return predictor.get_body_condition_choices_for_django()
+        return [('no_disponible', 'No disponible')]
+
+
+def _crear_predictor():
+    """Construye el predictor global; si falla, uno en modo seguro que se inicializará bajo demanda"""
+    try:
+        return AIPredictor()
+    except Exception as e:
+        logger.error(f"Error crítico inicializando predictor global: {e}")
+        return SafePredictor()
+
+
+# Instancia global del predictor: los modelos se cargan en el primer uso, no al importar
+predictor = diferido('predictor_ia', _crear_predictor)
@@ -0,0 +1,126 @@
+# apps/mascota/services/almacenamiento_azure.py
+"""
+AzureStorage con caché de URLs firmadas.
+
+Con `expiration_secs` cada acceso a `.url` (foto_perfil, ImagenMascota.imagen,
+User.image...) genera una firma SAS nueva: HMAC, cliente de blob y armado de
+la URL por cada fila de los listados, la API de mascotas perdidas o el
+resultado del reconocimiento. AzureStorageConCache guarda la URL firmada por
+nombre de blob y la reutiliza hasta `url_cache_margen` segundos antes de que
+expire, así el navegador también puede cachear la imagen (la URL no cambia).
+
+Se activa como backend "default" en STORAGES; `estadisticas()` y
+`manage.py medir_urls_firmadas` muestran aciertos y el tiempo de firma ahorrado.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict
+
+from django.conf import settings
+from storages.backends.azure_storage import AzureStorage
+
+
+class AzureStorageConCache(AzureStorage):
+    """
+    AzureStorage que reutiliza la URL firmada de cada blob mientras le quede vigencia.
+
+    Solo se cachean las URLs de lectura con la expiración por defecto y sin
+    parámetros extra; el resto se firma siempre.
+
+    Opciones adicionales (STORAGES["default"]["OPTIONS"] o settings):
+        url_cache_margen: Segundos antes de la expiración en que se deja de reutilizar una URL
+        url_cache_maximo: Máximo de URLs en caché (se descartan las menos usadas)
+    """
+
+    def __init__(self, **settings_storage):
+        super().__init__(**settings_storage)
+        self._urls = OrderedDict()  # nombre -> (url, vigente_hasta en reloj monotónico)
+        self._urls_lock = threading.Lock()
+        self._aciertos = 0
+        self._fallos = 0
+        self._segundos_firma = 0.0
+
+    def get_default_settings(self):
+        ajustes = super().get_default_settings()
+        ajustes.update({
+            'url_cache_margen': getattr(settings, 'AZURE_URL_CACHE_MARGEN', 300),
+            'url_cache_maximo': getattr(settings, 'AZURE_URL_CACHE_MAXIMO', 10000),
+        })
+        return ajustes
+
+    def url(self, name, expire=None, parameters=None, mode="r"):
+        expiracion = self.expiration_secs
+        if parameters or mode != "r" or (expire is not None and expire != expiracion) or not expiracion:
+            return super().url(name, expire=expire, parameters=parameters, mode=mode)
+
+        ahora = time.monotonic()
+        with self._urls_lock:
+            entrada = self._urls.get(name)
+            if entrada is not None and entrada[1] > ahora:
+                self._urls.move_to_end(name)
+                self._aciertos += 1
+                return entrada[0]
+
+        inicio = time.perf_counter()
+        url = super().url(name, expire=expire, parameters=parameters, mode=mode)
+        segundos = time.perf_counter() - inicio
+
+        margen = self.vigencia_minima_url()
+        with self._urls_lock:
+            self._fallos += 1
+            self._segundos_firma += segundos
+            self._urls[name] = (url, ahora + expiracion - margen)
+            self._urls.move_to_end(name)
+            while len(self._urls) > self.url_cache_maximo:
+                self._urls.popitem(last=False)
+        return url
+
+    def vigencia_minima_url(self):
+        """
+        Segundos de vigencia que le quedan como mínimo a una URL retornada por url()
+        (None si las URLs no expiran). Las respuestas que incluyen URLs firmadas
+        no deben cachearse más que esto.
+        """
+        if not self.expiration_secs:
+            return None
+        # Nunca reutilizar más allá de la mitad de la vigencia si el margen es mayor
+        return min(self.url_cache_margen, self.expiration_secs / 2)
+
+    def invalidar_url(self, name):
+        """Olvida la URL firmada de un blob"""
+        with self._urls_lock:
+            self._urls.pop(name, None)
+
+    def delete(self, name):
+        self.invalidar_url(name)
+        super().delete(name)
+
+    def estadisticas(self) -> Dict[str, float]:
+        """
+        Contadores de la caché de URLs firmadas del proceso
+
+        Returns:
+            dict: aciertos, fallos (firmas generadas), tasa de aciertos, ms medios por firma,
+            ms de firma ahorrados y URLs en caché
+        """
+        with self._urls_lock:
+            aciertos, fallos, segundos = self._aciertos, self._fallos, self._segundos_firma
+            en_cache = len(self._urls)
+        ms_por_firma = segundos * 1000 / fallos if fallos else 0.0
+        consultas = aciertos + fallos
+        return {
+            'aciertos': aciertos,
+            'fallos': fallos,
+            'tasa_aciertos': aciertos / consultas if consultas else 0.0,
+            'ms_por_firma': ms_por_firma,
+            'ms_ahorrados': aciertos * ms_por_firma,
+            'urls_en_cache': en_cache,
+        }
+
+    def reiniciar_estadisticas(self):
+        with self._urls_lock:
+            self._aciertos = 0
+            self._fallos = 0
+            self._segundos_firma = 0.0
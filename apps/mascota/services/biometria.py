@@ -1,5 +1,7 @@
 # apps/mascota/services/biometria.py
+import importlib.util
 import os
+import threading
 import time
 import pickle
 import numpy as np
@@ -9,27 +11,70 @@ from pathlib import Path
 
 from django.conf import settings
 from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
 
-# Importaciones condicionales para evitar errores al iniciar Django si no están instaladas
-try:
-    import cv2
-    import torch
-    import torchvision
-    from torchvision import transforms
-    from torchvision.models import efficientnet_b0, EfficientNet_B0_Weights
-    from torchvision.models import resnet50, ResNet50_Weights
-    from torchvision.models.feature_extraction import create_feature_extractor
-    from sklearn.neighbors import KNeighborsClassifier
-    from sklearn.svm import SVC
-    from sklearn.ensemble import RandomForestClassifier
-    from sklearn.preprocessing import StandardScaler
-    from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, classification_report
-    DEPS_INSTALLED = True
-except ImportError:
-    DEPS_INSTALLED = False
+from .imagen_decodificada import ImagenDecodificada
+from .puntuacion import MotorPuntuacion
+from .vector_codec import vector_desde_campos
+
+# Las dependencias pesadas (torch, torchvision, scikit-learn, OpenCV) se importan en el
+# primer uso del servicio (_cargar_dependencias), no al importar el módulo: las vistas,
+# el admin y los comandos que no usan biometría arrancan sin pagar su importación
+DEPS_INSTALLED = all(
+    importlib.util.find_spec(modulo) is not None
+    for modulo in ('cv2', 'torch', 'torchvision', 'sklearn')
+)
+if not DEPS_INSTALLED:
     logging.warning("Dependencias de biometría no instaladas. Instala: torch, torchvision, scikit-learn, opencv-python")
 
+_deps_cargadas = False
+_deps_lock = threading.Lock()
+
+
+def _cargar_dependencias() -> bool:
+    """
+    Importa las dependencias de biometría en el espacio de nombres del módulo.
+
+    Returns:
+        bool: True si están disponibles
+    """
+    global _deps_cargadas, DEPS_INSTALLED
+    global cv2, torch, torchvision, transforms
+    global efficientnet_b0, EfficientNet_B0_Weights, resnet50, ResNet50_Weights, create_feature_extractor
+    global KNeighborsClassifier, SVC, RandomForestClassifier, StandardScaler
+    global accuracy_score, precision_score, recall_score, f1_score, classification_report
+
+    if _deps_cargadas:
+        return True
+    if not DEPS_INSTALLED:
+        return False
+
+    with _deps_lock:
+        if _deps_cargadas:
+            return True
+        try:
+            import cv2
+            import torch
+            import torchvision
+            from torchvision import transforms
+            from torchvision.models import efficientnet_b0, EfficientNet_B0_Weights
+            from torchvision.models import resnet50, ResNet50_Weights
+            from torchvision.models.feature_extraction import create_feature_extractor
+            from sklearn.neighbors import KNeighborsClassifier
+            from sklearn.svm import SVC
+            from sklearn.ensemble import RandomForestClassifier
+            from sklearn.preprocessing import StandardScaler
+            from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, classification_report
+        except ImportError as e:
+            DEPS_INSTALLED = False
+            logging.warning(f"Dependencias de biometría no disponibles: {e}")
+            return False
+        _deps_cargadas = True
+    return True
+
+
 # Configuración de logging
 logger = logging.getLogger(__name__)
 
@@ -45,6 +90,9 @@ class BiometriaService:
     - Predicción de identidad de mascotas
     """
     
+    # Máximo de imágenes por pasada del extractor (limita la memoria en CPU/GPU)
+    TAMANO_LOTE_EXTRACCION = 32
+    
     def __init__(self, modelo_extractor: str = 'efficientnet_b0'):
         """
         Inicializa el servicio de biometría.
@@ -52,7 +100,7 @@ class BiometriaService:
         Args:
             modelo_extractor: Nombre del modelo a usar como extractor ('efficientnet_b0', 'resnet50', etc.)
         """
-        if not DEPS_INSTALLED:
+        if not _cargar_dependencias():
             logger.error("No se pueden inicializar modelos: faltan dependencias")
             return
             
@@ -62,6 +110,8 @@ class BiometriaService:
         self.preprocess = None
         self.clasificador = None
         self.dimension_embeddings = None
+        # Extractor exportado (TorchScript/ONNX) que reemplaza al eager en CPU (ver exportacion_extractor)
+        self.extractor_exportado = None
         
         # Inicializar el extractor de características
         self._initialize_feature_extractor()
@@ -122,11 +172,15 @@ class BiometriaService:
             imagen_input: Puede ser:
                 - Ruta al archivo de imagen (str o Path) - para archivos locales
                 - FileField de Django - para archivos en cualquier storage (local o Azure)
+                - ImagenDecodificada - reutiliza la decodificación ya hecha en el request
             
         Returns:
             Imagen como array numpy procesada
         """
         try:
+            if isinstance(imagen_input, ImagenDecodificada):
+                return imagen_input.rgb
+            
             # Si es un FileField de Django (compatible con cualquier storage backend)
             if hasattr(imagen_input, 'open'):
                 # Leer la imagen desde el storage (funciona con Azure, S3, local, etc.)
@@ -218,55 +272,65 @@ class BiometriaService:
         Returns:
             Vector de características (embedding)
         """
-        if not DEPS_INSTALLED:
+        return self.extraer_embeddings_batch([img])[0]
+    
+    def extraer_embeddings_batch(self, imagenes: List[ImageArray]) -> np.ndarray:
+        """
+        Extrae los embeddings de varias imágenes apilándolas en un solo tensor,
+        con una pasada hacia adelante por cada TAMANO_LOTE_EXTRACCION imágenes
+        
+        Args:
+            imagenes: Lista de imágenes como arrays numpy (pueden tener tamaños distintos)
+            
+        Returns:
+            Matriz (B, D) float32 con un embedding normalizado (L2) por imagen
+        """
+        if not _cargar_dependencias():
             raise ImportError("No se pueden extraer embeddings: faltan dependencias")
             
         if self.feature_extractor is None:
             self._initialize_feature_extractor()
         
-        # Preprocesar imagen
-        img_tensor = self.preprocess(img)
-        img_tensor = img_tensor.unsqueeze(0)  # Añadir dimensión de batch
-        img_tensor = img_tensor.to(self.device)
+        if not imagenes:
+            return np.empty((0, self.dimension_embeddings), dtype=np.float32)
+        
+        # Preprocesar todas las imágenes (Resize + CenterCrop dejan todas en 224x224)
+        tensores = [self.preprocess(img) for img in imagenes]
         
-        # Extraer características
+        bloques = []
         with torch.no_grad():
-            features = self.feature_extractor(img_tensor)
+            for inicio in range(0, len(tensores), self.TAMANO_LOTE_EXTRACCION):
+                lote = torch.stack(tensores[inicio:inicio + self.TAMANO_LOTE_EXTRACCION])
+                if self.extractor_exportado is not None:
+                    bloques.append(self.extractor_exportado(lote))
+                    continue
+                features = self.feature_extractor(lote.to(self.device))
+                bloques.append(features['flatten'].cpu().numpy())
         
-        # Obtener el tensor y convertirlo a numpy
-        feature_tensor = features['flatten']
-        embedding = feature_tensor.cpu().numpy().flatten()
+        embeddings = np.concatenate(bloques).astype(np.float32, copy=False)
+        embeddings = embeddings.reshape(len(imagenes), -1)
         
-        # Normalizar el embedding para mejorar la comparación
-        norm = np.linalg.norm(embedding)
-        if norm > 0:
-            embedding = embedding / norm
+        # Normalizar cada embedding para mejorar la comparación
+        normas = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        np.divide(embeddings, normas, out=embeddings, where=normas > 0)
         
-        return embedding
+        return embeddings
     
-    def extraer_multiples_embeddings(self, img: ImageArray, num_crops: int = 5) -> List[EmbeddingVector]:
+    def generar_crops(self, img: ImageArray, num_crops: int = 5) -> List[ImageArray]:
         """
-        Extrae múltiples embeddings de una imagen usando diferentes crops y augmentaciones
-        para generar más variabilidad en los datos de entrenamiento
+        Genera la imagen original más crops aleatorios con augmentaciones sutiles
         
         Args:
             img: Imagen como array numpy
-            num_crops: Número de crops diferentes a generar
+            num_crops: Número de crops diferentes a generar (incluye la original)
             
         Returns:
-            Lista de embeddings extraídos
+            Lista de imágenes; la primera es la original
         """
-        if not DEPS_INSTALLED:
-            raise ImportError("No se pueden extraer embeddings: faltan dependencias")
-            
-        embeddings = []
+        imagenes = [img]
         h, w = img.shape[:2]
         
-        # 1. Embedding de la imagen original
-        embedding_original = self.extraer_embedding(img)
-        embeddings.append(embedding_original)
-        
-        # 2. Generar crops aleatorios centrados en diferentes regiones
+        # Generar crops aleatorios centrados en diferentes regiones
         for i in range(num_crops - 1):
             # Generar crop aleatorio pero manteniendo aspectos importantes
             crop_size = min(h, w) * (0.7 + 0.2 * np.random.random())  # Entre 70% y 90% del tamaño
@@ -301,8 +365,27 @@ class BiometriaService:
                     brightness_factor = 0.9 + 0.2 * np.random.random()
                     crop_resized = np.clip(crop_resized * brightness_factor, 0, 255).astype(np.uint8)
                     
-                    embedding_crop = self.extraer_embedding(crop_resized)
-                    embeddings.append(embedding_crop)
+                    imagenes.append(crop_resized)
+        
+        return imagenes
+    
+    def extraer_multiples_embeddings(self, img: ImageArray, num_crops: int = 5) -> List[EmbeddingVector]:
+        """
+        Extrae múltiples embeddings de una imagen usando diferentes crops y augmentaciones
+        para generar más variabilidad en los datos de entrenamiento
+        
+        Args:
+            img: Imagen como array numpy
+            num_crops: Número de crops diferentes a generar
+            
+        Returns:
+            Lista de embeddings extraídos
+        """
+        if not _cargar_dependencias():
+            raise ImportError("No se pueden extraer embeddings: faltan dependencias")
+        
+        # Todos los crops en una sola pasada del extractor
+        embeddings = list(self.extraer_embeddings_batch(self.generar_crops(img, num_crops)))
         
         logger.info(f"Extraídos {len(embeddings)} embeddings de la imagen")
         return embeddings
@@ -345,7 +428,8 @@ class BiometriaService:
         else:
             raise ValueError(f"Tipo de modelo no soportado: {tipo_modelo}")
     
-    def entrenar_modelo(self, X: np.ndarray, y: np.ndarray, tipo_modelo: str = 'knn', **kwargs) -> Tuple[object, Dict]:
+    def entrenar_modelo(self, X: np.ndarray, y: np.ndarray, tipo_modelo: str = 'knn',
+                        evaluacion: Optional[Tuple[np.ndarray, np.ndarray]] = None, **kwargs) -> Tuple[object, Dict]:
         """
         Entrena un modelo clasificador con los embeddings proporcionados
         
@@ -353,6 +437,8 @@ class BiometriaService:
             X: Matriz de embeddings (cada fila es un embedding)
             y: Vector de etiquetas (IDs de mascotas)
             tipo_modelo: Tipo de modelo a entrenar ('knn', 'svm', 'rf')
+            evaluacion: (X, y) sobre los que calcular las métricas; por defecto el
+                conjunto de entrenamiento completo
             **kwargs: Parámetros adicionales para el clasificador
             
         Returns:
@@ -372,14 +458,15 @@ class BiometriaService:
         }
         
         # Si hay suficientes muestras, intentar hacer validación
-        if len(y) > 20 and len(np.unique(y)) > 1:
+        X_eval, y_eval = evaluacion if evaluacion is not None else (X, y)
+        if len(y) > 20 and len(np.unique(y)) > 1 and len(y_eval) > 0:
             try:
                 # Predicciones en el conjunto de entrenamiento (no ideal, pero informativo)
-                y_pred = clasificador.predict(X)
-                metricas['accuracy'] = accuracy_score(y, y_pred)
-                metricas['precision'] = precision_score(y, y_pred, average='weighted', zero_division=0)
-                metricas['recall'] = recall_score(y, y_pred, average='weighted', zero_division=0)
-                metricas['f1'] = f1_score(y, y_pred, average='weighted', zero_division=0)
+                y_pred = clasificador.predict(X_eval)
+                metricas['accuracy'] = accuracy_score(y_eval, y_pred)
+                metricas['precision'] = precision_score(y_eval, y_pred, average='weighted', zero_division=0)
+                metricas['recall'] = recall_score(y_eval, y_pred, average='weighted', zero_division=0)
+                metricas['f1'] = f1_score(y_eval, y_pred, average='weighted', zero_division=0)
             except Exception as e:
                 logger.warning(f"No se pudieron calcular métricas: {e}")
                 
@@ -424,69 +511,54 @@ class BiometriaService:
         Returns:
             Tuple con (ID de mascota predicha, confianza)
         """
-        if embedding_consulta.ndim == 1:
-            embedding_consulta = embedding_consulta.reshape(1, -1)
+        motor = MotorPuntuacion.desde_diccionario(embeddings_db)
+        return motor.predecir(embedding_consulta)[0]
+    
+    def predecir_con_indice(self, embedding_consulta: EmbeddingVector, indice) -> Tuple[int, float]:
+        """
+        Predice usando el índice de embeddings en memoria (ver indice_embeddings).
+        Aplica la misma puntuación que predecir_con_multiples_embeddings sobre
+        la matriz completa del índice.
         
-        # Calcular similitudes con todos los embeddings de cada mascota
-        mejores_puntuaciones = {}
+        Args:
+            embedding_consulta: Embedding de la imagen a identificar
+            indice: IndiceEmbeddings sincronizado con la BD
+            
+        Returns:
+            Tuple con (ID de mascota predicha, confianza)
+        """
+        return indice.motor_puntuacion().predecir(embedding_consulta)[0]
+    
+    def predecir_lote(self, embeddings_consulta: np.ndarray, indice) -> List[Tuple[int, float]]:
+        """
+        Predice varias imágenes (p. ej. varias capturas del escáner) en una sola pasada
         
-        for mascota_id, embeddings_mascota in embeddings_db.items():
-            if not embeddings_mascota:
-                continue
-                
-            # Calcular distancia coseno con cada embedding de esta mascota
-            similitudes = []
-            for emb in embeddings_mascota:
-                emb_array = np.array(emb).reshape(1, -1)
-                
-                # Distancia coseno (1 - similitud coseno)
-                dot_product = np.dot(embedding_consulta, emb_array.T)[0][0]
-                norm_consulta = np.linalg.norm(embedding_consulta)
-                norm_emb = np.linalg.norm(emb_array)
-                
-                if norm_consulta > 0 and norm_emb > 0:
-                    similitud_coseno = dot_product / (norm_consulta * norm_emb)
-                    similitudes.append(similitud_coseno)
-            
-            if similitudes:
-                # Usar el PROMEDIO de las mejores similitudes (top 3 o todas si son menos)
-                similitudes_ordenadas = sorted(similitudes, reverse=True)
-                top_similitudes = similitudes_ordenadas[:min(3, len(similitudes_ordenadas))]
-                similitud_promedio = np.mean(top_similitudes)
-                
-                # También considerar la consistencia (cuántos embeddings son similares)
-                umbral_similitud = 0.7  # Umbral para considerar un embedding como "similar"
-                embeddings_similares = sum(1 for sim in similitudes if sim >= umbral_similitud)
-                factor_consistencia = embeddings_similares / len(similitudes)
-                
-                # Puntuación final combinando similitud y consistencia
-                puntuacion = similitud_promedio * (0.8 + 0.2 * factor_consistencia)
-                mejores_puntuaciones[mascota_id] = puntuacion
-        
-        if not mejores_puntuaciones:
-            return -1, 0.0
-        
-        # Obtener la mejor puntuación
-        mascota_predicha = max(mejores_puntuaciones, key=mejores_puntuaciones.get)
-        mejor_similitud = mejores_puntuaciones[mascota_predicha]
-        
-        # Convertir similitud a confianza (0-1)
-        # Solo alta confianza si la similitud es muy alta
-        if mejor_similitud >= 0.85:  # Muy similar
-            confianza = min(0.98, mejor_similitud + 0.1)
-        elif mejor_similitud >= 0.75:  # Moderadamente similar
-            confianza = mejor_similitud * 0.9
-        else:  # Baja similitud
-            confianza = mejor_similitud * 0.6
-        
-        # Verificar que haya una diferencia clara con la segunda mejor opción
-        puntuaciones_ordenadas = sorted(mejores_puntuaciones.values(), reverse=True)
-        if len(puntuaciones_ordenadas) > 1:
-            diferencia = puntuaciones_ordenadas[0] - puntuaciones_ordenadas[1]
-            if diferencia < 0.1:  # Si la diferencia es muy pequeña, reducir confianza
-                confianza *= 0.7
-        
-        return mascota_predicha, float(np.clip(confianza, 0.0, 1.0))
+        Args:
+            embeddings_consulta: Matriz (B, D) con un embedding por imagen
+            indice: IndiceEmbeddings sincronizado con la BD
+            
+        Returns:
+            Lista de tuplas (ID de mascota predicha, confianza), una por imagen
+        """
+        return indice.motor_puntuacion().predecir(embeddings_consulta)
+    
+    def predecir_aproximado(self, embedding_consulta: EmbeddingVector, indice, nprobe: int = None) -> Tuple[int, float]:
+        """
+        Predice usando el índice aproximado IVF-PQ del índice en memoria
+        (ver indice_ivfpq). Solo se puntúan los candidatos del índice
+        aproximado más las filas agregadas después de la instantánea.
+        
+        Args:
+            embedding_consulta: Embedding de la imagen a identificar
+            indice: IndiceEmbeddings sincronizado con la BD
+            nprobe: Listas invertidas a recorrer (por defecto BIOMETRIA_IVF_NPROBE)
+            
+        Returns:
+            Tuple con (ID de mascota predicha, confianza)
+        """
+        if nprobe is None:
+            nprobe = getattr(settings, 'BIOMETRIA_IVF_NPROBE', None)
+        return indice.predecir_aproximado(embedding_consulta, nprobe=nprobe)[0]
     
     def predecir(self, modelo, embedding: EmbeddingVector) -> Tuple[int, float]:
         """
@@ -512,13 +584,118 @@ class BiometriaService:
 
 
 
-def actualizar_modelo_global(tipo_modelo='knn', extractor='efficientnet_b0', **kwargs):
+def _cargar_vectores_entrenamiento(queryset):
+    """
+    Decodifica los vectores de un queryset de EmbeddingStore sin instanciar modelos
+    
+    Returns:
+        Tuple con (ids, etiquetas, X) como arrays numpy
+    """
+    ids, etiquetas, vectores = [], [], []
+    filas = queryset.order_by('id').values_list('id', 'mascota_id', 'vector_binario', 'vector')
+    for emb_id, mascota_id, binario, legado in filas.iterator(chunk_size=2000):
+        try:
+            vector = vector_desde_campos(binario, legado)
+        except ValueError as e:
+            logger.warning(f"Embedding {emb_id} con vector inválido: {e}")
+            continue
+        if vector is None:
+            continue
+        ids.append(emb_id)
+        etiquetas.append(mascota_id)
+        vectores.append(vector)
+    
+    if not vectores:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), None
+    
+    X = np.stack(vectores).astype(np.float32, copy=False)
+    return np.array(ids, dtype=np.int64), np.array(etiquetas, dtype=np.int64), X
+
+
+def _datos_entrenamiento_incremental(tipo_modelo, extractor):
+    """
+    Arma el conjunto de entrenamiento partiendo de la instantánea del modelo
+    activo: conserva sus vectores (sin decodificarlos desde la BD), retira los
+    de embeddings borrados y agrega solo los que aún no se usaron en entrenamiento.
+    
+    Returns:
+        dict con ids, X, y del conjunto completo e ids_nuevos, X_nuevos, y_nuevos
+        del delta, o None si no se puede entrenar de forma incremental
+    """
+    from ..models import ModeloGlobal, EmbeddingStore
+    from .snapshot_embeddings import cargar_snapshot
+    
+    if tipo_modelo != 'knn':
+        logger.info(f"Entrenamiento incremental no disponible para '{tipo_modelo}', se entrena completo")
+        return None
+    
+    anterior = (
+        ModeloGlobal.objects
+        .filter(activo=True, extractor_caracteristicas=extractor, tipo_modelo='knn')
+        .order_by('-version')
+        .first()
+    )
+    snapshot = cargar_snapshot(extractor, anterior.version) if anterior else None
+    if snapshot is None:
+        logger.info("No hay instantánea del modelo activo, se entrena completo")
+        return None
+    
+    ids_base = np.asarray(snapshot['ids'])
+    etiquetas_base = np.asarray(snapshot['etiquetas'])
+    matriz_base = snapshot['matriz']
+    omitidos = np.array(snapshot['manifiesto'].get('omitidos', []), dtype=np.int64)
+    
+    del_extractor = EmbeddingStore.objects.filter(modelo_extractor=extractor)
+    usados = del_extractor.filter(usado_en_entrenamiento=True)
+    
+    # Solo si el conteo no cuadra se revisan los ids (sin leer vectores)
+    conservar = slice(None)
+    faltantes = []
+    if usados.count() != ids_base.size + omitidos.size:
+        ids_vigentes = np.fromiter(usados.values_list('id', flat=True).iterator(), dtype=np.int64)
+        conservar = np.isin(ids_base, ids_vigentes)
+        # Marcados como usados pero ausentes de la instantánea: se tratan como nuevos
+        faltantes = np.setdiff1d(ids_vigentes, np.concatenate([ids_base, omitidos])).tolist()
+        logger.info(
+            f"Entrenamiento incremental: {int((~conservar).sum())} vectores retirados, "
+            f"{len(faltantes)} recuperados"
+        )
+    
+    nuevos = del_extractor.filter(usado_en_entrenamiento=False)
+    if faltantes:
+        nuevos = del_extractor.filter(Q(usado_en_entrenamiento=False) | Q(id__in=faltantes))
+    ids_nuevos, y_nuevos, X_nuevos = _cargar_vectores_entrenamiento(nuevos)
+    
+    ids_base, etiquetas_base, matriz_base = ids_base[conservar], etiquetas_base[conservar], matriz_base[conservar]
+    if X_nuevos is None:
+        X = np.array(matriz_base, dtype=np.float32)
+    else:
+        X = np.concatenate([matriz_base, X_nuevos]).astype(np.float32, copy=False)
+    
+    return {
+        'ids': np.concatenate([ids_base, ids_nuevos]),
+        'X': X,
+        'y': np.concatenate([etiquetas_base, y_nuevos]),
+        'ids_nuevos': ids_nuevos,
+        'X_nuevos': X_nuevos,
+        'y_nuevos': y_nuevos,
+        'version_base': anterior.version,
+        'metricas_base': anterior.metricas or {},
+    }
+
+
+def actualizar_modelo_global(tipo_modelo='knn', extractor='efficientnet_b0', incremental=False, **kwargs):
     """
     Actualiza el modelo global de reconocimiento entrenándolo con todos los embeddings disponibles
     
     Args:
         tipo_modelo: Tipo de clasificador ('knn', 'svm', 'rf')
         extractor: Modelo extractor de características ('efficientnet_b0', 'resnet50')
+        incremental: Si es True (solo KNN) parte de la instantánea del modelo activo y
+            solo decodifica los embeddings con usado_en_entrenamiento=False. Solo esa
+            lectura es proporcional al delta: la copia de la matriz base, el ajuste y
+            la subida del clasificador, la instantánea y el índice IVF-PQ se rehacen
+            sobre todas las filas
         **kwargs: Parámetros adicionales para el clasificador
         
     Returns:
@@ -528,43 +705,54 @@ def actualizar_modelo_global(tipo_modelo='knn', extractor='efficientnet_b0', **k
     from ..models import ModeloGlobal, EmbeddingStore, Mascota
     
     # Verificar dependencias
-    if not DEPS_INSTALLED:
+    if not _cargar_dependencias():
         logger.error("No se puede actualizar el modelo: faltan dependencias")
         return None
         
-    # Crear servicio de biometría
-    servicio = BiometriaService(modelo_extractor=extractor)
+    # Servicio de biometría (extractor en caché del proceso)
+    from .registro_modelos import get_registro_modelos
+    servicio = get_registro_modelos().obtener_servicio(extractor)
     
-    # Obtener TODOS los embeddings disponibles (tanto usados como no usados)
-    # para entrenar un modelo completo con todas las mascotas
-    embeddings = EmbeddingStore.objects.all()
+    # Embeddings del extractor del modelo (los de otros extractores no son comparables)
+    embeddings = EmbeddingStore.objects.filter(modelo_extractor=extractor)
     
     # Si no hay suficientes embeddings, salir
     if embeddings.count() < 5:
         logger.warning("No hay suficientes embeddings para entrenar el modelo global")
         return None
-        
-    # Debug: Log qué mascotas están siendo incluidas en el entrenamiento
-    mascotas_en_entrenamiento = set()
-    for emb in embeddings:
-        mascotas_en_entrenamiento.add(emb.mascota.id)
-    logger.info(f"Entrenando modelo con {len(mascotas_en_entrenamiento)} mascotas: {list(mascotas_en_entrenamiento)}")
-    logger.info(f"Total embeddings para entrenamiento: {embeddings.count()}")
-        
-    # Preparar datos para entrenamiento
-    X = []  # Matriz de embeddings
-    y = []  # Vector de IDs de mascota
     
-    for emb in embeddings:
-        vector = np.array(emb.vector)
-        X.append(vector)
-        y.append(emb.mascota_id)
-        
-    X = np.array(X)
-    y = np.array(y)
+    datos = _datos_entrenamiento_incremental(tipo_modelo, extractor) if incremental else None
+    
+    if datos is not None:
+        ids, X, y = datos['ids'], datos['X'], datos['y']
+        ids_nuevos = datos['ids_nuevos']
+        # Las métricas se calculan solo sobre el delta
+        if datos['X_nuevos'] is not None:
+            evaluacion = (datos['X_nuevos'], datos['y_nuevos'])
+        else:
+            evaluacion = (X[:0], y[:0])
+        logger.info(
+            f"Entrenamiento incremental sobre v{datos['version_base']}: "
+            f"{len(datos['ids_nuevos'])} embeddings nuevos, {len(ids)} en total"
+        )
+    else:
+        ids, y, X = _cargar_vectores_entrenamiento(embeddings)
+        ids_nuevos = None
+        evaluacion = None
+        if X is None or len(y) < 5:
+            logger.warning("No hay suficientes embeddings válidos para entrenar el modelo global")
+            return None
+    
+    logger.info(f"Entrenando modelo con {len(np.unique(y))} mascotas y {len(y)} embeddings")
     
     # Entrenar el modelo
-    clasificador, metricas = servicio.entrenar_modelo(X, y, tipo_modelo, **kwargs)
+    clasificador, metricas = servicio.entrenar_modelo(X, y, tipo_modelo, evaluacion=evaluacion, **kwargs)
+    metricas['incremental'] = ids_nuevos is not None
+    if ids_nuevos is not None:
+        # Sin delta que evaluar se conservan las métricas del modelo anterior
+        for clave in ('accuracy', 'precision', 'recall', 'f1'):
+            if clave not in metricas and clave in datos['metricas_base']:
+                metricas[clave] = datos['metricas_base'][clave]
     
     # Guardar el modelo en memoria primero
     import io
@@ -602,14 +790,39 @@ def actualizar_modelo_global(tipo_modelo='knn', extractor='efficientnet_b0', **k
     # Asignar archivo al FileField desde el buffer (compatible con Azure)
     modelo_global.modelo_file.save(nombre_archivo, ContentFile(buffer.getvalue()))
     
-    # Marcar embeddings como usados en entrenamiento
-    embeddings.update(usado_en_entrenamiento=True)
+    # Índice aproximado de la versión; se publica antes que la instantánea para
+    # que los workers lo encuentren al cambiar a ella
+    from .indice_embeddings import backend_busqueda
+    if backend_busqueda() == 'ivfpq':
+        try:
+            from .indice_ivfpq import IndiceIVFPQ
+            validas = np.linalg.norm(X, axis=1) > 0
+            IndiceIVFPQ(
+                nprobe=getattr(settings, 'BIOMETRIA_IVF_NPROBE', 8),
+            ).construir(ids[validas], y[validas], X[validas]).guardar(extractor, version)
+        except Exception as e:
+            logger.error(f"No se pudo construir el índice IVF-PQ v{version}: {e}")
+    
+    # Publicar la matriz de esta versión para que los workers la abran con memory-mapping
+    try:
+        from .snapshot_embeddings import escribir_snapshot
+        escribir_snapshot(extractor, version, ids, y, X)
+    except Exception as e:
+        logger.error(f"No se pudo escribir la instantánea de embeddings v{version}: {e}")
     
-    # Actualizar estado de mascotas
-    for mascota_id in np.unique(y):
-        mascota = Mascota.objects.get(id=mascota_id)
-        mascota.biometria_entrenada = True
-        mascota.save()
+    # Marcar los embeddings usados y las mascotas entrenadas en una sola transacción
+    with transaction.atomic():
+        if ids_nuevos is not None:
+            if len(ids_nuevos):
+                EmbeddingStore.objects.filter(id__in=ids_nuevos.tolist()).update(usado_en_entrenamiento=True)
+        elif len(ids):
+            embeddings.filter(id__lte=int(ids.max()), usado_en_entrenamiento=False).update(usado_en_entrenamiento=True)
+        
+        # Un solo UPDATE para todas las mascotas (solo las que cambian de estado)
+        Mascota.objects.filter(
+            id__in=np.unique(y).tolist(),
+            biometria_entrenada=False
+        ).update(biometria_entrenada=True, updated_at=timezone.now())
         
     logger.info(f"Modelo global actualizado: v{version} ({tipo_modelo}) - {metricas.get('num_clases', 0)} mascotas")
     
@@ -626,65 +839,130 @@ def procesar_imagen_mascota(imagen_mascota_id):
     Returns:
         List[EmbeddingStore]: Lista de objetos de embedding creados
     """
+    return procesar_imagenes_mascota([imagen_mascota_id]).get(imagen_mascota_id)
+
+
+def procesar_imagenes_mascota(imagenes_ids, num_crops=4):
+    """
+    Procesa varias imágenes de mascota extrayendo los embeddings de todos sus
+    crops en lotes (una pasada del extractor por lote en lugar de una por crop)
+    
+    Args:
+        imagenes_ids: IDs de ImagenMascota a procesar
+        num_crops: Crops por imagen (incluye la original)
+        
+    Returns:
+        dict: {imagen_id: List[EmbeddingStore] o None si no se procesó}
+    """
     # Importamos aquí para evitar referencias circulares
     from ..models import ImagenMascota, EmbeddingStore
+    from .indice_embeddings import registrar_embeddings
+    from .registro_modelos import get_registro_modelos
+    
+    resultados = {imagen_id: None for imagen_id in imagenes_ids}
     
     # Verificar dependencias
-    if not DEPS_INSTALLED:
+    if not _cargar_dependencias():
         logger.error("No se puede procesar imagen: faltan dependencias")
-        return None
-        
-    # Obtener la imagen
-    imagen = ImagenMascota.objects.get(id=imagen_mascota_id)
+        return resultados
     
-    # Si no es biométrica o ya está procesada, salir
-    if not imagen.is_biometrica or imagen.procesada:
-        logger.info(f"Imagen {imagen_mascota_id} no requiere procesamiento")
-        return None
+    # Servicio con el extractor ya inicializado (se reutiliza entre imágenes)
+    servicio = get_registro_modelos().obtener_servicio()
+    
+    imagenes = ImagenMascota.objects.select_related('mascota').in_bulk(list(imagenes_ids))
+    
+    # 1. Decodificar, recortar y generar los crops de cada imagen
+    pendientes = []  # [(imagen, crops)]
+    for imagen_id in imagenes_ids:
+        imagen = imagenes.get(imagen_id)
+        if imagen is None:
+            logger.warning(f"Imagen {imagen_id} no existe")
+            continue
+        
+        # Si no es biométrica o ya está procesada, saltar
+        if not imagen.is_biometrica or imagen.procesada:
+            logger.info(f"Imagen {imagen_id} no requiere procesamiento")
+            continue
         
-    # Crear servicio
-    servicio = BiometriaService()
+        try:
+            # Descargar (compatible con Azure) y decodificar la imagen una sola vez
+            img = servicio.procesar_imagen(ImagenDecodificada.desde_archivo(imagen.imagen))
+            
+            # Detectar mascota en la imagen
+            img_recortada, coords = servicio.detectar_mascota(img)
+            
+            # Validar que la imagen recortada sea de calidad suficiente
+            if img_recortada.shape[0] < 64 or img_recortada.shape[1] < 64:
+                logger.warning(f"Imagen {imagen_id} demasiado pequeña después del recorte")
+                img_recortada = img  # Usar imagen original si el recorte es muy pequeño
+            
+            pendientes.append((imagen, servicio.generar_crops(img_recortada, num_crops)))
+        except Exception as e:
+            logger.error(f"Error procesando imagen {imagen_id}: {e}")
+    
+    if not pendientes:
+        return resultados
     
-    # Procesar imagen
+    # 2. Extraer los embeddings de todos los crops en lotes
     try:
-        # Cargar y preprocesar imagen - usar el FileField directamente (compatible con Azure)
-        img = servicio.procesar_imagen(imagen.imagen)
-        
-        # Detectar mascota en la imagen
-        img_recortada, coords = servicio.detectar_mascota(img)
-        
-        # Validar que la imagen recortada sea de calidad suficiente
-        if img_recortada.shape[0] < 64 or img_recortada.shape[1] < 64:
-            logger.warning(f"Imagen {imagen_mascota_id} demasiado pequeña después del recorte")
-            img_recortada = img  # Usar imagen original si el recorte es muy pequeño
-        
-        # Extraer múltiples embeddings para mayor robustez
-        embeddings = servicio.extraer_multiples_embeddings(img_recortada, num_crops=4)
-        
-        # Guardar todos los embeddings
-        embedding_stores = []
-        for i, embedding in enumerate(embeddings):
-            embedding_store = EmbeddingStore.objects.create(
-                mascota=imagen.mascota,
-                imagen=imagen,
-                vector=embedding.tolist(),  # Convertir a lista para JSONField
-                dimension=len(embedding),
-                modelo_extractor=servicio.modelo_extractor,
-                crop_index=i  # Índice del crop para identificación
+        todos_los_crops = [crop for _, crops in pendientes for crop in crops]
+        matriz = servicio.extraer_embeddings_batch(todos_los_crops)
+    except Exception as e:
+        logger.error(f"Error extrayendo embeddings de {len(pendientes)} imágenes: {e}")
+        return resultados
+    
+    # 3. Guardar los embeddings de todas las imágenes con un número fijo de consultas
+    try:
+        with transaction.atomic():
+            # Bloquear las imágenes: las que otro worker (o un reintento) ya procesó se omiten
+            sin_procesar = set(
+                ImagenMascota.objects.select_for_update()
+                .filter(id__in=[imagen.id for imagen, _ in pendientes], procesada=False)
+                .values_list('id', flat=True)
             )
-            embedding_stores.append(embedding_store)
-        
-        # Marcar imagen como procesada
-        imagen.procesada = True
-        imagen.calidad = 0.9 if len(embeddings) >= 3 else 0.7  # Calidad basada en número de embeddings
-        imagen.save()
-        
-        logger.info(f"Extraídos {len(embeddings)} embeddings para imagen {imagen_mascota_id}")
-        return embedding_stores
-        
+            
+            embedding_stores = []
+            imagenes_procesadas = []
+            inicio = 0
+            for imagen, crops in pendientes:
+                embeddings = matriz[inicio:inicio + len(crops)]
+                inicio += len(crops)
+                
+                if imagen.id not in sin_procesar:
+                    logger.info(f"Imagen {imagen.id} ya fue procesada por otro proceso")
+                    continue
+                
+                for i, embedding in enumerate(embeddings):
+                    embedding_store = EmbeddingStore(
+                        mascota=imagen.mascota,
+                        imagen=imagen,
+                        modelo_extractor=servicio.modelo_extractor,
+                        crop_index=i  # Índice del crop para identificación
+                    )
+                    embedding_store.asignar_vector(embedding)  # Binario con cabecera de tipo y dimensión
+                    embedding_stores.append(embedding_store)
+                
+                # Marcar imagen como procesada
+                imagen.procesada = True
+                imagen.calidad = 0.9 if len(embeddings) >= 3 else 0.7  # Calidad basada en número de embeddings
+                imagenes_procesadas.append(imagen)
+            
+            EmbeddingStore.objects.bulk_create(embedding_stores, batch_size=500)
+            ImagenMascota.objects.bulk_update(imagenes_procesadas, ['procesada', 'calidad'])
     except Exception as e:
-        logger.error(f"Error procesando imagen {imagen_mascota_id}: {e}")
-        return None
+        logger.error(f"Error guardando embeddings de {len(pendientes)} imágenes: {e}")
+        return resultados
+    
+    # Reflejar los nuevos vectores en el índice en memoria de este proceso
+    registrar_embeddings(embedding_stores)
+    
+    for emb in embedding_stores:
+        if resultados[emb.imagen_id] is None:
+            resultados[emb.imagen_id] = []
+        resultados[emb.imagen_id].append(emb)
+    
+    logger.info(f"Extraídos {len(embedding_stores)} embeddings para {len(imagenes_procesadas)} imágenes")
+    return resultados
 
 
 def reconocer_mascota(ruta_imagen, usuario=None):
@@ -692,7 +970,7 @@ def reconocer_mascota(ruta_imagen, usuario=None):
     Reconoce una mascota a partir de una imagen
     
     Args:
-        ruta_imagen: Ruta a la imagen a analizar
+        ruta_imagen: Ruta a la imagen a analizar o ImagenDecodificada ya leída en el request
         usuario: Usuario que realiza el reconocimiento (opcional)
         
     Returns:
@@ -700,11 +978,9 @@ def reconocer_mascota(ruta_imagen, usuario=None):
     """
     # Importamos aquí para evitar referencias circulares
     from ..models import ModeloGlobal, Mascota, RegistroReconocimiento
-    import os
-    from django.core.files import File
     
     # Verificar dependencias
-    if not DEPS_INSTALLED:
+    if not _cargar_dependencias():
         return {"error": "No se pueden hacer reconocimientos: faltan dependencias"}
     
     # Obtener modelo activo
@@ -712,18 +988,20 @@ def reconocer_mascota(ruta_imagen, usuario=None):
     if not modelo_global or not modelo_global.modelo_file:
         return {"error": "No hay modelo global activo"}
         
-    # Crear servicio con el extractor correcto
-    servicio = BiometriaService(modelo_extractor=modelo_global.extractor_caracteristicas)
-    
     # Medir tiempo de procesamiento
     inicio = time.time()
     
     try:
-        # Cargar modelo desde Azure Storage o local storage
-        clasificador = servicio.cargar_modelo(modelo_global.modelo_file)
-        
-        # Procesar imagen
-        img = servicio.procesar_imagen(ruta_imagen)
+        # Servicio y clasificador en caché del proceso; solo se cargan desde
+        # Azure Storage o local storage la primera vez para esta versión
+        from .registro_modelos import get_registro_modelos
+        registro_modelos = get_registro_modelos()
+        modelo_en_cache = registro_modelos.esta_cargado(modelo_global)
+        servicio, clasificador = registro_modelos.obtener(modelo_global)
+        
+        # Leer y decodificar la imagen una sola vez (se reutilizan sus bytes al guardar el registro)
+        imagen = ImagenDecodificada.desde_archivo(ruta_imagen)
+        img = servicio.procesar_imagen(imagen)
         img_recortada, coords = servicio.detectar_mascota(img)
         
         # Verificar que se detectó correctamente una cara de mascota
@@ -734,30 +1012,22 @@ def reconocer_mascota(ruta_imagen, usuario=None):
         if img_recortada.shape[0] < 50 or img_recortada.shape[1] < 50:
             return {"error": "La región detectada es demasiado pequeña para ser una mascota"}
             
-        # Obtener TODOS los embeddings reales de la base de datos
-        from ..models import EmbeddingStore
-        embeddings_db = {}
-        
-        # Agrupar embeddings por mascota_id
-        todos_los_embeddings = EmbeddingStore.objects.select_related('mascota').all()
-        for emb_store in todos_los_embeddings:
-            mascota_id = emb_store.mascota_id
-            if mascota_id not in embeddings_db:
-                embeddings_db[mascota_id] = []
-            embeddings_db[mascota_id].append(emb_store.vector)
+        # Índice en memoria con los embeddings del extractor del modelo activo.
+        # Solo consulta la BD para cargar cambios desde el último escaneo.
+        from .indice_embeddings import get_indice_embeddings
+        indice = get_indice_embeddings(modelo_global.extractor_caracteristicas)
+        indice.sincronizar()
         
-        logger.info(f"Cargados embeddings de {len(embeddings_db)} mascotas para predicción")
-        for mid, embs in embeddings_db.items():
-            logger.info(f"Mascota {mid}: {len(embs)} embeddings")
+        logger.info(f"Índice de embeddings con {indice.total} vectores para predicción")
         
         # Extraer embedding de la imagen a identificar
         embedding_consulta = servicio.extraer_embedding(img_recortada)
         
         # Usar predicción con múltiples embeddings si hay datos suficientes
-        if embeddings_db and len(embeddings_db) > 0:
-            mascota_id, confianza = servicio.predecir_con_multiples_embeddings(
-                clasificador, embedding_consulta, embeddings_db
-            )
+        if indice.total > 0 and indice.ann is not None:
+            mascota_id, confianza = servicio.predecir_aproximado(embedding_consulta, indice)
+        elif indice.total > 0:
+            mascota_id, confianza = servicio.predecir_con_indice(embedding_consulta, indice)
         else:
             # Fallback al método tradicional si no hay embeddings en BD
             mascota_id, confianza = servicio.predecir(clasificador, embedding_consulta)
@@ -788,11 +1058,10 @@ def reconocer_mascota(ruta_imagen, usuario=None):
                 exito = False
         
         # Guardar la imagen analizada en el registro
-        with open(ruta_imagen, 'rb') as f:
-            registro.imagen_analizada.save(
-                os.path.basename(ruta_imagen),
-                File(f)
-            )
+        registro.imagen_analizada.save(
+            imagen.nombre or f"reconocimiento_{int(time.time())}.jpg",
+            ContentFile(imagen.contenido)
+        )
         
         # Guardar detalles
         registro.detalles = {
@@ -800,7 +1069,8 @@ def reconocer_mascota(ruta_imagen, usuario=None):
             'confianza': confianza,
             'umbral_aplicado': umbral_confianza,
             'tipo_modelo': modelo_global.tipo_modelo,
-            'modelo_version': modelo_global.version
+            'modelo_version': modelo_global.version,
+            'modelo_en_cache': modelo_en_cache
         }
         
         # Guardar registro
@@ -5,9 +5,12 @@ Detecta si una imagen contiene un perro de cualquier raza usando modelos pre-ent
 """
 
 import logging
-from typing import Dict, Union, Any
+from typing import Any, Dict, List, Optional, Union
 from io import BytesIO
 
+from .carga_diferida import diferido
+from .imagen_decodificada import ImagenDecodificada
+
 logger = logging.getLogger(__name__)
 
 # Importaciones condicionales
@@ -34,6 +37,9 @@ class CanineValidator:
     # Umbral mínimo de confianza para considerar válida la detección
     MIN_CONFIDENCE = 30.0  # 30%
     
+    # Clave del tensor preprocesado (Resize 256 + CenterCrop 224) en ImagenDecodificada
+    CLAVE_PREPROCESADO = 'imagenet_256_224'
+    
     def __init__(self):
         """Inicializa el validador con el modelo ImageNet."""
         if not DEPS_INSTALLED:
@@ -78,6 +84,7 @@ class CanineValidator:
                 - str: Path al archivo de imagen
                 - PIL.Image: Objeto de imagen PIL
                 - Django UploadedFile: Archivo subido
+                - ImagenDecodificada: Imagen ya decodificada (reutiliza su tensor)
                 
         Returns:
             dict: {
@@ -91,77 +98,142 @@ class CanineValidator:
         if not DEPS_INSTALLED or self.model is None:
             # Si no hay dependencias, asumir válido (modo degradado)
             logger.warning("Validación canina deshabilitada - faltan dependencias")
-            return {
-                'es_canino': True,
-                'confianza': 100.0,
-                'clase_id': None,
-                'objeto_detectado': 'Validación deshabilitada',
-                'mensaje': 'Sistema de validación no disponible - imagen aceptada por defecto'
-            }
+            return self._resultado_deshabilitado()
         
         try:
-            # Cargar imagen según el tipo de input
-            img = self._cargar_imagen(imagen_input)
-            
-            if img is None:
-                return {
-                    'es_canino': False,
-                    'confianza': 0.0,
-                    'clase_id': None,
-                    'objeto_detectado': 'Error',
-                    'mensaje': 'No se pudo cargar la imagen'
-                }
-            
-            # Transformar imagen y hacer predicción
-            img_tensor = self.transform(img).unsqueeze(0)
+            img_tensor = self._tensor_imagen(imagen_input)
+            if img_tensor is None:
+                return self._resultado_error('No se pudo cargar la imagen')
             
             with torch.no_grad():
-                output = self.model(img_tensor)
+                output = self.model(img_tensor.unsqueeze(0))
                 probabilities = torch.nn.functional.softmax(output[0], dim=0)
             
-            # Obtener top-1 predicción
-            top_prob, top_class = probabilities.max(0)
-            top_prob = top_prob.item() * 100  # Convertir a porcentaje
-            top_class = top_class.item()
-            
-            # Verificar si está en el rango de clases de perros (151-268)
-            es_perro = self.DOG_CLASSES_RANGE[0] <= top_class <= self.DOG_CLASSES_RANGE[1]
-            
-            # Obtener nombre de la clase
-            nombre_clase = IMAGENET_CLASSES.get(top_class, f'Clase_{top_class}')
-            
-            # Validar confianza mínima
-            confianza_suficiente = top_prob >= self.MIN_CONFIDENCE
-            
-            # Construir resultado
-            if es_perro and confianza_suficiente:
-                mensaje = f'Canino detectado: {nombre_clase}'
-                logger.info(f"✓ Validación exitosa: {nombre_clase} ({top_prob:.1f}%)")
-            elif es_perro and not confianza_suficiente:
-                mensaje = f'Canino detectado pero con baja confianza ({top_prob:.1f}%)'
-                logger.warning(f"⚠ Confianza baja: {nombre_clase} ({top_prob:.1f}%)")
-            else:
-                mensaje = f'No es un canino. Detectado: {nombre_clase}'
-                logger.info(f"✗ Imagen rechazada: {nombre_clase} ({top_prob:.1f}%)")
-            
-            return {
-                'es_canino': es_perro and confianza_suficiente,
-                'confianza': round(top_prob, 2),
-                'clase_id': top_class,
-                'objeto_detectado': nombre_clase,
-                'mensaje': mensaje
-            }
+            return self._resultado_desde_probabilidades(probabilities)
             
         except Exception as e:
             logger.error(f"Error durante validación de imagen: {e}", exc_info=True)
             # En caso de error, rechazar la imagen por seguridad
-            return {
-                'es_canino': False,
-                'confianza': 0.0,
-                'clase_id': None,
-                'objeto_detectado': 'Error',
-                'mensaje': f'Error al procesar imagen: {str(e)}'
-            }
+            return self._resultado_error(f'Error al procesar imagen: {str(e)}')
+    
+    def validar_lote(self, imagenes: List[Any]) -> List[Dict]:
+        """
+        Valida varias imágenes con una sola pasada del modelo.
+        
+        Args:
+            imagenes: Lista de inputs aceptados por validar_imagen
+                (UploadedFile, bytes, path, PIL.Image o ImagenDecodificada)
+                
+        Returns:
+            list: Un resultado (mismo formato que validar_imagen) por imagen, en el mismo orden.
+                Las imágenes que no se pueden cargar se rechazan sin afectar al resto.
+        """
+        if not imagenes:
+            return []
+        
+        if not DEPS_INSTALLED or self.model is None:
+            logger.warning("Validación canina deshabilitada - faltan dependencias")
+            return [self._resultado_deshabilitado() for _ in imagenes]
+        
+        resultados: List[Optional[Dict]] = [None] * len(imagenes)
+        tensores, posiciones = [], []
+        for i, imagen_input in enumerate(imagenes):
+            try:
+                img_tensor = self._tensor_imagen(imagen_input)
+            except Exception as e:
+                logger.error(f"Error al preparar imagen {i} del lote: {e}", exc_info=True)
+                resultados[i] = self._resultado_error(f'Error al procesar imagen: {str(e)}')
+                continue
+            if img_tensor is None:
+                resultados[i] = self._resultado_error('No se pudo cargar la imagen')
+                continue
+            tensores.append(img_tensor)
+            posiciones.append(i)
+        
+        if tensores:
+            try:
+                with torch.no_grad():
+                    output = self.model(torch.stack(tensores))
+                    probabilities = torch.nn.functional.softmax(output, dim=1)
+                
+                for fila, i in enumerate(posiciones):
+                    resultados[i] = self._resultado_desde_probabilidades(probabilities[fila])
+            except Exception as e:
+                logger.error(f"Error durante validación del lote: {e}", exc_info=True)
+                for i in posiciones:
+                    resultados[i] = self._resultado_error(f'Error al procesar imagen: {str(e)}')
+        
+        logger.info(f"Lote de {len(imagenes)} imágenes validado con una pasada del modelo")
+        return resultados
+    
+    def _tensor_imagen(self, imagen_input: Union[bytes, str, Any]):
+        """Tensor normalizado (3, 224, 224) de la imagen, o None si no se pudo cargar"""
+        if isinstance(imagen_input, ImagenDecodificada):
+            # El tensor queda en la imagen para las siguientes etapas del request
+            return imagen_input.preprocesado(self.CLAVE_PREPROCESADO, self.transform)
+        
+        # Cargar imagen según el tipo de input
+        img = self._cargar_imagen(imagen_input)
+        if img is None:
+            return None
+        return self.transform(img)
+    
+    def _resultado_desde_probabilidades(self, probabilities) -> Dict:
+        """Construye el resultado de validación a partir del softmax de una imagen"""
+        # Obtener top-1 predicción
+        top_prob, top_class = probabilities.max(0)
+        top_prob = top_prob.item() * 100  # Convertir a porcentaje
+        top_class = top_class.item()
+        
+        # Verificar si está en el rango de clases de perros (151-268)
+        es_perro = self.DOG_CLASSES_RANGE[0] <= top_class <= self.DOG_CLASSES_RANGE[1]
+        
+        # Obtener nombre de la clase
+        nombre_clase = IMAGENET_CLASSES.get(top_class, f'Clase_{top_class}')
+        
+        # Validar confianza mínima
+        confianza_suficiente = top_prob >= self.MIN_CONFIDENCE
+        
+        # Construir resultado
+        if es_perro and confianza_suficiente:
+            mensaje = f'Canino detectado: {nombre_clase}'
+            logger.info(f"✓ Validación exitosa: {nombre_clase} ({top_prob:.1f}%)")
+        elif es_perro and not confianza_suficiente:
+            mensaje = f'Canino detectado pero con baja confianza ({top_prob:.1f}%)'
+            logger.warning(f"⚠ Confianza baja: {nombre_clase} ({top_prob:.1f}%)")
+        else:
+            mensaje = f'No es un canino. Detectado: {nombre_clase}'
+            logger.info(f"✗ Imagen rechazada: {nombre_clase} ({top_prob:.1f}%)")
+        
+        return {
+            'es_canino': es_perro and confianza_suficiente,
+            'confianza': round(top_prob, 2),
+            'clase_id': top_class,
+            'objeto_detectado': nombre_clase,
+            'mensaje': mensaje
+        }
+    
+    @staticmethod
+    def _resultado_error(mensaje: str) -> Dict:
+        """Resultado de una imagen rechazada por error"""
+        return {
+            'es_canino': False,
+            'confianza': 0.0,
+            'clase_id': None,
+            'objeto_detectado': 'Error',
+            'mensaje': mensaje
+        }
+    
+    @staticmethod
+    def _resultado_deshabilitado() -> Dict:
+        """Resultado en modo degradado (sin dependencias): la imagen se acepta"""
+        return {
+            'es_canino': True,
+            'confianza': 100.0,
+            'clase_id': None,
+            'objeto_detectado': 'Validación deshabilitada',
+            'mensaje': 'Sistema de validación no disponible - imagen aceptada por defecto'
+        }
     
     def _cargar_imagen(self, imagen_input: Union[bytes, str, Any]) -> Image.Image:
         """
@@ -178,6 +250,10 @@ class CanineValidator:
             if isinstance(imagen_input, Image.Image):
                 return imagen_input.convert('RGB')
             
+            # Si ya se decodificó en otra etapa del request
+            elif isinstance(imagen_input, ImagenDecodificada):
+                return imagen_input.pil
+            
             # Si es bytes
             elif isinstance(imagen_input, bytes):
                 return Image.open(BytesIO(imagen_input)).convert('RGB')
@@ -371,8 +447,8 @@ IMAGENET_CLASSES = {
 }
 
 
-# Instancia global singleton (lazy loading)
-_validator_instance = None
+# Instancia global singleton (se carga en el primer uso)
+_validator = diferido('validador_canino', CanineValidator)
 
 
 def get_validator() -> CanineValidator:
@@ -383,7 +459,4 @@ def get_validator() -> CanineValidator:
     Returns:
         CanineValidator: Instancia del validador
     """
-    global _validator_instance
-    if _validator_instance is None:
-        _validator_instance = CanineValidator()
-    return _validator_instance
+    return _validator.obtener()
@@ -0,0 +1,125 @@
+# apps/mascota/services/carga_diferida.py
+"""
+Carga diferida de modelos de IA.
+
+Los modelos (predictor de registro, detector facial, validador canino...) se
+construían al importar su módulo, de modo que `manage.py migrate`, el admin y
+cualquier worker pagaban varios segundos de carga aunque no los usaran.
+ModeloDiferido los construye en el primer uso, una sola vez por proceso
+aunque varios hilos lo pidan a la vez, y se comporta como el objeto real
+(delegando atributos). `manage.py precargar_modelos` los carga por adelantado.
+"""
+
+import importlib
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+class ModeloDiferido:
+    """
+    Proxy que construye el objeto con `fabrica` en el primer acceso.
+
+    Args:
+        nombre: Identificador en el registro (p. ej. 'predictor_ia')
+        fabrica: Callable sin argumentos, o ruta 'paquete.modulo:funcion' que
+            se importa en el primer uso (evita importar torch al declararlo)
+    """
+
+    def __init__(self, nombre: str, fabrica: Union[Callable, str]):
+        self.nombre = nombre
+        self._fabrica = fabrica
+        self._instancia = None
+        self._lock = threading.Lock()
+        self.segundos_carga = None
+
+    @property
+    def cargado(self) -> bool:
+        return self._instancia is not None
+
+    def obtener(self):
+        """Retorna el objeto real, construyéndolo la primera vez"""
+        instancia = self._instancia
+        if instancia is not None:
+            return instancia
+        with self._lock:
+            if self._instancia is None:
+                inicio = time.perf_counter()
+                self._instancia = self._resolver_fabrica()()
+                self.segundos_carga = time.perf_counter() - inicio
+                logger.info(f"Modelo '{self.nombre}' cargado en {self.segundos_carga:.2f}s")
+            return self._instancia
+
+    def _resolver_fabrica(self) -> Callable:
+        if callable(self._fabrica):
+            return self._fabrica
+        modulo, _, funcion = self._fabrica.partition(':')
+        return getattr(importlib.import_module(modulo), funcion)
+
+    def __getattr__(self, atributo):
+        # Solo se llama para atributos que el proxy no tiene
+        if atributo.startswith('__'):
+            raise AttributeError(atributo)
+        return getattr(self.obtener(), atributo)
+
+    def __repr__(self):
+        estado = 'cargado' if self.cargado else 'sin cargar'
+        return f"<ModeloDiferido {self.nombre} ({estado})>"
+
+
+# Módulos que declaran modelos diferidos (importarlos solo registra, no carga)
+MODULOS_CON_MODELOS = (
+    'apps.mascota.services.ai_predictor',
+    'apps.mascota.services.canine_validator',
+    'apps.autenticacion.utils.facial_recognition',
+)
+
+_modelos: Dict[str, ModeloDiferido] = {}
+_modelos_lock = threading.Lock()
+
+
+def diferido(nombre: str, fabrica: Union[Callable, str]) -> ModeloDiferido:
+    """Declara (o retorna, si ya existe) el modelo diferido `nombre`"""
+    with _modelos_lock:
+        if nombre not in _modelos:
+            _modelos[nombre] = ModeloDiferido(nombre, fabrica)
+        return _modelos[nombre]
+
+
+def modelos_diferidos() -> Dict[str, ModeloDiferido]:
+    """Modelos diferidos declarados en el proceso"""
+    with _modelos_lock:
+        return dict(_modelos)
+
+
+def precargar(nombres: Optional[Iterable[str]] = None) -> Dict[str, Union[float, Exception]]:
+    """
+    Carga por adelantado los modelos diferidos.
+
+    Args:
+        nombres: Modelos a cargar (por defecto todos los declarados)
+
+    Returns:
+        dict nombre -> segundos de carga (0 si ya estaba cargado) o la excepción producida
+    """
+    for modulo in MODULOS_CON_MODELOS:
+        importlib.import_module(modulo)
+
+    modelos = modelos_diferidos()
+    resultado = {}
+    for nombre in (nombres or modelos):
+        modelo = modelos.get(nombre)
+        if modelo is None:
+            resultado[nombre] = KeyError(f"Modelo diferido desconocido: {nombre}")
+            continue
+        ya_cargado = modelo.cargado
+        try:
+            modelo.obtener()
+            resultado[nombre] = 0.0 if ya_cargado else modelo.segundos_carga
+        except Exception as e:
+            logger.error(f"Error precargando el modelo '{nombre}': {e}")
+            resultado[nombre] = e
+    return resultado
@@ -0,0 +1,29 @@
+# apps/mascota/services/clases_ia.py
+"""
+Clases que predicen los modelos de IA del registro y sus opciones para los
+formularios.
+
+Vive aparte de ai_predictor (que importa torch y torchvision) para que los
+formularios y las vistas construyan sus opciones sin pagar esa importación.
+"""
+
+# Deben coincidir con el entrenamiento
+BREED_CLASSES = ('bulldog', 'chihuahua', 'golden retriever')  # alfabético
+STAGE_CLASSES = ('adulto', 'cachorro', 'joven', 'senior')     # alfabético
+BODY_CONDITION_CLASSES = ('delgado', 'normal', 'obeso')       # condición corporal
+
+
+def get_breed_choices_for_django():
+    """Retorna las opciones de raza en formato Django choices"""
+    # Capitalizar para mostrar mejor
+    return [(breed, breed.replace('_', ' ').title()) for breed in BREED_CLASSES]
+
+
+def get_stage_choices_for_django():
+    """Retorna las opciones de etapa en formato Django choices"""
+    return [(stage, stage.capitalize()) for stage in STAGE_CLASSES]
+
+
+def get_body_condition_choices_for_django():
+    """Retorna las opciones de condición corporal en formato Django choices"""
+    return [(condition, condition.capitalize()) for condition in BODY_CONDITION_CLASSES]
@@ -0,0 +1,129 @@
+# apps/mascota/services/destilacion_condicion.py
+"""
+Destilación de BodyConditionModel (resnet50) en una cabeza ligera sobre el
+tronco resnet18 de MultiTaskDogModel.
+
+El tronco multitarea queda congelado: se extraen una vez sus 512
+características y los logits del modelo de condición corporal (maestro) para
+cada imagen y su reflejo horizontal, y se entrena BodyConditionHead con
+divergencia KL sobre las probabilidades suavizadas del maestro. No requiere
+etiquetas, así que sirven todas las fotos de perros almacenadas.
+
+El resultado se guarda en models/dog_fused_model.pth y AIPredictor lo usa
+con IA_PREDICTOR_FUSIONADO=True (ver FusedDogModel).
+"""
+
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    import torch
+    import torch.nn.functional as F
+    DEPS_INSTALLED = True
+except ImportError:
+    DEPS_INSTALLED = False
+
+
+def _rasgos_y_maestro(predictor, tensores: List, tamano_lote: int) -> Tuple:
+    """
+    Características del tronco multitarea y logits del maestro.
+
+    Returns:
+        (rasgos (N, 2, 512), logits (N, 2, clases)); la segunda vista es el reflejo horizontal
+    """
+    tronco = predictor.multitask_model.features
+    maestro = predictor.body_condition_model
+    tronco.eval()
+    maestro.eval()
+
+    rasgos, logits = [], []
+    # no_grad (no inference_mode): los tensores se usan después para entrenar la cabeza
+    with torch.no_grad():
+        for i in range(0, len(tensores), tamano_lote):
+            lote = torch.cat(tensores[i:i + tamano_lote]).to(predictor.device)
+            vistas = torch.stack([lote, torch.flip(lote, dims=[3])], dim=1)  # (B, 2, 3, H, W)
+            plano = vistas.flatten(0, 1)
+            rasgos.append(tronco(plano).flatten(1).view(lote.size(0), 2, -1).cpu())
+            logits.append(maestro(plano).view(lote.size(0), 2, -1).cpu())
+    return torch.cat(rasgos), torch.cat(logits)
+
+
+def destilar_cabeza_condicion(
+    predictor,
+    tensores: List,
+    epocas: int = 40,
+    temperatura: float = 2.0,
+    validacion: float = 0.2,
+    tamano_lote: int = 32,
+    semilla: int = 0,
+) -> Tuple[object, Dict]:
+    """
+    Entrena BodyConditionHead imitando al BodyConditionModel del predictor.
+
+    Args:
+        predictor: AIPredictor en eager y sin fusionar (con ambos modelos cargados)
+        tensores: Imágenes preprocesadas con predictor.transform, cada una (1, 3, 224, 224)
+        epocas: Pasadas sobre las características de entrenamiento
+        temperatura: Temperatura de la destilación
+        validacion: Fracción de imágenes apartadas para medir la coincidencia
+
+    Returns:
+        Tuple con (cabeza en CPU y modo eval, métricas de coincidencia con el maestro)
+    """
+    from .ai_predictor import BodyConditionHead
+
+    if predictor.multitask_model is None or predictor.body_condition_model is None:
+        raise ValueError("La destilación requiere los modelos multitarea y de condición corporal")
+
+    torch.manual_seed(semilla)
+    rasgos, logits = _rasgos_y_maestro(predictor, tensores, tamano_lote)
+
+    # División por imagen (ambas vistas de una imagen quedan del mismo lado)
+    orden = np.random.default_rng(semilla).permutation(rasgos.size(0))
+    n_validacion = int(round(rasgos.size(0) * validacion)) if rasgos.size(0) >= 10 else 0
+    idx_validacion = torch.as_tensor(orden[:n_validacion])
+    idx_entrenamiento = torch.as_tensor(orden[n_validacion:])
+
+    x = rasgos[idx_entrenamiento].flatten(0, 1)
+    objetivo = F.softmax(logits[idx_entrenamiento].flatten(0, 1) / temperatura, dim=1)
+
+    cabeza = BodyConditionHead(logits.size(-1))
+    optimizador = torch.optim.Adam(cabeza.parameters(), lr=1e-3, weight_decay=1e-4)
+    cabeza.train()
+    for _ in range(epocas):
+        permutacion = torch.randperm(x.size(0))
+        for i in range(0, x.size(0), 64):
+            idx = permutacion[i:i + 64]
+            salida = F.log_softmax(cabeza(x[idx]) / temperatura, dim=1)
+            perdida = F.kl_div(salida, objetivo[idx], reduction='batchmean') * temperatura ** 2
+            optimizador.zero_grad()
+            perdida.backward()
+            optimizador.step()
+    cabeza.eval()
+
+    metricas = {
+        'imagenes_entrenamiento': int(idx_entrenamiento.numel()),
+        'imagenes_validacion': int(idx_validacion.numel()),
+        'epocas': epocas,
+        'temperatura': temperatura,
+    }
+    # Coincidencia sobre la vista original de las imágenes apartadas (o de entrenamiento si son pocas)
+    evaluadas = idx_validacion if n_validacion else idx_entrenamiento
+    with torch.no_grad():
+        prob_cabeza = F.softmax(cabeza(rasgos[evaluadas, 0]), dim=1)
+        prob_maestro = F.softmax(logits[evaluadas, 0], dim=1)
+    metricas['coincidencia'] = float((prob_cabeza.argmax(1) == prob_maestro.argmax(1)).float().mean())
+    metricas['delta_prob_medio'] = float((prob_cabeza - prob_maestro).abs().sum(1).mean() / 2)
+    metricas['sobre_validacion'] = bool(n_validacion)
+
+    logger.info(f"Cabeza de condición corporal destilada: {metricas}")
+    return cabeza, metricas
+
+
+def guardar_cabeza(cabeza, metricas: Dict, ruta: str):
+    """Guarda la cabeza destilada en el formato que lee AIPredictor._load_fused_model"""
+    torch.save({'body_condition_head': cabeza.state_dict(), 'metricas': metricas}, ruta)
@@ -1,7 +1,7 @@
 """
 Servicio para el envío de emails relacionados con mascotas perdidas
 """
-from django.core.mail import send_mail, send_mass_mail
+from django.core.mail import EmailMultiAlternatives, send_mass_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
@@ -20,74 +20,109 @@ class EmailService:
     @staticmethod
     def enviar_alerta_mascota_perdida(mascota, ubicacion_perdida: Optional[str] = None) -> bool:
         """
-        Envía email a todos los usuarios registrados notificando que una mascota fue reportada como perdida
+        Encola el email a todos los usuarios registrados notificando que una mascota fue reportada como perdida
+        
+        El template se renderiza una sola vez y los emails se envían por lotes en segundo plano
+        (ver services.envios_masivos), fuera del ciclo de la petición.
         
         Args:
             mascota: Instancia del modelo Mascota
             ubicacion_perdida: Ubicación donde se perdió la mascota (opcional)
             
         Returns:
-            bool: True si se envió exitosamente, False en caso contrario
+            bool: True si se encoló el envío, False en caso contrario
         """
+        from .envios_masivos import crear_alerta_mascota_perdida
+        
         try:
-            # Obtener todos los usuarios activos con email
-            usuarios_activos = User.objects.filter(is_active=True, email__isnull=False).exclude(email='')
-            
-            if not usuarios_activos.exists():
-                logger.warning("No hay usuarios con email para notificar mascota perdida")
-                return False
-            
-            # Preparar contexto para el template
-            context = {
-                'mascota': mascota,
-                'propietario': mascota.propietario,
-                'ubicacion_perdida': ubicacion_perdida,
-                'foto_url': mascota.foto_perfil.url if mascota.foto_perfil else None,
-                'contacto_propietario': {
-                    'nombre': mascota.propietario.get_full_name() or mascota.propietario.username,
-                    'email': mascota.propietario.email,
-                    'telefono': getattr(mascota.propietario, 'phone', None)
-                }
-            }
-            
-            # Renderizar template HTML
-            html_message = render_to_string('emails/mascota_perdida_alerta.html', context)
-            plain_message = strip_tags(html_message)
-            
-            # Preparar asunto
-            subject = f'🚨 Alerta: {mascota.nombre} ha sido reportada como perdida'
-            
-            # Enviar emails individuales con HTML
-            emails_enviados = 0
-            for usuario in usuarios_activos:
-                # No enviar al propietario de la mascota
-                if usuario.id != mascota.propietario.id:
-                    try:
-                        send_mail(
-                            subject=subject,
-                            message=plain_message,
-                            from_email=settings.DEFAULT_FROM_EMAIL,
-                            recipient_list=[usuario.email],
-                            html_message=html_message,
-                            fail_silently=False
-                        )
-                        emails_enviados += 1
-                    except Exception as e:
-                        logger.error(f"Error enviando email a {usuario.email}: {str(e)}")
-            
-            if emails_enviados > 0:
-                logger.info(f"✅ Alerta de mascota perdida enviada a {emails_enviados} usuarios para {mascota.nombre}")
-                print(f"📧 EMAILS ENVIADOS: {emails_enviados} alertas para {mascota.nombre}")
-                return True
-            else:
-                logger.warning(f"❌ No hay destinatarios válidos para alerta de {mascota.nombre}")
-                print(f"⚠️ No se enviaron emails para {mascota.nombre}")
+            envio = crear_alerta_mascota_perdida(mascota, ubicacion_perdida)
+            if envio is None:
                 return False
+            return True
                 
         except Exception as e:
-            logger.error(f"Error enviando alerta de mascota perdida para {mascota.nombre}: {str(e)}")
+            logger.error(f"Error encolando alerta de mascota perdida para {mascota.nombre}: {str(e)}")
             return False
     
+    @staticmethod
+    def construir_notificacion_mascota_encontrada(mascota, datos_encuentro: Dict, connection=None) -> Optional[EmailMultiAlternatives]:
+        """
+        Arma el email al propietario notificando que su mascota fue encontrada
+        
+        Args:
+            mascota: Instancia del modelo Mascota
+            datos_encuentro: Diccionario con datos del encuentro (ubicación, hora, etc.)
+            connection: Conexión de email a reutilizar (opcional)
+            
+        Returns:
+            EmailMultiAlternatives: Mensaje listo para enviar, o None si el propietario no tiene email
+        """
+        if not mascota.propietario.email:
+            logger.warning(f"Propietario de {mascota.nombre} no tiene email configurado")
+            return None
+        
+        # Preparar contexto para el template
+        context = {
+            'mascota': mascota,
+            'propietario': mascota.propietario,
+            'datos_encuentro': datos_encuentro,
+            'foto_url': mascota.foto_perfil.url if mascota.foto_perfil else None,
+        }
+        
+        # Renderizar templates
+        html_message = render_to_string('emails/mascota_encontrada_notificacion.html', context)
+        return EmailService._mensaje(
+            f'🎉 ¡Buenas noticias! {mascota.nombre} ha sido encontrada',
+            html_message,
+            mascota.propietario.email,
+            connection
+        )
+    
+    @staticmethod
+    def construir_confirmacion_reporte_perdida(mascota, connection=None) -> Optional[EmailMultiAlternatives]:
+        """
+        Arma el email de confirmación al propietario cuando reporta su mascota como perdida
+        
+        Args:
+            mascota: Instancia del modelo Mascota
+            connection: Conexión de email a reutilizar (opcional)
+            
+        Returns:
+            EmailMultiAlternatives: Mensaje listo para enviar, o None si el propietario no tiene email
+        """
+        if not mascota.propietario.email:
+            logger.warning(f"Propietario de {mascota.nombre} no tiene email configurado")
+            return None
+        
+        # Preparar contexto
+        context = {
+            'mascota': mascota,
+            'propietario': mascota.propietario,
+            'foto_url': mascota.foto_perfil.url if mascota.foto_perfil else None,
+            'fecha_reporte': timezone.now()  # Cambiar por tu dominio en producción
+        }
+        
+        # Renderizar templates
+        html_message = render_to_string('emails/confirmacion_reporte_perdida.html', context)
+        return EmailService._mensaje(
+            f'Confirmación: {mascota.nombre} ha sido reportada como perdida',
+            html_message,
+            mascota.propietario.email,
+            connection
+        )
+    
+    @staticmethod
+    def _mensaje(subject: str, html_message: str, destinatario: str, connection=None) -> EmailMultiAlternatives:
+        mensaje = EmailMultiAlternatives(
+            subject=subject,
+            body=strip_tags(html_message),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[destinatario],
+            connection=connection
+        )
+        mensaje.attach_alternative(html_message, 'text/html')
+        return mensaje
+    
     @staticmethod
     def enviar_notificacion_mascota_encontrada(mascota, datos_encuentro: Dict) -> bool:
         """
@@ -101,33 +136,11 @@ class EmailService:
             bool: True si se envió exitosamente, False en caso contrario
         """
         try:
-            if not mascota.propietario.email:
-                logger.warning(f"Propietario de {mascota.nombre} no tiene email configurado")
+            mensaje = EmailService.construir_notificacion_mascota_encontrada(mascota, datos_encuentro)
+            if mensaje is None:
                 return False
             
-            # Preparar contexto para el template
-            context = {
-                'mascota': mascota,
-                'propietario': mascota.propietario,
-                'datos_encuentro': datos_encuentro,
-                'foto_url': mascota.foto_perfil.url if mascota.foto_perfil else None,
-            }
-            
-            # Renderizar templates
-            html_message = render_to_string('emails/mascota_encontrada_notificacion.html', context)
-            plain_message = strip_tags(html_message)
-            
-            # Enviar email
-            success = send_mail(
-                subject=f'🎉 ¡Buenas noticias! {mascota.nombre} ha sido encontrada',
-                message=plain_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[mascota.propietario.email],
-                html_message=html_message,
-                fail_silently=False
-            )
-            
-            if success:
+            if mensaje.send(fail_silently=False):
                 logger.info(f"Notificación de mascota encontrada enviada a {mascota.propietario.email}")
                 return True
             else:
@@ -150,33 +163,11 @@ class EmailService:
             bool: True si se envió exitosamente, False en caso contrario
         """
         try:
-            if not mascota.propietario.email:
-                logger.warning(f"Propietario de {mascota.nombre} no tiene email configurado")
+            mensaje = EmailService.construir_confirmacion_reporte_perdida(mascota)
+            if mensaje is None:
                 return False
             
-            # Preparar contexto
-            context = {
-                'mascota': mascota,
-                'propietario': mascota.propietario,
-                'foto_url': mascota.foto_perfil.url if mascota.foto_perfil else None,
-                'fecha_reporte': timezone.now()  # Cambiar por tu dominio en producción
-            }
-            
-            # Renderizar templates
-            html_message = render_to_string('emails/confirmacion_reporte_perdida.html', context)
-            plain_message = strip_tags(html_message)
-            
-            # Enviar email
-            success = send_mail(
-                subject=f'Confirmación: {mascota.nombre} ha sido reportada como perdida',
-                message=plain_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[mascota.propietario.email],
-                html_message=html_message,
-                fail_silently=False
-            )
-            
-            if success:
+            if mensaje.send(fail_silently=False):
                 logger.info(f"Confirmación de reporte enviada a {mascota.propietario.email}")
                 return True
             else:
@@ -185,4 +176,4 @@ class EmailService:
                 
         except Exception as e:
             logger.error(f"Error enviando confirmación de reporte para {mascota.nombre}: {str(e)}")
-            return False
\ No newline at end of file
+            return False
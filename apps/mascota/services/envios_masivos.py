@@ -0,0 +1,419 @@
+# apps/mascota/services/envios_masivos.py
+"""
+Envíos masivos de email (tabla EnvioMasivo).
+
+La alerta de mascota perdida se enviaba con un send_mail por usuario dentro
+de la petición `reportar_perdida`: una conexión SMTP por destinatario y
+varios minutos con pocos miles de usuarios. Ahora la petición solo renderiza
+el template una vez y crea el EnvioMasivo; un worker recorre los
+destinatarios en streaming (values_list + iterator, por id ascendente) y
+envía cada lote con send_messages sobre una sola conexión de
+get_connection(), guardando el progreso tras cada lote.
+
+Si el reporte trae coordenadas, la alerta solo llega a los usuarios cuya casa
+está a menos de ALERTAS_RADIO_KM (y a los que no la registraron si
+ALERTAS_INCLUIR_SIN_UBICACION=True): se consultan por prefijo las celdas de
+geohash que cubren el radio (User.home_geohash), así el costo depende de los
+usuarios cercanos y no del total. La distancia exacta solo se calcula en el
+worker; la petición únicamente comprueba con SQL si hay alguien cerca.
+
+El worker es un hilo del propio servidor (EMAIL_ENVIOS_WORKER='hilo', uno por
+proceso, que duerme hasta el próximo envío reprogramado) o el comando
+`manage.py procesar_envios_masivos` ('comando'). Como todo pasa por
+get_connection(), con EMAIL_BACKEND de locmem o consola se puede probar sin
+servidor SMTP.
+"""
+
+import logging
+import threading
+from datetime import timedelta
+from typing import Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connections, transaction
+from django.db.models import F, Min, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from apps.autenticacion.utils import geohash
+
+from .trabajos_biometricos import calcular_espera
+
+logger = logging.getLogger(__name__)
+
+WORKER_HILO = 'hilo'
+WORKER_COMANDO = 'comando'
+# Un envío 'enviando' sin actividad en este tiempo se considera abandonado
+# (p. ej. el servidor se reinició a mitad) y vuelve a reclamarse
+TIEMPO_MAXIMO_ENVIANDO = timedelta(minutes=10)
+# Espera mínima del hilo entre recorridos (p. ej. si otro worker tiene tomado el envío listo)
+ESPERA_MINIMA_SEGUNDOS = 1.0
+# Vigencia de la URL firmada de la foto dentro del email: los lotes y sus reintentos salen
+# minutos u horas después de renderizar el template, y el destinatario lo abre más tarde
+VIGENCIA_FOTO_ALERTA = timedelta(days=7)
+
+
+def tamano_lote_por_defecto() -> int:
+    return max(1, getattr(settings, 'EMAIL_ENVIOS_LOTE', 100))
+
+
+def radio_alertas_km() -> float:
+    return float(getattr(settings, 'ALERTAS_RADIO_KM', 5))
+
+
+def es_geografico(envio) -> bool:
+    return None not in (envio.latitud, envio.longitud, envio.radio_km)
+
+
+def destinatarios(envio):
+    """
+    Usuarios activos con email, sin el propietario de la mascota.
+
+    En un envío geográfico solo se consultan las celdas de geohash que cubren
+    el radio (índice sobre home_geohash) dentro de la caja envolvente; la
+    distancia exacta la comprueba iterar_destinatarios.
+    """
+    User = get_user_model()
+    usuarios = (
+        User.objects
+        .filter(is_active=True, email__isnull=False)
+        .exclude(email='')
+        .exclude(id=envio.mascota.propietario_id)
+    )
+    if not es_geografico(envio):
+        return usuarios
+
+    lat_min, lat_max, lon_min, lon_max = geohash.caja_envolvente(envio.latitud, envio.longitud, envio.radio_km)
+    celdas = Q()
+    for celda in geohash.celdas_cercanas(envio.latitud, envio.longitud, envio.radio_km):
+        celdas |= Q(home_geohash__startswith=celda)
+    cercanos = celdas & Q(
+        home_latitude__range=(lat_min, lat_max),
+        home_longitude__range=(lon_min, lon_max),
+    )
+    if getattr(settings, 'ALERTAS_INCLUIR_SIN_UBICACION', False):
+        cercanos |= Q(home_geohash='')
+    return usuarios.filter(cercanos)
+
+
+def iterar_destinatarios(envio, desde_id: int = 0, chunk_size: int = 2000) -> Iterator[Tuple[int, str]]:
+    """
+    (usuario_id, email) de los destinatarios con id mayor que `desde_id`, en
+    orden de id y sin cargar los usuarios completos
+    """
+    pendientes = destinatarios(envio).filter(id__gt=desde_id).order_by('id')
+    if not es_geografico(envio):
+        yield from pendientes.values_list('id', 'email').iterator(chunk_size=chunk_size)
+        return
+
+    filas = pendientes.values_list('id', 'email', 'home_latitude', 'home_longitude').iterator(chunk_size=chunk_size)
+    for usuario_id, email, latitud, longitud in filas:
+        # Sin ubicación solo llegan aquí si ALERTAS_INCLUIR_SIN_UBICACION
+        if latitud is None or longitud is None:
+            yield usuario_id, email
+        elif geohash.distancia_km(envio.latitud, envio.longitud, latitud, longitud) <= envio.radio_km:
+            yield usuario_id, email
+
+
+def _definir_alcance(envio):
+    """Fija las coordenadas y el radio del envío si el reporte de la mascota las trae"""
+    mascota = envio.mascota
+    if mascota.latitud_perdida is not None and mascota.longitud_perdida is not None:
+        envio.latitud = mascota.latitud_perdida
+        envio.longitud = mascota.longitud_perdida
+        envio.radio_km = radio_alertas_km()
+
+
+def hay_destinatarios(mascota) -> bool:
+    """
+    Si la alerta de la mascota tendría algún destinatario, para informarlo al
+    propietario al reportar. Es una sola consulta (celdas de geohash y caja
+    envolvente, sin la distancia exacta), así la petición no recorre usuarios.
+    """
+    from ..models import EnvioMasivo
+
+    envio = EnvioMasivo(tipo=EnvioMasivo.TIPO_ALERTA_PERDIDA, mascota=mascota)
+    _definir_alcance(envio)
+    return destinatarios(envio).exists()
+
+
+def url_foto_alerta(mascota) -> Optional[str]:
+    """
+    URL de la foto de perfil para el email de alerta, firmada con
+    VIGENCIA_FOTO_ALERTA (no la URL de la caché, que puede estar por vencer)
+    """
+    foto = mascota.foto_perfil
+    if not foto:
+        return None
+    try:
+        return foto.storage.url(foto.name, expire=int(VIGENCIA_FOTO_ALERTA.total_seconds()))
+    except TypeError:
+        # Storage sin URLs firmadas (p. ej. FileSystemStorage en desarrollo)
+        return foto.url
+
+
+def crear_alerta_mascota_perdida(mascota, ubicacion_perdida: Optional[str] = None):
+    """
+    Renderiza la alerta de mascota perdida y la deja lista para el worker.
+
+    Returns:
+        EnvioMasivo creado, o None si no hay destinatarios
+    """
+    from ..models import EnvioMasivo
+
+    propietario = mascota.propietario
+    context = {
+        'mascota': mascota,
+        'propietario': propietario,
+        'ubicacion_perdida': ubicacion_perdida,
+        'foto_url': url_foto_alerta(mascota),
+        'contacto_propietario': {
+            'nombre': propietario.get_full_name() or propietario.username,
+            'email': propietario.email,
+            'telefono': getattr(propietario, 'phone', None)
+        }
+    }
+    html_message = render_to_string('emails/mascota_perdida_alerta.html', context)
+
+    envio = EnvioMasivo(
+        tipo=EnvioMasivo.TIPO_ALERTA_PERDIDA,
+        mascota=mascota,
+        asunto=f'🚨 Alerta: {mascota.nombre} ha sido reportada como perdida',
+        mensaje_texto=strip_tags(html_message),
+        mensaje_html=html_message,
+    )
+    _definir_alcance(envio)
+    if es_geografico(envio):
+        envio.total_destinatarios = sum(1 for _ in iterar_destinatarios(envio))
+    else:
+        envio.total_destinatarios = destinatarios(envio).count()
+    if not envio.total_destinatarios:
+        alcance = f" a menos de {envio.radio_km:g} km" if es_geografico(envio) else ""
+        logger.warning(f"No hay usuarios con email{alcance} para notificar la pérdida de {mascota.nombre}")
+        return None
+
+    envio.save()
+    alcance = f" a menos de {envio.radio_km:g} km" if es_geografico(envio) else ""
+    logger.info(f"Alerta de {mascota.nombre} encolada para {envio.total_destinatarios} usuarios{alcance} (envío {envio.id})")
+    transaction.on_commit(lanzar_worker)
+    return envio
+
+
+_hilo = None
+_hilo_lock = threading.Lock()
+_hay_nuevos = threading.Event()
+
+
+def lanzar_worker():
+    """Procesa los envíos en un hilo del servidor si EMAIL_ENVIOS_WORKER='hilo' (un solo hilo por proceso)"""
+    global _hilo
+    if getattr(settings, 'EMAIL_ENVIOS_WORKER', WORKER_HILO) != WORKER_HILO:
+        return
+    with _hilo_lock:
+        _hay_nuevos.set()
+        if _hilo is not None:
+            return
+        _hilo = threading.Thread(target=_procesar_en_hilo, name='envios-masivos', daemon=True)
+        _hilo.start()
+
+
+def _procesar_en_hilo():
+    global _hilo
+    try:
+        while True:
+            with _hilo_lock:
+                _hay_nuevos.clear()
+            envio = reclamar_envio()
+            while envio is not None:
+                procesar_envio(envio)
+                envio = reclamar_envio()
+            espera = segundos_hasta_siguiente()
+            # Los envíos creados mientras se procesaba vuelven a recorrer la cola
+            with _hilo_lock:
+                if espera is None and not _hay_nuevos.is_set():
+                    _hilo = None
+                    return
+            if espera is not None:
+                # Un envío nuevo despierta el hilo antes de tiempo
+                _hay_nuevos.wait(espera)
+    except Exception as e:
+        logger.error(f"Error en el hilo de envíos masivos: {e}", exc_info=True)
+        with _hilo_lock:
+            _hilo = None
+    finally:
+        # Las conexiones a la base de datos son por hilo
+        connections.close_all()
+
+
+def segundos_hasta_siguiente() -> Optional[float]:
+    """
+    Segundos hasta que un envío reprogramado o abandonado en 'enviando'
+    vuelva a estar listo; None si no queda ninguno.
+    """
+    from ..models import EnvioMasivo
+
+    proximos = []
+    pendiente = (
+        EnvioMasivo.objects
+        .filter(estado=EnvioMasivo.ESTADO_PENDIENTE)
+        .aggregate(proximo=Min('proximo_intento'))['proximo']
+    )
+    if pendiente is not None:
+        proximos.append(pendiente)
+    enviando = (
+        EnvioMasivo.objects
+        .filter(estado=EnvioMasivo.ESTADO_ENVIANDO)
+        .aggregate(actualizado=Min('actualizado'))['actualizado']
+    )
+    if enviando is not None:
+        proximos.append(enviando + TIEMPO_MAXIMO_ENVIANDO)
+    if not proximos:
+        return None
+    return max(ESPERA_MINIMA_SEGUNDOS, (min(proximos) - timezone.now()).total_seconds())
+
+
+def reclamar_envio(envio_id: Optional[int] = None):
+    """
+    Marca como 'enviando' un envío listo (el indicado, o el más antiguo).
+    Varios workers pueden reclamar a la vez sin tomar el mismo envío.
+
+    Returns:
+        EnvioMasivo reclamado o None
+    """
+    from ..models import EnvioMasivo
+
+    ahora = timezone.now()
+    listos = (
+        Q(estado=EnvioMasivo.ESTADO_PENDIENTE, proximo_intento__lte=ahora)
+        | Q(estado=EnvioMasivo.ESTADO_ENVIANDO, actualizado__lt=ahora - TIEMPO_MAXIMO_ENVIANDO)
+    )
+    consulta = EnvioMasivo.objects.select_for_update(skip_locked=True).filter(listos)
+    if envio_id is not None:
+        consulta = consulta.filter(id=envio_id)
+
+    with transaction.atomic():
+        envio = consulta.order_by('proximo_intento', 'id').first()
+        if envio is None:
+            return None
+        envio.estado = EnvioMasivo.ESTADO_ENVIANDO
+        envio.iniciado = envio.iniciado or ahora
+        envio.intentos += 1
+        envio.save(update_fields=['estado', 'iniciado', 'intentos', 'actualizado'])
+    return envio
+
+
+def _lotes_destinatarios(envio, tamano_lote: int) -> Iterator[List[Tuple[int, str]]]:
+    """Lotes [(usuario_id, email)] a partir del último lote enviado, sin cargar los usuarios completos"""
+    pendientes = iterar_destinatarios(envio, envio.ultimo_usuario_id, tamano_lote)
+    lote = []
+    for fila in pendientes:
+        lote.append(fila)
+        if len(lote) >= tamano_lote:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _mensajes(envio, correos: List[str], conexion) -> List[EmailMultiAlternatives]:
+    mensajes = []
+    for correo in correos:
+        mensaje = EmailMultiAlternatives(
+            subject=envio.asunto,
+            body=envio.mensaje_texto,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[correo],
+            connection=conexion,
+        )
+        if envio.mensaje_html:
+            mensaje.attach_alternative(envio.mensaje_html, 'text/html')
+        mensajes.append(mensaje)
+    return mensajes
+
+
+def _sigue_vigente(envio) -> bool:
+    """La alerta deja de enviarse si la mascota ya fue encontrada o se canceló el reporte"""
+    from ..models import EnvioMasivo, Mascota
+
+    if envio.tipo != EnvioMasivo.TIPO_ALERTA_PERDIDA:
+        return True
+    return Mascota.objects.filter(id=envio.mascota_id, reportar_perdida=True).exists()
+
+
+def procesar_envio(envio, tamano_lote: Optional[int] = None, backend: Optional[str] = None):
+    """
+    Envía los lotes pendientes de un envío reclamado.
+
+    Cada lote abre una sola conexión (send_messages) y, al terminarlo, se
+    guardan los contadores y el último destinatario. Si no se puede enviar
+    ningún mensaje del lote (servidor caído), el envío se reprograma con
+    espera exponencial y se retoma desde ese lote.
+
+    Args:
+        envio: EnvioMasivo en estado 'enviando' (ver reclamar_envio)
+        tamano_lote: Destinatarios por conexión (por defecto EMAIL_ENVIOS_LOTE)
+        backend: Backend de email (por defecto EMAIL_BACKEND)
+
+    Returns:
+        EnvioMasivo con el estado final
+    """
+    from ..models import EnvioMasivo
+
+    tamano_lote = tamano_lote or tamano_lote_por_defecto()
+    progreso = EnvioMasivo.objects.filter(id=envio.id)
+
+    for lote in _lotes_destinatarios(envio, tamano_lote):
+        if not _sigue_vigente(envio):
+            envio.estado = EnvioMasivo.ESTADO_CANCELADO
+            envio.finalizado = timezone.now()
+            envio.save(update_fields=['estado', 'finalizado', 'actualizado'])
+            logger.info(f"Envío {envio.id} cancelado: {envio.mascota_id} ya no está perdida")
+            return envio
+
+        # fail_silently: un destinatario rechazado no detiene el lote; send_messages
+        # retorna cuántos mensajes salieron (0 si no se pudo abrir la conexión)
+        conexion = get_connection(backend=backend, fail_silently=True)
+        salieron = conexion.send_messages(_mensajes(envio, [correo for _, correo in lote], conexion)) or 0
+
+        if not salieron:
+            return _reprogramar(envio, f"No se pudo enviar ningún email del lote que empieza en el usuario {lote[0][0]}")
+
+        envio.enviados += salieron
+        envio.fallidos += len(lote) - salieron
+        envio.ultimo_usuario_id = lote[-1][0]
+        progreso.update(
+            enviados=F('enviados') + salieron,
+            fallidos=F('fallidos') + (len(lote) - salieron),
+            ultimo_usuario_id=envio.ultimo_usuario_id,
+            actualizado=timezone.now(),
+        )
+        logger.debug(f"Envío {envio.id}: {envio.enviados}/{envio.total_destinatarios} emails enviados")
+
+    envio.estado = EnvioMasivo.ESTADO_COMPLETADO
+    envio.finalizado = timezone.now()
+    envio.ultimo_error = ''
+    envio.save(update_fields=['estado', 'finalizado', 'ultimo_error', 'actualizado'])
+    logger.info(
+        f"✅ Envío {envio.id} completado: {envio.enviados} emails enviados, {envio.fallidos} fallidos"
+    )
+    return envio
+
+
+def _reprogramar(envio, error: str):
+    from ..models import EnvioMasivo
+
+    ahora = timezone.now()
+    envio.ultimo_error = error
+    if envio.intentos >= envio.max_intentos:
+        envio.estado = EnvioMasivo.ESTADO_FALLIDO
+        envio.finalizado = ahora
+        logger.error(f"Envío {envio.id} fallido tras {envio.intentos} intentos: {error}")
+    else:
+        envio.estado = EnvioMasivo.ESTADO_PENDIENTE
+        envio.proximo_intento = ahora + calcular_espera(envio.intentos)
+        logger.warning(f"Envío {envio.id} reprogramado para {envio.proximo_intento}: {error}")
+    envio.save(update_fields=['estado', 'finalizado', 'proximo_intento', 'ultimo_error', 'actualizado'])
+    return envio
@@ -0,0 +1,187 @@
+# apps/mascota/services/exportacion_extractor.py
+"""
+Exportación del extractor de características de BiometriaService para
+inferencia en CPU sin el grafo eager de torchvision.
+
+- TorchScript: grafo trazado y congelado (torch.jit), solo requiere torch.
+- ONNX: ejecutado con ONNX Runtime; opcionalmente cuantizado a int8 de forma
+  dinámica (pesos de Conv/MatMul en int8, activaciones cuantizadas en línea).
+  Requiere `onnxruntime` (y `onnx` para la cuantización).
+
+Los artefactos se guardan en ModeloGlobal.vectorizer_file y su descripción
+en ModeloGlobal.metricas['extractor_exportado'] (ver comando
+`manage.py exportar_extractor`).
+"""
+
+import io
+import logging
+import os
+import tempfile
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    import torch
+    import torch.nn as nn
+    DEPS_INSTALLED = True
+except ImportError:
+    DEPS_INSTALLED = False
+
+FORMATO_TORCHSCRIPT = 'torchscript'
+FORMATO_ONNX = 'onnx'
+FORMATOS = (FORMATO_TORCHSCRIPT, FORMATO_ONNX)
+EXTENSIONES = {FORMATO_TORCHSCRIPT: 'pt', FORMATO_ONNX: 'onnx'}
+
+# Tamaño de entrada del extractor (Resize 256 + CenterCrop 224)
+FORMA_ENTRADA = (3, 224, 224)
+
+
+if DEPS_INSTALLED:
+    class _ExtractorPlano(nn.Module):
+        """Envuelve el extractor de create_feature_extractor para que retorne un tensor (B, D)"""
+
+        def __init__(self, feature_extractor):
+            super().__init__()
+            self.feature_extractor = feature_extractor
+
+        def forward(self, x):
+            return torch.flatten(self.feature_extractor(x)['flatten'], 1)
+
+
+def _modulo_cpu(servicio):
+    modulo = _ExtractorPlano(servicio.feature_extractor).to('cpu')
+    modulo.eval()
+    return modulo
+
+
+def exportar_torchscript(servicio) -> bytes:
+    """Traza y congela el extractor del servicio; retorna el archivo .pt en bytes"""
+    modulo = _modulo_cpu(servicio)
+    ejemplo = torch.zeros((1,) + FORMA_ENTRADA)
+    with torch.inference_mode():
+        trazado = torch.jit.freeze(torch.jit.trace(modulo, ejemplo))
+    buffer = io.BytesIO()
+    torch.jit.save(trazado, buffer)
+    return buffer.getvalue()
+
+
+def exportar_onnx(servicio, int8: bool = False) -> bytes:
+    """
+    Exporta el extractor a ONNX con tamaño de lote dinámico.
+
+    Args:
+        servicio: BiometriaService con el extractor eager
+        int8: Aplica cuantización dinámica int8 con ONNX Runtime
+    """
+    modulo = _modulo_cpu(servicio)
+    ejemplo = torch.zeros((1,) + FORMA_ENTRADA)
+    buffer = io.BytesIO()
+    with torch.no_grad():
+        torch.onnx.export(
+            modulo,
+            ejemplo,
+            buffer,
+            input_names=['imagenes'],
+            output_names=['embeddings'],
+            dynamic_axes={'imagenes': {0: 'lote'}, 'embeddings': {0: 'lote'}},
+            opset_version=17,
+            dynamo=False,
+        )
+    contenido = buffer.getvalue()
+    if int8:
+        contenido = _cuantizar_onnx_int8(contenido)
+    return contenido
+
+
+def _cuantizar_onnx_int8(contenido: bytes) -> bytes:
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError:
+        raise ImportError("La cuantización int8 requiere onnxruntime y onnx")
+
+    with tempfile.TemporaryDirectory() as directorio:
+        origen = os.path.join(directorio, 'extractor.onnx')
+        destino = os.path.join(directorio, 'extractor_int8.onnx')
+        with open(origen, 'wb') as f:
+            f.write(contenido)
+        quantize_dynamic(origen, destino, weight_type=QuantType.QInt8)
+        with open(destino, 'rb') as f:
+            return f.read()
+
+
+class ExtractorExportado:
+    """
+    Extractor cargado desde un artefacto exportado. Se invoca con un lote
+    (B, 3, 224, 224) ya preprocesado y retorna un array (B, D) float32.
+    """
+
+    def __init__(self, contenido: bytes, formato: str, descripcion: str = ''):
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato de extractor no soportado: {formato}")
+        self.formato = formato
+        self.descripcion = descripcion or formato
+
+        if formato == FORMATO_TORCHSCRIPT:
+            self._modelo = torch.jit.load(io.BytesIO(contenido), map_location='cpu')
+            self._modelo.eval()
+        else:
+            try:
+                import onnxruntime
+            except ImportError:
+                raise ImportError("Ejecutar el extractor ONNX requiere onnxruntime")
+            self._sesion = onnxruntime.InferenceSession(contenido, providers=['CPUExecutionProvider'])
+            self._entrada = self._sesion.get_inputs()[0].name
+
+    def __call__(self, lote) -> np.ndarray:
+        if self.formato == FORMATO_TORCHSCRIPT:
+            with torch.inference_mode():
+                return self._modelo(lote.to('cpu')).numpy()
+        return self._sesion.run(None, {self._entrada: lote.cpu().numpy()})[0]
+
+
+def cargar_extractor_exportado(modelo_global) -> Optional[ExtractorExportado]:
+    """
+    Carga el extractor exportado de un ModeloGlobal.
+
+    Returns:
+        ExtractorExportado, o None si el modelo no tiene uno
+    """
+    info = (modelo_global.metricas or {}).get('extractor_exportado')
+    if not info or not modelo_global.vectorizer_file:
+        return None
+
+    with modelo_global.vectorizer_file.open('rb') as f:
+        contenido = f.read()
+    descripcion = f"{info['formato']}{' int8' if info.get('int8') else ''} v{modelo_global.version}"
+    extractor = ExtractorExportado(contenido, info['formato'], descripcion)
+    logger.info(f"Extractor exportado cargado: {descripcion}")
+    return extractor
+
+
+def verificar_paridad(servicio, extractor: ExtractorExportado, imagenes: List[np.ndarray]) -> Dict:
+    """
+    Compara los embeddings del extractor eager con los del exportado.
+
+    Returns:
+        dict con la similitud coseno mínima, media y percentil 5 entre ambos
+    """
+    anterior = servicio.extractor_exportado
+    try:
+        servicio.extractor_exportado = None
+        eager = servicio.extraer_embeddings_batch(imagenes)
+        servicio.extractor_exportado = extractor
+        exportado = servicio.extraer_embeddings_batch(imagenes)
+    finally:
+        servicio.extractor_exportado = anterior
+
+    # Ambos embeddings ya están normalizados (L2)
+    similitudes = np.sum(eager * exportado, axis=1)
+    return {
+        'imagenes': int(similitudes.size),
+        'coseno_minimo': float(similitudes.min()),
+        'coseno_medio': float(similitudes.mean()),
+        'coseno_p5': float(np.percentile(similitudes, 5)),
+    }
@@ -0,0 +1,135 @@
+# apps/mascota/services/imagen_decodificada.py
+"""
+Imagen decodificada una sola vez y compartida por las etapas de un request.
+
+La validación canina (PIL), la biometría (array RGB de OpenCV) y el
+predictor de IA (tensor 224x224) partían cada uno de los bytes originales y
+volvían a leer y decodificar la imagen. ImagenDecodificada conserva los bytes
+leídos, decodifica bajo demanda una única vez y guarda en caché el resultado
+de cada preprocesamiento (p. ej. el tensor normalizado de cada modelo).
+"""
+
+import logging
+import os
+from io import BytesIO
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+class ImagenDecodificada:
+    """
+    Bytes originales de una imagen con sus representaciones decodificadas.
+
+    - contenido: bytes tal como se subieron o se leyeron del storage
+    - rgb: array uint8 (H, W, 3) en RGB
+    - pil: PIL.Image en modo RGB construida desde el mismo array
+    - preprocesado(clave, transform): resultado de transform(pil), en caché por clave
+    """
+
+    def __init__(self, contenido: bytes, nombre: str = ''):
+        if not contenido:
+            raise ValueError("La imagen está vacía")
+        self.contenido = contenido
+        self.nombre = nombre
+        self._rgb: Optional[np.ndarray] = None
+        self._pil = None
+        self._preprocesados: Dict[str, Any] = {}
+
+    @classmethod
+    def desde_bytes(cls, contenido: bytes, nombre: str = '') -> 'ImagenDecodificada':
+        return cls(contenido, nombre)
+
+    @classmethod
+    def desde_archivo(cls, archivo: Any) -> 'ImagenDecodificada':
+        """
+        Lee una sola vez el contenido de un archivo.
+
+        Args:
+            archivo: UploadedFile, FieldFile (cualquier storage), ruta local o
+                una ImagenDecodificada (se retorna tal cual)
+        """
+        if isinstance(archivo, cls):
+            return archivo
+
+        if isinstance(archivo, (str, os.PathLike)):
+            with open(archivo, 'rb') as f:
+                return cls(f.read(), os.path.basename(str(archivo)))
+
+        nombre = os.path.basename(getattr(archivo, 'name', '') or '')
+        if hasattr(archivo, 'storage'):
+            # FieldFile: se descarga del storage (local o Azure) una sola vez
+            with archivo.open('rb') as f:
+                contenido = f.read()
+        else:
+            # UploadedFile u objeto tipo archivo: volver al inicio para que pueda guardarse después
+            if hasattr(archivo, 'seek'):
+                archivo.seek(0)
+            contenido = archivo.read()
+            if hasattr(archivo, 'seek'):
+                archivo.seek(0)
+        return cls(contenido, nombre)
+
+    @property
+    def rgb(self) -> np.ndarray:
+        """Array uint8 (H, W, 3) RGB, decodificado en el primer acceso"""
+        if self._rgb is None:
+            self._rgb = self._decodificar()
+        return self._rgb
+
+    @property
+    def pil(self):
+        """PIL.Image RGB equivalente a `rgb` (sin volver a decodificar los bytes)"""
+        if self._pil is None:
+            if Image is None:
+                raise ImportError("Pillow no está instalado")
+            self._pil = Image.fromarray(self.rgb)
+        return self._pil
+
+    @property
+    def tamano(self):
+        """(ancho, alto) en píxeles"""
+        alto, ancho = self.rgb.shape[:2]
+        return ancho, alto
+
+    def preprocesado(self, clave: str, transform: Callable) -> Any:
+        """
+        Aplica `transform` a la imagen PIL una sola vez por clave.
+
+        Args:
+            clave: Identifica el preprocesamiento (p. ej. 'imagenet_256_224')
+            transform: Función que recibe la PIL.Image (p. ej. un transforms.Compose)
+        """
+        if clave not in self._preprocesados:
+            self._preprocesados[clave] = transform(self.pil)
+        return self._preprocesados[clave]
+
+    def _decodificar(self) -> np.ndarray:
+        # OpenCV primero: es el decodificador con el que se generaron los embeddings
+        # almacenados (aplica también la orientación EXIF)
+        if cv2 is not None:
+            img = cv2.imdecode(np.frombuffer(self.contenido, np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                raise ValueError(f"No se pudo decodificar la imagen '{self.nombre}'")
+            return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+        if Image is None:
+            raise ImportError("Se requiere opencv-python o Pillow para decodificar imágenes")
+        try:
+            from PIL import ImageOps
+            img = ImageOps.exif_transpose(Image.open(BytesIO(self.contenido)))
+            return np.array(img.convert('RGB'))
+        except Exception as e:
+            raise ValueError(f"No se pudo decodificar la imagen '{self.nombre}': {e}")
@@ -0,0 +1,561 @@
+# apps/mascota/services/indice_embeddings.py
+"""
+Índice de embeddings en memoria para el reconocimiento biométrico.
+
+Mantiene, por cada extractor de características, una matriz contigua float32
+con todos los vectores de EmbeddingStore, un arreglo fila -> mascota_id y las
+normas precalculadas. Una consulta se resuelve con un único producto
+matriz-vector en lugar de recorrer la base de datos en cada escaneo.
+
+Si existe una instantánea en disco para la versión activa de ModeloGlobal
+(ver snapshot_embeddings), sus arreglos se abren con memory-mapping como
+bloque base compartido entre procesos y solo los embeddings posteriores se
+cargan desde la base de datos.
+
+Con BIOMETRIA_BACKEND_BUSQUEDA = 'ivfpq' la base se consulta además mediante
+el índice aproximado IVF-PQ publicado junto a la instantánea (ver
+indice_ivfpq); las filas en memoria se siguen comparando de forma exacta.
+"""
+
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .vector_codec import vector_desde_campos
+
+logger = logging.getLogger(__name__)
+
+Bloque = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+class IndiceEmbeddings:
+    """
+    Índice residente en el proceso con los embeddings de un extractor.
+
+    - Se construye una sola vez desde la instantánea en disco o EmbeddingStore.
+    - Se refresca de forma incremental: agrega filas nuevas y retira las de
+      mascotas eliminadas sin reconstruir todo.
+    - Cuando se activa un ModeloGlobal con instantánea más nueva, se cambia
+      a ella de una sola vez.
+    - Las escrituras copian o amplían los arreglos sin modificar las filas que
+      un lector pueda estar usando, por lo que las consultas solo toman el
+      lock el tiempo necesario para obtener una instantánea.
+    """
+
+    CAPACIDAD_INICIAL = 1024
+    TAMANO_LOTE_CARGA = 2000
+
+    def __init__(self, modelo_extractor: str):
+        self.modelo_extractor = modelo_extractor
+        self.dimension: Optional[int] = None
+        self._lock = threading.RLock()
+        # Bloque base de solo lectura (memory-mapped) y versión de ModeloGlobal de la que proviene
+        self._base: Optional[Bloque] = None
+        self._version_snapshot: Optional[int] = None
+        # Filas agregadas en memoria después de la base
+        self._n = 0
+        self._ids = np.empty(0, dtype=np.int64)
+        self._etiquetas = np.empty(0, dtype=np.int64)
+        self._normas = np.empty(0, dtype=np.float32)
+        self._matriz = np.empty((0, 0), dtype=np.float32)
+        # Filas de la BD que no entran al índice (dimensión distinta o norma 0)
+        self._ids_omitidos: Set[int] = set()
+        self._ultimo_id = 0
+        self._construido = False
+        # Se incrementa con cada cambio; invalida el motor de puntuación cacheado
+        self._version = 0
+        self._motor = None
+        self._version_motor = -1
+        # Índice aproximado (IVF-PQ) sobre el bloque base, si se publicó con la instantánea
+        self._ann = None
+
+    # ------------------------------------------------------------------
+    # Estado
+    # ------------------------------------------------------------------
+    @property
+    def construido(self) -> bool:
+        return self._construido
+
+    @property
+    def total(self) -> int:
+        return self._n_base + self._n
+
+    @property
+    def version_snapshot(self) -> Optional[int]:
+        """Versión de ModeloGlobal de la instantánea en uso (None si se cargó desde la BD)"""
+        return self._version_snapshot
+
+    @property
+    def ann(self):
+        """IndiceIVFPQ sobre la base en uso, o None si no hay uno disponible"""
+        return self._ann
+
+    @property
+    def _n_base(self) -> int:
+        return 0 if self._base is None else self._base[0].shape[0]
+
+    def bloques(self) -> List[Bloque]:
+        """
+        Retorna los bloques (ids, etiquetas, matriz, normas) vigentes: la base
+        memory-mapped, si existe, y las filas en memoria. Las vistas siguen
+        siendo válidas aunque el índice se modifique después.
+        """
+        with self._lock:
+            bloques = []
+            if self._n_base:
+                bloques.append(self._base)
+            if self._n:
+                n = self._n
+                bloques.append((self._ids[:n], self._etiquetas[:n], self._matriz[:n], self._normas[:n]))
+            return bloques
+
+    def instantanea(self) -> Bloque:
+        """
+        Retorna (ids, etiquetas, matriz, normas) con todas las filas vigentes.
+        Con una base memory-mapped la matriz se copia en un solo arreglo;
+        para consultas conviene usar bloques() o motor_puntuacion().
+        """
+        bloques = self.bloques()
+        if len(bloques) == 1:
+            return bloques[0]
+        if not bloques:
+            return (
+                np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=np.int64),
+                np.empty((0, self.dimension or 0), dtype=np.float32),
+                np.empty(0, dtype=np.float32),
+            )
+        return tuple(np.concatenate(partes) for partes in zip(*bloques))
+
+    def _ids_locales(self) -> np.ndarray:
+        ids = self._ids[:self._n]
+        if self._n_base:
+            ids = np.concatenate([self._base[0], ids])
+        return ids
+
+    # ------------------------------------------------------------------
+    # Construcción y sincronización con la base de datos
+    # ------------------------------------------------------------------
+    def _queryset(self):
+        from ..models import EmbeddingStore
+        return EmbeddingStore.objects.filter(modelo_extractor=self.modelo_extractor)
+
+    def _version_modelo_activo(self) -> Optional[int]:
+        from ..models import ModeloGlobal
+        return (
+            ModeloGlobal.objects
+            .filter(activo=True, extractor_caracteristicas=self.modelo_extractor)
+            .order_by('-version')
+            .values_list('version', flat=True)
+            .first()
+        )
+
+    def construir(self, version_modelo: Optional[int] = None):
+        """
+        Carga desde cero todos los embeddings del extractor.
+
+        Args:
+            version_modelo: Versión de ModeloGlobal cuya instantánea se intenta
+                usar como base; si no existe se carga todo desde la BD
+        """
+        from .snapshot_embeddings import cargar_snapshot
+
+        snapshot = cargar_snapshot(self.modelo_extractor, version_modelo)
+        ann = None
+        if snapshot is not None and backend_busqueda() == 'ivfpq':
+            from .indice_ivfpq import IndiceIVFPQ
+            ann = IndiceIVFPQ.cargar(self.modelo_extractor, version_modelo)
+            if ann is not None and ann.total != snapshot['ids'].shape[0]:
+                logger.warning(f"Índice IVF-PQ v{version_modelo} no corresponde a la instantánea; se ignora")
+                ann = None
+
+        with self._lock:
+            # Arreglos nuevos: los lectores pueden conservar vistas de los anteriores
+            self._n = 0
+            self.dimension = None
+            self._ids = np.empty(0, dtype=np.int64)
+            self._etiquetas = np.empty(0, dtype=np.int64)
+            self._normas = np.empty(0, dtype=np.float32)
+            self._matriz = np.empty((0, 0), dtype=np.float32)
+            self._ids_omitidos = set()
+            self._ultimo_id = 0
+            self._base = None
+            self._version_snapshot = None
+            self._ann = None
+            self._version += 1
+
+            if snapshot is not None:
+                manifiesto = snapshot['manifiesto']
+                self._base = (snapshot['ids'], snapshot['etiquetas'], snapshot['matriz'], snapshot['normas'])
+                self._version_snapshot = version_modelo
+                self._ann = ann
+                self._ids_omitidos = set(manifiesto.get('omitidos', []))
+                self._ultimo_id = manifiesto.get('ultimo_id', 0)
+                self.dimension = manifiesto.get('dimension') or None
+                consulta = self._queryset().filter(id__gt=self._ultimo_id)
+            else:
+                consulta = self._queryset()
+
+            self._cargar_filas(consulta.order_by('id'))
+            self._construido = True
+            origen = f"instantánea v{version_modelo}" if snapshot is not None else "BD"
+            if self._ann is not None:
+                origen += " con índice IVF-PQ"
+            logger.info(
+                f"Índice de embeddings '{self.modelo_extractor}' construido desde {origen}: "
+                f"{self.total} vectores, {len(self._ids_omitidos)} omitidos"
+            )
+
+    def sincronizar(self):
+        """
+        Pone el índice al día con EmbeddingStore usando consultas de agregación
+        cuando no hay cambios. Si se activó un modelo con instantánea nueva se
+        cambia a ella; si hay filas nuevas solo se cargan esas; si el conteo no
+        cuadra (borrados hechos por otro proceso) se concilian los ids sin volver
+        a decodificar los vectores existentes.
+        """
+        from django.db.models import Count, Max
+        from .snapshot_embeddings import existe_snapshot
+
+        with self._lock:
+            version_activa = self._version_modelo_activo()
+            if not self._construido or (
+                version_activa != self._version_snapshot
+                and existe_snapshot(self.modelo_extractor, version_activa)
+            ):
+                self.construir(version_activa)
+
+            estado = self._queryset().aggregate(max_id=Max('id'), total=Count('id'))
+            max_id = estado['max_id'] or 0
+            total = estado['total'] or 0
+
+            if max_id > self._ultimo_id:
+                self._cargar_filas(self._queryset().filter(id__gt=self._ultimo_id).order_by('id'))
+
+            if total != self.total + len(self._ids_omitidos):
+                self._conciliar()
+
+    def _conciliar(self):
+        """Retira filas borradas en la BD y carga las que falten"""
+        ids_bd = np.fromiter(
+            self._queryset().values_list('id', flat=True).iterator(),
+            dtype=np.int64,
+        )
+
+        if self._n_base:
+            vigentes_base = np.isin(self._base[0], ids_bd)
+            if not vigentes_base.all():
+                self._materializar_base(vigentes_base)
+
+        vigentes = np.isin(self._ids[:self._n], ids_bd)
+        if not vigentes.all():
+            self._compactar(vigentes)
+
+        self._ids_omitidos &= set(ids_bd.tolist())
+
+        conocidos = np.concatenate([
+            self._ids_locales(),
+            np.fromiter(self._ids_omitidos, dtype=np.int64, count=len(self._ids_omitidos)),
+        ])
+        faltantes = np.setdiff1d(ids_bd, conocidos)
+        if faltantes.size:
+            self._cargar_filas(self._queryset().filter(id__in=faltantes.tolist()).order_by('id'))
+
+        logger.info(f"Índice '{self.modelo_extractor}' conciliado con la BD: {self.total} vectores")
+
+    def _cargar_filas(self, queryset):
+        """Decodifica las filas del queryset por lotes y las agrega al índice"""
+        ids, etiquetas, vectores = [], [], []
+        filas = queryset.values_list('id', 'mascota_id', 'vector_binario', 'vector').iterator(
+            chunk_size=self.TAMANO_LOTE_CARGA
+        )
+        for emb_id, mascota_id, binario, legado in filas:
+            ids.append(emb_id)
+            etiquetas.append(mascota_id)
+            try:
+                vectores.append(vector_desde_campos(binario, legado))
+            except ValueError as e:
+                logger.warning(f"Embedding {emb_id} con vector inválido: {e}")
+                vectores.append(None)
+            if len(ids) >= self.TAMANO_LOTE_CARGA:
+                self.agregar(ids, etiquetas, vectores)
+                ids, etiquetas, vectores = [], [], []
+        if ids:
+            self.agregar(ids, etiquetas, vectores)
+
+    # ------------------------------------------------------------------
+    # Modificaciones incrementales
+    # ------------------------------------------------------------------
+    def agregar(self, ids: Iterable[int], etiquetas: Iterable[int], vectores: Iterable):
+        """
+        Agrega vectores al índice.
+
+        Args:
+            ids: IDs de EmbeddingStore
+            etiquetas: IDs de mascota de cada vector
+            vectores: Vectores (listas, arrays o None) en el mismo orden
+        """
+        ids = list(ids)
+        etiquetas = list(etiquetas)
+        # Las filas sin vector (None) quedan vacías y se registran como omitidas
+        filas = [
+            np.empty(0, dtype=np.float32) if v is None else np.asarray(v, dtype=np.float32).ravel()
+            for v in vectores
+        ]
+        if not ids:
+            return
+
+        with self._lock:
+            # Ignorar filas que ya estén en el índice (p. ej. cargadas por una
+            # sincronización concurrente antes de registrarlas explícitamente)
+            repetidos = np.isin(np.asarray(ids, dtype=np.int64), self._ids_locales())
+            if repetidos.any() or self._ids_omitidos:
+                conservar = [
+                    i for i in range(len(ids))
+                    if not repetidos[i] and ids[i] not in self._ids_omitidos
+                ]
+                ids = [ids[i] for i in conservar]
+                etiquetas = [etiquetas[i] for i in conservar]
+                filas = [filas[i] for i in conservar]
+                if not ids:
+                    return
+
+            if self.dimension is None:
+                self.dimension = next((f.shape[0] for f in filas if f.size), None)
+
+            validas = []
+            for i, fila in enumerate(filas):
+                if fila.shape[0] != self.dimension or not np.any(fila):
+                    self._ids_omitidos.add(ids[i])
+                else:
+                    validas.append(i)
+
+            self._ultimo_id = max(self._ultimo_id, max(ids))
+            if not validas:
+                return
+
+            bloque = np.stack([filas[i] for i in validas])
+            k = bloque.shape[0]
+            self._reservar(k)
+
+            inicio, fin = self._n, self._n + k
+            self._matriz[inicio:fin] = bloque
+            self._normas[inicio:fin] = np.linalg.norm(bloque, axis=1)
+            self._ids[inicio:fin] = [ids[i] for i in validas]
+            self._etiquetas[inicio:fin] = [etiquetas[i] for i in validas]
+            self._n = fin
+            self._version += 1
+
+    def eliminar_mascota(self, mascota_id: int):
+        """Retira del índice todos los vectores de una mascota"""
+        with self._lock:
+            retirada = False
+            if self._n_base:
+                vigentes_base = self._base[1] != mascota_id
+                if not vigentes_base.all():
+                    self._materializar_base(vigentes_base)
+                    retirada = True
+
+            vigentes = self._etiquetas[:self._n] != mascota_id
+            if not vigentes.all():
+                self._compactar(vigentes)
+                retirada = True
+
+            if retirada:
+                logger.info(f"Mascota {mascota_id} retirada del índice '{self.modelo_extractor}'")
+
+    def _materializar_base(self, mascara: np.ndarray):
+        """
+        Copia a memoria las filas marcadas de la base (seguidas de las filas
+        en memoria) y deja de usar la instantánea. Solo ocurre al borrar
+        mascotas; el siguiente entrenamiento vuelve a generar una instantánea.
+        """
+        ids_base, etiquetas_base, matriz_base, normas_base = self._base
+        n = self._n
+        if n:
+            self._matriz = np.concatenate([matriz_base[mascara], self._matriz[:n]])
+        else:
+            self._matriz = np.ascontiguousarray(matriz_base[mascara])
+        self._ids = np.concatenate([ids_base[mascara], self._ids[:n]])
+        self._etiquetas = np.concatenate([etiquetas_base[mascara], self._etiquetas[:n]])
+        self._normas = np.concatenate([normas_base[mascara], self._normas[:n]])
+        self._n = self._ids.shape[0]
+        self._base = None
+        self._version_snapshot = None
+        self._ann = None
+        self._version += 1
+
+    def _reservar(self, extra: int):
+        """Amplía la capacidad (duplicándola) si no caben `extra` filas más"""
+        necesario = self._n + extra
+        capacidad = self._ids.shape[0]
+        if necesario <= capacidad and self._matriz.shape[1] == self.dimension:
+            return
+
+        nueva = max(self.CAPACIDAD_INICIAL, capacidad)
+        while nueva < necesario:
+            nueva *= 2
+
+        n = self._n
+        matriz = np.empty((nueva, self.dimension), dtype=np.float32)
+        ids = np.empty(nueva, dtype=np.int64)
+        etiquetas = np.empty(nueva, dtype=np.int64)
+        normas = np.empty(nueva, dtype=np.float32)
+        if n:
+            matriz[:n] = self._matriz[:n]
+            ids[:n] = self._ids[:n]
+            etiquetas[:n] = self._etiquetas[:n]
+            normas[:n] = self._normas[:n]
+        self._matriz, self._ids, self._etiquetas, self._normas = matriz, ids, etiquetas, normas
+
+    def _compactar(self, mascara: np.ndarray):
+        """Conserva solo las filas en memoria marcadas, en arreglos nuevos"""
+        n = self._n
+        self._matriz = np.ascontiguousarray(self._matriz[:n][mascara])
+        self._ids = self._ids[:n][mascara].copy()
+        self._etiquetas = self._etiquetas[:n][mascara].copy()
+        self._normas = self._normas[:n][mascara].copy()
+        self._n = self._ids.shape[0]
+        self._version += 1
+
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+    def motor_puntuacion(self):
+        """
+        Retorna un MotorPuntuacion sobre el contenido actual del índice.
+        La agrupación por mascota se recalcula solo cuando el índice cambia;
+        la base memory-mapped se usa directamente, sin copiarla.
+        """
+        from .puntuacion import MotorPuntuacion
+
+        with self._lock:
+            if self._motor is None or self._version_motor != self._version:
+                bloques = self.bloques()
+                if bloques:
+                    _, etiquetas, matrices, normas = zip(*bloques)
+                    self._motor = MotorPuntuacion(
+                        list(matrices), np.concatenate(etiquetas), np.concatenate(normas)
+                    )
+                else:
+                    self._motor = MotorPuntuacion(
+                        np.empty((0, 0), dtype=np.float32), np.empty(0, dtype=np.int64)
+                    )
+                self._version_motor = self._version
+            return self._motor
+
+    def similitudes(self, embedding_consulta: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Calcula la similitud coseno de la consulta contra todo el índice.
+
+        Returns:
+            Tuple con (etiquetas, similitudes) alineados por fila
+        """
+        consulta = np.asarray(embedding_consulta, dtype=np.float32).ravel()
+        norma_consulta = np.linalg.norm(consulta)
+        bloques = self.bloques()
+
+        if not bloques or norma_consulta == 0 or consulta.shape[0] != self.dimension:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        etiquetas = np.concatenate([b[1] for b in bloques])
+        similitudes = np.concatenate([
+            (matriz @ consulta) / (normas * norma_consulta)
+            for _, _, matriz, normas in bloques
+        ])
+        return etiquetas, similitudes
+
+    def predecir_aproximado(self, consultas: np.ndarray, nprobe: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        Predice con el índice IVF-PQ: la base solo aporta los candidatos del
+        índice aproximado, re-puntuados con su similitud exacta, y las filas
+        en memoria se comparan completas. Sin índice aproximado equivale a
+        motor_puntuacion().predecir().
+
+        Returns:
+            Lista [(ID de mascota predicha, confianza), ...] por consulta
+        """
+        from .puntuacion import puntuar_candidatos
+
+        with self._lock:
+            ann, base = self._ann, self._base
+            n = self._n
+            delta = (self._etiquetas[:n], self._matriz[:n], self._normas[:n])
+        if ann is None:
+            return self.motor_puntuacion().predecir(consultas)
+
+        Q = np.atleast_2d(np.asarray(consultas, dtype=np.float32))
+        if Q.shape[1] != self.dimension:
+            return [(-1, 0.0)] * Q.shape[0]
+        normas_q = np.linalg.norm(Q, axis=1)
+        ids_base, etiquetas_base, matriz_base, normas_base = base
+        sims_delta = (Q @ delta[1].T) / np.outer(np.where(normas_q > 0, normas_q, 1.0), delta[2]) if n else None
+
+        resultados = []
+        for i, (ids_cand, _, _) in enumerate(ann.buscar(Q, nprobe=nprobe)):
+            if normas_q[i] == 0:
+                resultados.append((-1, 0.0))
+                continue
+            # La base está ordenada por id: se ubican las filas de los candidatos
+            filas = np.sort(np.searchsorted(ids_base, ids_cand))
+            etiquetas = etiquetas_base[filas]
+            similitudes = (matriz_base[filas] @ Q[i]) / (normas_base[filas] * normas_q[i])
+            if sims_delta is not None:
+                etiquetas = np.concatenate([etiquetas, delta[0]])
+                similitudes = np.concatenate([similitudes, sims_delta[i]])
+            resultados.append(puntuar_candidatos(etiquetas, similitudes) if etiquetas.size else (-1, 0.0))
+        return resultados
+
+
+def backend_busqueda() -> str:
+    """Backend de búsqueda configurado: 'exacto' (por defecto) o 'ivfpq'"""
+    from django.conf import settings
+    return getattr(settings, 'BIOMETRIA_BACKEND_BUSQUEDA', 'exacto')
+
+
+# Índices por extractor (uno por proceso)
+_indices: Dict[str, IndiceEmbeddings] = {}
+_indices_lock = threading.Lock()
+
+
+def get_indice_embeddings(modelo_extractor: str = 'efficientnet_b0') -> IndiceEmbeddings:
+    """
+    Obtiene el índice del extractor indicado, creándolo si no existe.
+    El índice se carga desde la BD en la primera sincronización.
+    """
+    with _indices_lock:
+        indice = _indices.get(modelo_extractor)
+        if indice is None:
+            indice = IndiceEmbeddings(modelo_extractor)
+            _indices[modelo_extractor] = indice
+        return indice
+
+
+def registrar_embeddings(embedding_stores):
+    """
+    Agrega al índice en memoria los EmbeddingStore recién creados.
+    Si el índice todavía no se ha construido no hace nada: la primera
+    sincronización los cargará junto con el resto.
+    """
+    por_extractor: Dict[str, list] = {}
+    for emb in embedding_stores:
+        por_extractor.setdefault(emb.modelo_extractor, []).append(emb)
+
+    for extractor, embs in por_extractor.items():
+        indice = _indices.get(extractor)
+        if indice is None or not indice.construido:
+            continue
+        indice.agregar(
+            [e.id for e in embs],
+            [e.mascota_id for e in embs],
+            [e.array for e in embs],
+        )
+
+
+def descartar_mascota(mascota_id: int):
+    """Retira una mascota eliminada de todos los índices cargados"""
+    for indice in list(_indices.values()):
+        if indice.construido:
+            indice.eliminar_mascota(mascota_id)
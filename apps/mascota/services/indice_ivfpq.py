@@ -0,0 +1,264 @@
+# apps/mascota/services/indice_ivfpq.py
+"""
+Índice aproximado de vecinos más cercanos (IVF-PQ) para poblaciones grandes.
+
+- IVF: k-means sobre los embeddings normalizados define `n_listas` centroides
+  gruesos; cada vector se guarda en la lista de su centroide más cercano.
+- PQ: el residuo (vector - centroide) se divide en `m` subvectores y cada uno
+  se cuantiza contra un codebook de 2^nbits palabras, quedando m bytes por vector.
+
+Una consulta solo recorre las `nprobe` listas más cercanas y estima el
+producto interno con tablas precalculadas (ADC):
+    <q, x> ≈ <q, centroide> + Σ_m <q_m, codebook_m[código_m]>
+Solo usa NumPy y scikit-learn (k-means).
+"""
+
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .puntuacion import puntuar_candidatos
+
+logger = logging.getLogger(__name__)
+
+
+class IndiceIVFPQ:
+    """Índice IVF con residuos comprimidos por cuantización de producto"""
+
+    ARREGLOS = ('centroides', 'codebooks', 'codigos', 'offsets', 'ids', 'etiquetas')
+    MUESTRA_ENTRENAMIENTO = 100_000
+    TAMANO_BLOQUE_CODIFICACION = 20_000
+
+    def __init__(self, n_listas: Optional[int] = None, m: int = 16, nbits: int = 8,
+                 nprobe: int = 8, candidatos: int = 200):
+        """
+        Args:
+            n_listas: Centroides gruesos; por defecto ~4·√N al construir
+            m: Subvectores de la cuantización de producto (bytes por vector)
+            nbits: Bits por subvector (máximo 8: códigos uint8)
+            nprobe: Listas que se recorren en cada consulta
+            candidatos: Vecinos aproximados que se devuelven por consulta
+        """
+        if not 1 <= nbits <= 8:
+            raise ValueError("nbits debe estar entre 1 y 8")
+        self.n_listas = n_listas
+        self.m = m
+        self.nbits = nbits
+        self.nprobe = nprobe
+        self.candidatos = candidatos
+
+        self.dimension: Optional[int] = None
+        self.centroides: Optional[np.ndarray] = None  # (L, D')
+        self.codebooks: Optional[np.ndarray] = None  # (m, ksub, dsub)
+        self.codigos: Optional[np.ndarray] = None  # (N, m) uint8, agrupados por lista
+        self.offsets: Optional[np.ndarray] = None  # (L + 1,) inicio de cada lista
+        self.ids: Optional[np.ndarray] = None
+        self.etiquetas: Optional[np.ndarray] = None
+
+    # ------------------------------------------------------------------
+    # Construcción
+    # ------------------------------------------------------------------
+    @property
+    def total(self) -> int:
+        return 0 if self.ids is None else self.ids.shape[0]
+
+    def _preparar(self, X: np.ndarray) -> np.ndarray:
+        """Normaliza (L2) y rellena con ceros hasta un múltiplo de m"""
+        X = np.asarray(X, dtype=np.float32)
+        normas = np.linalg.norm(X, axis=1, keepdims=True)
+        X = np.divide(X, normas, out=np.zeros_like(X), where=normas > 0)
+        relleno = (-X.shape[1]) % self.m
+        if relleno:
+            X = np.pad(X, ((0, 0), (0, relleno)))
+        return X
+
+    @staticmethod
+    def _kmeans(X: np.ndarray, k: int) -> np.ndarray:
+        from sklearn.cluster import MiniBatchKMeans
+
+        modelo = MiniBatchKMeans(
+            n_clusters=k,
+            batch_size=max(1024, 4 * k),
+            n_init=3,
+            random_state=0,
+        )
+        modelo.fit(X)
+        return modelo.cluster_centers_.astype(np.float32)
+
+    def construir(self, ids: np.ndarray, etiquetas: np.ndarray, X: np.ndarray) -> 'IndiceIVFPQ':
+        """
+        Entrena los centroides y codebooks y codifica todos los vectores.
+
+        Args:
+            ids: IDs de EmbeddingStore (N,)
+            etiquetas: mascota_id de cada fila (N,)
+            X: Embeddings (N, D)
+        """
+        inicio = time.time()
+        n = X.shape[0]
+        if n == 0:
+            raise ValueError("No hay vectores para construir el índice IVF-PQ")
+
+        self.dimension = X.shape[1]
+        if self.n_listas is None:
+            self.n_listas = int(np.clip(4 * np.sqrt(n), 1, max(1, n // 39)))
+        self.n_listas = min(self.n_listas, n)
+
+        rng = np.random.default_rng(0)
+        muestra = rng.choice(n, size=min(n, self.MUESTRA_ENTRENAMIENTO), replace=False)
+        X_muestra = self._preparar(X[np.sort(muestra)])
+
+        # Centroides gruesos y residuos de la muestra
+        self.centroides = self._kmeans(X_muestra, self.n_listas)
+        residuos = X_muestra - self.centroides[self._lista_mas_cercana(X_muestra)]
+
+        # Un codebook por subespacio
+        ksub = min(2 ** self.nbits, residuos.shape[0])
+        dsub = residuos.shape[1] // self.m
+        self.codebooks = np.stack([
+            self._kmeans(residuos[:, j * dsub:(j + 1) * dsub], ksub)
+            for j in range(self.m)
+        ])
+
+        # Codificar todos los vectores por bloques
+        listas = np.empty(n, dtype=np.int64)
+        codigos = np.empty((n, self.m), dtype=np.uint8)
+        for i in range(0, n, self.TAMANO_BLOQUE_CODIFICACION):
+            bloque = self._preparar(X[i:i + self.TAMANO_BLOQUE_CODIFICACION])
+            listas[i:i + bloque.shape[0]], codigos[i:i + bloque.shape[0]] = self._codificar(bloque)
+
+        # Agrupar las filas por lista invertida
+        orden = np.argsort(listas, kind='stable')
+        self.codigos = codigos[orden]
+        self.ids = np.asarray(ids, dtype=np.int64)[orden]
+        self.etiquetas = np.asarray(etiquetas, dtype=np.int64)[orden]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(listas, minlength=self.n_listas))])
+
+        logger.info(
+            f"Índice IVF-PQ construido: {n} vectores, {self.n_listas} listas, "
+            f"m={self.m}, {ksub} palabras por subespacio ({time.time() - inicio:.1f}s)"
+        )
+        return self
+
+    def _lista_mas_cercana(self, X: np.ndarray) -> np.ndarray:
+        # Con vectores normalizados, el centroide más cercano es el de mayor producto interno ajustado
+        distancias = np.sum(self.centroides ** 2, axis=1)[None, :] - 2 * (X @ self.centroides.T)
+        return np.argmin(distancias, axis=1)
+
+    def _codificar(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        listas = self._lista_mas_cercana(X)
+        residuos = X - self.centroides[listas]
+        dsub = residuos.shape[1] // self.m
+        codigos = np.empty((X.shape[0], self.m), dtype=np.uint8)
+        for j in range(self.m):
+            sub = residuos[:, j * dsub:(j + 1) * dsub]
+            palabras = self.codebooks[j]
+            distancias = np.sum(palabras ** 2, axis=1)[None, :] - 2 * (sub @ palabras.T)
+            codigos[:, j] = np.argmin(distancias, axis=1)
+        return listas, codigos
+
+    # ------------------------------------------------------------------
+    # Búsqueda
+    # ------------------------------------------------------------------
+    def buscar(self, consultas: np.ndarray, nprobe: Optional[int] = None,
+               candidatos: Optional[int] = None) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Busca los vecinos aproximados de cada consulta.
+
+        Returns:
+            Lista con (ids, etiquetas, similitudes aproximadas) por consulta,
+            ordenados de mayor a menor similitud
+        """
+        nprobe = min(nprobe or self.nprobe, self.n_listas)
+        candidatos = candidatos or self.candidatos
+
+        Q = self._preparar(np.atleast_2d(consultas))
+        gruesas = Q @ self.centroides.T  # (Q, L)
+        dsub = Q.shape[1] // self.m
+        # Tabla (Q, m, ksub) con <q_m, palabra> para cada subespacio
+        tablas = np.einsum('qmd,mkd->qmk', Q.reshape(Q.shape[0], self.m, dsub), self.codebooks)
+        subespacios = np.arange(self.m)
+
+        resultados = []
+        for i in range(Q.shape[0]):
+            if nprobe < self.n_listas:
+                listas = np.argpartition(-gruesas[i], nprobe - 1)[:nprobe]
+            else:
+                listas = np.arange(self.n_listas)
+
+            rangos = [np.arange(self.offsets[l], self.offsets[l + 1]) for l in listas]
+            filas = np.concatenate(rangos) if rangos else np.empty(0, dtype=np.int64)
+            if filas.size == 0:
+                resultados.append((np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)))
+                continue
+
+            base = np.repeat(gruesas[i, listas], [r.size for r in rangos])
+            similitudes = base + tablas[i][subespacios, self.codigos[filas]].sum(axis=1)
+
+            if filas.size > candidatos:
+                mejores = np.argpartition(-similitudes, candidatos - 1)[:candidatos]
+            else:
+                mejores = np.arange(filas.size)
+            mejores = mejores[np.argsort(-similitudes[mejores], kind='stable')]
+            filas = filas[mejores]
+            resultados.append((self.ids[filas], self.etiquetas[filas], similitudes[mejores]))
+
+        return resultados
+
+    def predecir(self, consultas: np.ndarray, nprobe: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        Retorna [(ID de mascota predicha, confianza), ...] aplicando la
+        puntuación por mascota sobre los candidatos aproximados.
+        """
+        return [
+            puntuar_candidatos(etiquetas, similitudes) if etiquetas.size else (-1, 0.0)
+            for _, etiquetas, similitudes in self.buscar(consultas, nprobe=nprobe)
+        ]
+
+    # ------------------------------------------------------------------
+    # Persistencia (junto a la instantánea de la versión del modelo)
+    # ------------------------------------------------------------------
+    def guardar(self, modelo_extractor: str, version: int):
+        """Publica los arreglos del índice junto a la instantánea de esa versión"""
+        from .snapshot_embeddings import publicar_arreglo, publicar_json
+
+        for nombre in self.ARREGLOS:
+            publicar_arreglo(modelo_extractor, version, f"ivfpq_{nombre}", getattr(self, nombre))
+        publicar_json(modelo_extractor, version, 'ivfpq', self.parametros())
+
+    @classmethod
+    def cargar(cls, modelo_extractor: str, version: Optional[int]) -> Optional['IndiceIVFPQ']:
+        """Abre con memory-mapping el índice de una versión; None si no existe"""
+        from .snapshot_embeddings import cargar_arreglo, cargar_json
+
+        parametros = cargar_json(modelo_extractor, version, 'ivfpq')
+        if parametros is None:
+            return None
+        try:
+            indice = cls(
+                n_listas=parametros['n_listas'],
+                m=parametros['m'],
+                nbits=parametros['nbits'],
+                nprobe=parametros['nprobe'],
+                candidatos=parametros['candidatos'],
+            )
+            indice.dimension = parametros['dimension']
+            for nombre in cls.ARREGLOS:
+                setattr(indice, nombre, cargar_arreglo(modelo_extractor, version, f"ivfpq_{nombre}"))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"No se pudo abrir el índice IVF-PQ v{version} de '{modelo_extractor}': {e}")
+            return None
+        return indice
+
+    def parametros(self) -> Dict:
+        return {
+            'n_listas': self.n_listas,
+            'm': self.m,
+            'nbits': self.nbits,
+            'nprobe': self.nprobe,
+            'candidatos': self.candidatos,
+            'dimension': self.dimension,
+            'total': self.total,
+        }
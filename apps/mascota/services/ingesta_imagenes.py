@@ -0,0 +1,83 @@
+# apps/mascota/services/ingesta_imagenes.py
+"""
+Ingesta de imágenes biométricas subidas en lote.
+
+Cada imagen implica una subida al storage (Azure Blob en producción) y un
+INSERT. En lugar de hacerlo imagen por imagen, las subidas se envían en
+paralelo a un pool de hilos acotado y las filas de ImagenMascota se crean
+con un único bulk_create cuando todos los archivos ya están en el storage.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Sequence, Tuple
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+def guardar_imagenes_biometricas(mascota, archivos: Sequence[Tuple[str, bytes]]) -> Tuple[List, List[Tuple[str, str]]]:
+    """
+    Sube las imágenes al storage en paralelo y crea sus registros.
+
+    Args:
+        mascota: Mascota a la que pertenecen las imágenes
+        archivos: Lista de (nombre original, contenido en bytes)
+
+    Returns:
+        Tuple con (ImagenMascota creadas en el orden recibido,
+        [(nombre original, error)] de las que no se pudieron subir)
+    """
+    from ..models import ImagenMascota
+
+    if not archivos:
+        return [], []
+
+    campo = ImagenMascota._meta.get_field('imagen')
+    imagenes = [
+        ImagenMascota(mascota=mascota, tipo='biometrica', is_biometrica=True)
+        for _ in archivos
+    ]
+    # Los nombres se generan en este hilo (upload_to usa la instancia)
+    destinos = [
+        campo.generate_filename(imagen, nombre)
+        for imagen, (nombre, _) in zip(imagenes, archivos)
+    ]
+
+    def subir(destino, contenido):
+        return campo.storage.save(destino, ContentFile(contenido), max_length=campo.max_length)
+
+    hilos = max(1, min(getattr(settings, 'BIOMETRIA_SUBIDAS_PARALELAS', 4), len(archivos)))
+    with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='subida-biometria') as pool:
+        futuros = [
+            pool.submit(subir, destino, contenido)
+            for destino, (_, contenido) in zip(destinos, archivos)
+        ]
+
+    subidas, errores = [], []
+    for imagen, futuro, (nombre, _) in zip(imagenes, futuros, archivos):
+        try:
+            # Asignar el nombre guardado deja el archivo marcado como ya subido
+            imagen.imagen = futuro.result()
+            subidas.append(imagen)
+        except Exception as e:
+            logger.error(f"Error subiendo imagen '{nombre}' de la mascota {mascota.id}: {e}")
+            errores.append((nombre, str(e)))
+
+    try:
+        with transaction.atomic():
+            ImagenMascota.objects.bulk_create(subidas)
+    except Exception:
+        # Sin registros los archivos quedarían huérfanos en el storage
+        for imagen in subidas:
+            try:
+                campo.storage.delete(imagen.imagen.name)
+            except Exception as e:
+                logger.warning(f"No se pudo eliminar el archivo huérfano '{imagen.imagen.name}': {e}")
+        raise
+
+    logger.info(f"{len(subidas)} imágenes biométricas guardadas para la mascota {mascota.id} ({hilos} subidas en paralelo)")
+    return subidas, errores
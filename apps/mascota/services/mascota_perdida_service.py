@@ -2,11 +2,16 @@
 Servicio para la gestión de mascotas perdidas
 Maneja la lógica de negocio para reportar mascotas perdidas y encontradas
 """
+from datetime import datetime
+from django.db import transaction
+from django.db.models import Count, Max, Q
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 # Removed GIS dependencies - using simple location tracking instead
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 import logging
-from .email_service import EmailService
+from . import envios_masivos, notificaciones
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +20,7 @@ class MascotaPerdidaService:
     """Servicio para manejar la lógica de mascotas perdidas"""
     
     @staticmethod
-    def reportar_como_perdida(mascota, usuario_reporte, ubicacion_perdida: Optional[str] = None) -> Tuple[bool, str]:
+    def reportar_como_perdida(mascota, usuario_reporte, ubicacion_perdida: Optional[str] = None, coordenadas: Optional[Tuple[float, float]] = None) -> Tuple[bool, str]:
         """
         Reporta una mascota como perdida
         
@@ -23,6 +28,8 @@ class MascotaPerdidaService:
             mascota: Instancia del modelo Mascota
             usuario_reporte: Usuario que reporta (debe ser el propietario)
             ubicacion_perdida: Descripción de la ubicación donde se perdió
+            coordenadas: (latitud, longitud) donde se perdió; con ellas la alerta
+                solo se envía a los usuarios cercanos
             
         Returns:
             Tuple[bool, str]: (éxito, mensaje)
@@ -36,24 +43,53 @@ class MascotaPerdidaService:
             if mascota.reportar_perdida:
                 return False, f"{mascota.nombre} ya está reportada como perdida"
             
-            # Marcar como perdida
-            mascota.reportar_perdida = True
-            mascota.save(update_fields=['reportar_perdida'])
+            from ..models import NotificacionSaliente
             
-            # Enviar confirmación al propietario
-            EmailService.enviar_confirmacion_reporte_perdida(mascota)
-            
-            # Enviar alerta a todos los usuarios
-            EmailService.enviar_alerta_mascota_perdida(mascota, ubicacion_perdida)
+            # Marcar como perdida y registrar las notificaciones en la misma transacción;
+            # el worker de la bandeja de salida envía la confirmación y la alerta
+            with transaction.atomic():
+                mascota.reportar_perdida = True
+                mascota.latitud_perdida, mascota.longitud_perdida = coordenadas or (None, None)
+                mascota.save(update_fields=['reportar_perdida', 'latitud_perdida', 'longitud_perdida', 'updated_at'])
+                
+                if mascota.propietario.email:
+                    notificaciones.registrar_evento(
+                        mascota, NotificacionSaliente.EVENTO_CONFIRMACION_PERDIDA, mascota.propietario.email
+                    )
+                notificaciones.registrar_evento(
+                    mascota, NotificacionSaliente.EVENTO_ALERTA_PERDIDA,
+                    datos={'ubicacion_perdida': ubicacion_perdida}
+                )
             
             logger.info(f"Mascota {mascota.nombre} (ID: {mascota.id}) reportada como perdida por {usuario_reporte.username}")
             
-            return True, f"{mascota.nombre} ha sido reportada como perdida. Se ha enviado una alerta a todos los usuarios."
+            if not envios_masivos.hay_destinatarios(mascota):
+                if coordenadas:
+                    return True, f"{mascota.nombre} ha sido reportada como perdida. No se encontraron usuarios cercanos a quienes alertar."
+                return True, f"{mascota.nombre} ha sido reportada como perdida. No hay otros usuarios con email a quienes alertar."
+            destinatarios = "los usuarios cercanos" if coordenadas else "todos los usuarios"
+            return True, f"{mascota.nombre} ha sido reportada como perdida. Se está enviando una alerta a {destinatarios}."
             
         except Exception as e:
             logger.error(f"Error reportando mascota perdida: {str(e)}")
             return False, f"Error interno del servidor: {str(e)}"
     
+    @staticmethod
+    def parsear_coordenadas(latitud, longitud) -> Optional[Tuple[float, float]]:
+        """
+        Convierte latitud y longitud recibidas del navegador
+        
+        Returns:
+            Tuple[float, float]: (latitud, longitud), o None si faltan o no son válidas
+        """
+        try:
+            latitud, longitud = float(latitud), float(longitud)
+        except (TypeError, ValueError):
+            return None
+        if not (-90 <= latitud <= 90 and -180 <= longitud <= 180):
+            return None
+        return latitud, longitud
+    
     @staticmethod
     def reportar_como_encontrada(mascota, ip_address: Optional[str] = None, user_agent: Optional[str] = None, ubicacion_data: Optional[Dict] = None) -> Tuple[bool, str]:
         """
@@ -76,17 +112,24 @@ class MascotaPerdidaService:
             # Obtener datos de ubicación y tiempo del encuentro
             datos_encuentro = MascotaPerdidaService._obtener_datos_encuentro(ip_address, user_agent, ubicacion_data)
             
-            # Marcar como encontrada (quitar el flag de perdida)
-            mascota.reportar_perdida = False
-            mascota.save(update_fields=['reportar_perdida'])
+            from ..models import NotificacionSaliente
             
-            # Enviar notificación al propietario
-            exito_email = EmailService.enviar_notificacion_mascota_encontrada(mascota, datos_encuentro)
+            # Marcar como encontrada (quitar el flag de perdida) y encolar la notificación al propietario;
+            # los reportes repetidos (p. ej. varios escaneos del QR) se combinan en una sola
+            with transaction.atomic():
+                mascota.reportar_perdida = False
+                mascota.save(update_fields=['reportar_perdida', 'updated_at'])
+                
+                if mascota.propietario.email:
+                    notificaciones.registrar_evento(
+                        mascota, NotificacionSaliente.EVENTO_MASCOTA_ENCONTRADA,
+                        mascota.propietario.email, datos_encuentro
+                    )
             
-            mensaje_base = f"¡{mascota.nombre} ha sido reportada como encontrada! El propietario ha sido notificado."
+            mensaje_base = f"¡{mascota.nombre} ha sido reportada como encontrada! El propietario será notificado."
             
-            if not exito_email:
-                mensaje_base += " (Nota: No se pudo enviar el email de notificación)"
+            if not mascota.propietario.email:
+                mensaje_base += " (Nota: El propietario no tiene un email configurado)"
             
             logger.info(f"Mascota {mascota.nombre} (ID: {mascota.id}) reportada como encontrada")
             
@@ -117,9 +160,16 @@ class MascotaPerdidaService:
             if not mascota.reportar_perdida:
                 return False, f"{mascota.nombre} no está reportada como perdida"
             
-            # Cancelar reporte
-            mascota.reportar_perdida = False
-            mascota.save(update_fields=['reportar_perdida'])
+            from ..models import NotificacionSaliente
+            
+            # Cancelar reporte y descartar la confirmación y la alerta que aún no se enviaron
+            with transaction.atomic():
+                mascota.reportar_perdida = False
+                mascota.save(update_fields=['reportar_perdida', 'updated_at'])
+                notificaciones.descartar_pendientes(mascota, [
+                    NotificacionSaliente.EVENTO_CONFIRMACION_PERDIDA,
+                    NotificacionSaliente.EVENTO_ALERTA_PERDIDA,
+                ])
             
             logger.info(f"Reporte de mascota perdida cancelado para {mascota.nombre} (ID: {mascota.id}) por {usuario_cancelacion.username}")
             
@@ -223,7 +273,79 @@ class MascotaPerdidaService:
             # queryset = queryset.exclude(propietario=usuario_actual)
             pass
         
-        return queryset.order_by('-updated_at')
+        # El id desempata reportes con el mismo updated_at (orden total para la paginación por cursor)
+        return queryset.order_by('-updated_at', '-id')
+    
+    @staticmethod
+    def version_mascotas_perdidas() -> Tuple[int, Optional[datetime]]:
+        """
+        Versión de la lista de mascotas perdidas: (cantidad, última actualización).
+        Cambia al reportar, encontrar, cancelar o editar una mascota perdida.
+        """
+        from ..models import Mascota
+        
+        estado = Mascota.objects.filter(reportar_perdida=True).aggregate(
+            total=Count('id'), ultima=Max('updated_at')
+        )
+        return estado['total'], estado['ultima']
+    
+    @staticmethod
+    def codificar_cursor(mascota) -> str:
+        """Cursor opaco que apunta a la posición después de `mascota` en (updated_at, id) descendente"""
+        valor = f"{mascota.updated_at.isoformat()}|{mascota.id}"
+        return urlsafe_base64_encode(valor.encode())
+    
+    @staticmethod
+    def decodificar_cursor(cursor: str) -> Tuple[datetime, int]:
+        """
+        Returns:
+            Tuple[datetime, int]: (updated_at, id) de la última mascota de la página anterior
+            
+        Raises:
+            ValueError: Si el cursor no es válido
+        """
+        try:
+            fecha, mascota_id = urlsafe_base64_decode(cursor).decode().split('|')
+            updated_at = parse_datetime(fecha)
+            mascota_id = int(mascota_id)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise ValueError("Cursor inválido")
+        if updated_at is None:
+            raise ValueError("Cursor inválido")
+        return updated_at, mascota_id
+    
+    @staticmethod
+    def pagina_mascotas_perdidas(cursor: Optional[str] = None, limite: int = 50) -> Tuple[List, Optional[str]]:
+        """
+        Página de mascotas perdidas con paginación por cursor (keyset) sobre (updated_at, id).
+        
+        A diferencia de OFFSET, el costo no crece con el número de página y los
+        reportes nuevos no desplazan los elementos entre páginas.
+        
+        Args:
+            cursor: Cursor devuelto por la página anterior (None para la primera)
+            limite: Mascotas por página
+            
+        Returns:
+            Tuple[List, Optional[str]]: (mascotas, cursor de la página siguiente o None si es la última)
+            
+        Raises:
+            ValueError: Si el cursor no es válido
+        """
+        queryset = MascotaPerdidaService.obtener_mascotas_perdidas()
+        if cursor:
+            updated_at, mascota_id = MascotaPerdidaService.decodificar_cursor(cursor)
+            queryset = queryset.filter(
+                Q(updated_at__lt=updated_at) | Q(updated_at=updated_at, id__lt=mascota_id)
+            )
+        
+        # Un elemento extra indica si hay página siguiente
+        mascotas = list(queryset[:limite + 1])
+        siguiente = None
+        if len(mascotas) > limite:
+            mascotas = mascotas[:limite]
+            siguiente = MascotaPerdidaService.codificar_cursor(mascotas[-1])
+        return mascotas, siguiente
     
     @staticmethod
     def verificar_puede_reportar_perdida(mascota, usuario) -> Tuple[bool, str]:
@@ -0,0 +1,338 @@
+# apps/mascota/services/notificaciones.py
+"""
+Bandeja de salida transaccional (tabla NotificacionSaliente) de las
+notificaciones de mascotas perdidas.
+
+MascotaPerdidaService ya no llama a EmailService dentro de la petición:
+registra el evento en la misma transacción que el cambio de la mascota y
+responde. Un worker reclama las notificaciones pendientes por lotes y las
+envía sobre una sola conexión de email por lote, así la latencia de la
+petición no depende del servidor SMTP.
+
+- Deduplicación: los eventos de una mascota del mismo tipo dentro de
+  NOTIFICACIONES_VENTANA_SEGUNDOS comparten clave y se combinan en una fila
+  (p. ej. escanear varias veces el QR envía una sola notificación al
+  propietario, con los datos del último encuentro).
+- Límite por destinatario: a lo sumo NOTIFICACIONES_MAX_POR_DESTINATARIO
+  emails cada NOTIFICACIONES_PERIODO_LIMITE segundos; el resto espera.
+
+El worker es un hilo del servidor (EMAIL_ENVIOS_WORKER='hilo') o el comando
+`manage.py procesar_notificaciones` ('comando'). El hilo no termina mientras
+queden notificaciones reprogramadas o en espera por el límite: duerme hasta
+el próximo intento (o hasta que llegue un evento nuevo).
+"""
+
+import logging
+import threading
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import connections, transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .email_service import EmailService
+from .envios_masivos import WORKER_HILO, crear_alerta_mascota_perdida
+from .trabajos_biometricos import calcular_espera
+
+logger = logging.getLogger(__name__)
+
+# Una notificación 'enviando' sin terminar en este tiempo se considera abandonada
+TIEMPO_MAXIMO_ENVIANDO = timedelta(minutes=10)
+# Espera mínima del hilo entre recorridos (p. ej. si otro worker tiene tomada la notificación lista)
+ESPERA_MINIMA_SEGUNDOS = 1.0
+
+
+def _ajuste(nombre: str, defecto: int) -> int:
+    return int(getattr(settings, nombre, defecto))
+
+
+def clave_deduplicacion(mascota_id: int, evento: str, momento=None) -> str:
+    """Clave compartida por los eventos de la mascota dentro de la misma ventana de tiempo"""
+    ventana = max(1, _ajuste('NOTIFICACIONES_VENTANA_SEGUNDOS', 600))
+    momento = momento or timezone.now()
+    return f"{mascota_id}:{evento}:{int(momento.timestamp()) // ventana}"
+
+
+def registrar_evento(mascota, evento: str, destinatario: str = '', datos: Optional[Dict] = None):
+    """
+    Escribe (o combina) la notificación de un evento en la bandeja de salida.
+    Debe llamarse dentro de la transacción que cambia el estado de la mascota.
+
+    Returns:
+        NotificacionSaliente registrada
+    """
+    from ..models import NotificacionSaliente
+
+    clave = clave_deduplicacion(mascota.id, evento)
+    with transaction.atomic():
+        notificacion, creada = NotificacionSaliente.objects.select_for_update().get_or_create(
+            clave_deduplicacion=clave,
+            defaults={
+                'mascota': mascota,
+                'evento': evento,
+                'destinatario': destinatario,
+                'datos': datos or {},
+            },
+        )
+        if not creada:
+            notificacion.coalescidos += 1
+            campos = ['coalescidos', 'actualizado']
+            # Pendiente (o descartada por una cancelación): se envía una sola vez con los datos más recientes
+            if notificacion.estado in (NotificacionSaliente.ESTADO_PENDIENTE, NotificacionSaliente.ESTADO_DESCARTADO):
+                notificacion.estado = NotificacionSaliente.ESTADO_PENDIENTE
+                notificacion.destinatario = destinatario
+                notificacion.datos = datos or {}
+                campos += ['estado', 'destinatario', 'datos']
+            notificacion.save(update_fields=campos)
+            logger.info(f"Evento {evento} de la mascota {mascota.id} combinado con la notificación {notificacion.id}")
+
+    transaction.on_commit(lanzar_worker)
+    return notificacion
+
+
+def descartar_pendientes(mascota, eventos: List[str]) -> int:
+    """Descarta las notificaciones aún no enviadas de la mascota (p. ej. al cancelar el reporte)"""
+    from ..models import NotificacionSaliente
+
+    return NotificacionSaliente.objects.filter(
+        mascota=mascota,
+        evento__in=eventos,
+        estado=NotificacionSaliente.ESTADO_PENDIENTE,
+    ).update(estado=NotificacionSaliente.ESTADO_DESCARTADO, actualizado=timezone.now())
+
+
+# --- Worker ---------------------------------------------------------------
+
+_hilo = None
+_hilo_lock = threading.Lock()
+_hay_nuevas = threading.Event()
+
+
+def lanzar_worker():
+    """Vacía la bandeja en un hilo del servidor si EMAIL_ENVIOS_WORKER='hilo' (un solo hilo por proceso)"""
+    global _hilo
+    if getattr(settings, 'EMAIL_ENVIOS_WORKER', WORKER_HILO) != WORKER_HILO:
+        return
+    with _hilo_lock:
+        _hay_nuevas.set()
+        if _hilo is not None:
+            return
+        _hilo = threading.Thread(target=_vaciar_en_hilo, name='notificaciones-salientes', daemon=True)
+        _hilo.start()
+
+
+def _vaciar_en_hilo():
+    global _hilo
+    try:
+        while True:
+            with _hilo_lock:
+                _hay_nuevas.clear()
+            while procesar_lote():
+                pass
+            espera = segundos_hasta_siguiente()
+            # Los eventos registrados mientras se vaciaba la bandeja vuelven a recorrerla
+            with _hilo_lock:
+                if espera is None and not _hay_nuevas.is_set():
+                    _hilo = None
+                    return
+            if espera is not None:
+                # Un evento nuevo despierta el hilo antes de tiempo
+                _hay_nuevas.wait(espera)
+    except Exception as e:
+        logger.error(f"Error en el hilo de notificaciones: {e}", exc_info=True)
+        with _hilo_lock:
+            _hilo = None
+    finally:
+        # Las conexiones a la base de datos son por hilo
+        connections.close_all()
+
+
+def segundos_hasta_siguiente() -> Optional[float]:
+    """
+    Segundos hasta que una notificación reprogramada, en espera por el límite
+    o abandonada en 'enviando' vuelva a estar lista; None si no queda ninguna.
+    """
+    from ..models import NotificacionSaliente
+
+    proximos = []
+    pendiente = (
+        NotificacionSaliente.objects
+        .filter(estado=NotificacionSaliente.ESTADO_PENDIENTE)
+        .aggregate(proximo=Min('proximo_intento'))['proximo']
+    )
+    if pendiente is not None:
+        proximos.append(pendiente)
+    enviando = (
+        NotificacionSaliente.objects
+        .filter(estado=NotificacionSaliente.ESTADO_ENVIANDO)
+        .aggregate(iniciado=Min('iniciado'))['iniciado']
+    )
+    if enviando is not None:
+        proximos.append(enviando + TIEMPO_MAXIMO_ENVIANDO)
+    if not proximos:
+        return None
+    return max(ESPERA_MINIMA_SEGUNDOS, (min(proximos) - timezone.now()).total_seconds())
+
+
+def reclamar_notificaciones(limite: int) -> List:
+    """
+    Marca como 'enviando' hasta `limite` notificaciones listas.
+    Varios workers pueden reclamar a la vez sin tomar la misma.
+    """
+    from ..models import NotificacionSaliente
+
+    ahora = timezone.now()
+    listas = (
+        Q(estado=NotificacionSaliente.ESTADO_PENDIENTE, proximo_intento__lte=ahora)
+        | Q(estado=NotificacionSaliente.ESTADO_ENVIANDO, iniciado__lt=ahora - TIEMPO_MAXIMO_ENVIANDO)
+    )
+
+    with transaction.atomic():
+        notificaciones = list(
+            NotificacionSaliente.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .filter(listas)
+            .select_related('mascota__propietario')
+            .order_by('proximo_intento', 'id')[:limite]
+        )
+        for notificacion in notificaciones:
+            notificacion.estado = NotificacionSaliente.ESTADO_ENVIANDO
+            notificacion.iniciado = ahora
+            notificacion.intentos += 1
+            notificacion.actualizado = ahora
+        NotificacionSaliente.objects.bulk_update(notificaciones, ['estado', 'iniciado', 'intentos', 'actualizado'])
+
+    return notificaciones
+
+
+def _enviados_recientes(destinatarios) -> Dict[str, Dict]:
+    """{destinatario: {'total': enviados en el periodo, 'primero': el más antiguo}} en una sola consulta"""
+    from ..models import NotificacionSaliente
+
+    desde = timezone.now() - timedelta(seconds=_ajuste('NOTIFICACIONES_PERIODO_LIMITE', 3600))
+    filas = (
+        NotificacionSaliente.objects
+        .filter(destinatario__in=destinatarios, estado=NotificacionSaliente.ESTADO_ENVIADO, enviado_en__gte=desde)
+        .order_by()
+        .values('destinatario')
+        .annotate(total=Count('id'), primero=Min('enviado_en'))
+    )
+    return {fila['destinatario']: fila for fila in filas}
+
+
+def _construir_mensaje(notificacion, conexion):
+    """Email de la notificación, o None si no corresponde enviarlo"""
+    from ..models import NotificacionSaliente
+
+    mascota = notificacion.mascota
+    if notificacion.evento == NotificacionSaliente.EVENTO_CONFIRMACION_PERDIDA:
+        return EmailService.construir_confirmacion_reporte_perdida(mascota, conexion)
+    if notificacion.evento == NotificacionSaliente.EVENTO_MASCOTA_ENCONTRADA:
+        datos_encuentro = dict(notificacion.datos)
+        if isinstance(datos_encuentro.get('fecha_hora'), str):
+            datos_encuentro['fecha_hora'] = parse_datetime(datos_encuentro['fecha_hora'])
+        return EmailService.construir_notificacion_mascota_encontrada(mascota, datos_encuentro, conexion)
+    raise ValueError(f"Evento sin email individual: {notificacion.evento}")
+
+
+def procesar_lote(limite: Optional[int] = None, backend: Optional[str] = None) -> int:
+    """
+    Reclama y envía un lote de notificaciones.
+
+    Los emails individuales del lote comparten una conexión; las alertas se
+    convierten en un EnvioMasivo (ver envios_masivos). Las que superan el
+    límite de su destinatario se reprograman sin contar como intento.
+
+    Returns:
+        int: Notificaciones reclamadas (0 si la bandeja estaba vacía)
+    """
+    from ..models import NotificacionSaliente
+
+    limite = limite or _ajuste('NOTIFICACIONES_LOTE', 50)
+    notificaciones = reclamar_notificaciones(limite)
+    if not notificaciones:
+        return 0
+
+    maximo = _ajuste('NOTIFICACIONES_MAX_POR_DESTINATARIO', 5)
+    periodo = timedelta(seconds=_ajuste('NOTIFICACIONES_PERIODO_LIMITE', 3600))
+    recientes = _enviados_recientes({n.destinatario for n in notificaciones if n.destinatario})
+    ahora = timezone.now()
+
+    conexion = get_connection(backend=backend)
+    try:
+        conexion.open()
+    except Exception as e:
+        logger.error(f"No se pudo abrir la conexión de email: {e}")
+        for notificacion in notificaciones:
+            _reprogramar(notificacion, f"Conexión de email: {e}")
+        return len(notificaciones)
+
+    try:
+        for notificacion in notificaciones:
+            mascota = notificacion.mascota
+            try:
+                if notificacion.evento == NotificacionSaliente.EVENTO_ALERTA_PERDIDA:
+                    if mascota.reportar_perdida:
+                        crear_alerta_mascota_perdida(mascota, notificacion.datos.get('ubicacion_perdida'))
+                        _marcar(notificacion, NotificacionSaliente.ESTADO_ENVIADO)
+                    else:
+                        _marcar(notificacion, NotificacionSaliente.ESTADO_DESCARTADO)
+                    continue
+
+                uso = recientes.setdefault(notificacion.destinatario, {'total': 0, 'primero': ahora})
+                if uso['total'] >= maximo:
+                    _esperar_limite(notificacion, uso['primero'] + periodo)
+                    continue
+
+                mensaje = _construir_mensaje(notificacion, conexion)
+                if mensaje is None:
+                    _marcar(notificacion, NotificacionSaliente.ESTADO_DESCARTADO)
+                    continue
+                conexion.send_messages([mensaje])
+                uso['total'] += 1
+                _marcar(notificacion, NotificacionSaliente.ESTADO_ENVIADO)
+            except Exception as e:
+                logger.error(f"Error enviando la notificación {notificacion.id}: {e}")
+                _reprogramar(notificacion, str(e))
+    finally:
+        conexion.close()
+
+    return len(notificaciones)
+
+
+def _marcar(notificacion, estado: str):
+    from ..models import NotificacionSaliente
+
+    notificacion.estado = estado
+    notificacion.ultimo_error = ''
+    if estado == NotificacionSaliente.ESTADO_ENVIADO:
+        notificacion.enviado_en = timezone.now()
+    notificacion.save(update_fields=['estado', 'enviado_en', 'ultimo_error', 'actualizado'])
+
+
+def _esperar_limite(notificacion, desde):
+    from ..models import NotificacionSaliente
+
+    # No cuenta como intento: solo espera a que se libere el cupo del destinatario
+    notificacion.estado = NotificacionSaliente.ESTADO_PENDIENTE
+    notificacion.intentos = max(0, notificacion.intentos - 1)
+    notificacion.proximo_intento = max(desde, timezone.now())
+    notificacion.save(update_fields=['estado', 'intentos', 'proximo_intento', 'actualizado'])
+    logger.info(f"Notificación {notificacion.id} en espera hasta {notificacion.proximo_intento} (límite de {notificacion.destinatario})")
+
+
+def _reprogramar(notificacion, error: str):
+    from ..models import NotificacionSaliente
+
+    notificacion.ultimo_error = error
+    if notificacion.intentos >= notificacion.max_intentos:
+        notificacion.estado = NotificacionSaliente.ESTADO_FALLIDO
+        logger.error(f"Notificación {notificacion.id} fallida tras {notificacion.intentos} intentos: {error}")
+    else:
+        notificacion.estado = NotificacionSaliente.ESTADO_PENDIENTE
+        notificacion.proximo_intento = timezone.now() + calcular_espera(notificacion.intentos)
+    notificacion.save(update_fields=['estado', 'proximo_intento', 'ultimo_error', 'actualizado'])
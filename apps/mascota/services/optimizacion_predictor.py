@@ -0,0 +1,147 @@
+# apps/mascota/services/optimizacion_predictor.py
+"""
+Variantes optimizadas para inferencia de los modelos de AIPredictor
+(MultiTaskDogModel y BodyConditionModel).
+
+Modos (setting IA_PREDICTOR_MODO):
+- 'eager': los checkpoints .pth tal cual (comportamiento original).
+- 'torchscript': grafo trazado y congelado con torch.jit al cargar.
+- 'int8_dinamico': cuantización dinámica de torch.ao sobre las capas Linear
+  (cabezas de clasificación) + TorchScript. No requiere calibración, pero los
+  backbones convolucionales siguen en fp32.
+- 'int8_estatico': cuantización estática post-entrenamiento (FX, pesos y
+  activaciones en int8, incluidas las convoluciones). Requiere imágenes de
+  calibración, por eso se genera fuera de línea con
+  `manage.py optimizar_predictor --generar-int8` y se guarda junto al .pth
+  como `<modelo>_int8.pt`.
+
+Los modos int8 solo se ejecutan en CPU.
+"""
+
+import copy
+import logging
+import os
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+try:
+    import torch
+    import torch.nn as nn
+    DEPS_INSTALLED = True
+except ImportError:
+    DEPS_INSTALLED = False
+
+MODO_EAGER = 'eager'
+MODO_TORCHSCRIPT = 'torchscript'
+MODO_INT8_DINAMICO = 'int8_dinamico'
+MODO_INT8_ESTATICO = 'int8_estatico'
+MODOS = (MODO_EAGER, MODO_TORCHSCRIPT, MODO_INT8_DINAMICO, MODO_INT8_ESTATICO)
+MODOS_INT8 = (MODO_INT8_DINAMICO, MODO_INT8_ESTATICO)
+
+# Entrada de ambos modelos (Resize 224x224)
+FORMA_ENTRADA = (1, 3, 224, 224)
+
+
+def motor_cuantizacion() -> str:
+    """Backend de operadores cuantizados disponible ('x86', 'fbgemm' o 'qnnpack')"""
+    soportados = torch.backends.quantized.supported_engines
+    for motor in ('x86', 'fbgemm', 'qnnpack'):
+        if motor in soportados:
+            return motor
+    raise RuntimeError("Este build de torch no tiene backends de cuantización")
+
+
+def _copia_cpu(modelo):
+    copia = copy.deepcopy(modelo).to('cpu')
+    copia.eval()
+    return copia
+
+
+def trazar(modelo, dispositivo='cpu'):
+    """Traza y congela el modelo con una entrada de ejemplo en el dispositivo indicado"""
+    modelo.eval()
+    ejemplo = torch.zeros(FORMA_ENTRADA, device=dispositivo)
+    with torch.no_grad():
+        return torch.jit.freeze(torch.jit.trace(modelo, ejemplo))
+
+
+def cuantizar_dinamico(modelo):
+    """Cuantización dinámica int8 de las capas Linear; retorna el módulo trazado (CPU)"""
+    cuantizado = torch.ao.quantization.quantize_dynamic(
+        _copia_cpu(modelo), {nn.Linear}, dtype=torch.qint8
+    )
+    return trazar(cuantizado)
+
+
+def cuantizar_estatico(modelo, lotes_calibracion: Iterable):
+    """
+    Cuantización estática int8 (FX) calibrada con los lotes indicados.
+
+    Args:
+        modelo: Modelo eager fp32
+        lotes_calibracion: Tensores (B, 3, 224, 224) ya preprocesados
+
+    Returns:
+        Módulo TorchScript congelado (CPU)
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    motor = motor_cuantizacion()
+    torch.backends.quantized.engine = motor
+    preparado = prepare_fx(
+        _copia_cpu(modelo),
+        get_default_qconfig_mapping(motor),
+        (torch.zeros(FORMA_ENTRADA),),
+    )
+    lotes = 0
+    with torch.no_grad():
+        for lote in lotes_calibracion:
+            preparado(lote.to('cpu'))
+            lotes += 1
+    if not lotes:
+        raise ValueError("La cuantización estática requiere al menos un lote de calibración")
+    return trazar(convert_fx(preparado))
+
+
+def ruta_int8(ruta_checkpoint: str) -> str:
+    """Ruta del artefacto int8 estático generado a partir de un checkpoint .pth"""
+    return f"{os.path.splitext(ruta_checkpoint)[0]}_int8.pt"
+
+
+def guardar(modulo, ruta: str):
+    torch.jit.save(modulo, ruta)
+
+
+def cargar_int8(ruta: str):
+    """Carga un artefacto int8 estático generado con guardar()"""
+    if not os.path.exists(ruta):
+        raise FileNotFoundError(
+            f"No existe {ruta}; genéralo con manage.py optimizar_predictor --generar-int8"
+        )
+    torch.backends.quantized.engine = motor_cuantizacion()
+    modulo = torch.jit.load(ruta, map_location='cpu')
+    modulo.eval()
+    return modulo
+
+
+def optimizar(modelo, modo: str, ruta_checkpoint: str, dispositivo='cpu'):
+    """
+    Retorna la variante del modelo para el modo indicado.
+
+    Args:
+        modelo: Modelo eager ya cargado desde su checkpoint
+        modo: Uno de MODOS
+        ruta_checkpoint: Ruta del .pth (para localizar el artefacto int8 estático)
+        dispositivo: Dispositivo del modelo eager (TorchScript se traza en él)
+    """
+    if modo == MODO_EAGER:
+        return modelo
+    if modo == MODO_TORCHSCRIPT:
+        return trazar(modelo, dispositivo)
+    if modo == MODO_INT8_DINAMICO:
+        return cuantizar_dinamico(modelo)
+    if modo == MODO_INT8_ESTATICO:
+        return cargar_int8(ruta_int8(ruta_checkpoint))
+    raise ValueError(f"Modo de predictor no soportado: {modo}")
@@ -0,0 +1,251 @@
+# apps/mascota/services/puntuacion.py
+"""
+Motor de puntuación vectorizado para el reconocimiento biométrico.
+
+Reproduce la puntuación de BiometriaService.predecir_con_multiples_embeddings
+(promedio del top-3 de similitudes por mascota, factor de consistencia y
+penalización cuando la segunda mejor mascota está muy cerca) pero trabajando
+sobre una matriz apilada (N, D). Todas las mascotas se puntúan en una sola
+pasada mediante reducciones por segmento agrupadas por mascota_id, y se
+aceptan lotes de consultas (Q, D).
+"""
+
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class MotorPuntuacion:
+    """
+    Puntúa consultas contra un conjunto fijo de embeddings etiquetados.
+
+    La agrupación por mascota (orden de filas, inicio y tamaño de cada
+    segmento) se calcula una sola vez al construir el motor y se reutiliza en
+    cada consulta.
+    """
+
+    TOP_K = 3  # Similitudes promediadas por mascota
+    UMBRAL_SIMILITUD = 0.7  # Umbral para considerar un embedding como "similar"
+    MARGEN_MINIMO = 0.1  # Diferencia mínima con la segunda mejor mascota
+
+    def __init__(self, matriz, etiquetas: np.ndarray, normas: np.ndarray = None):
+        """
+        Args:
+            matriz: Embeddings apilados (N, D), o lista de bloques (N_i, D) que
+                se usan sin concatenar (p. ej. una base memory-mapped y las
+                filas agregadas en memoria). None si solo se van a puntuar
+                similitudes ya calculadas (ver puntuar_similitudes)
+            etiquetas: ID de mascota de cada fila (N,)
+            normas: Normas L2 de cada fila; se calculan si no se proporcionan
+        """
+        if matriz is None:
+            self.bloques = []
+        else:
+            self.bloques = list(matriz) if isinstance(matriz, (list, tuple)) else [matriz]
+        if normas is None and self.bloques:
+            normas = np.concatenate([np.linalg.norm(b, axis=1) for b in self.bloques])
+        self.normas = normas
+
+        etiquetas = np.asarray(etiquetas, dtype=np.int64)
+        self.orden = np.argsort(etiquetas, kind='stable')
+        self.mascotas, self.inicios, self.conteos = np.unique(
+            etiquetas[self.orden], return_index=True, return_counts=True
+        )
+
+    @classmethod
+    def desde_diccionario(cls, embeddings_db: Dict[int, list]) -> 'MotorPuntuacion':
+        """
+        Construye el motor desde un dict {mascota_id: [lista_embeddings]}
+
+        Ruta de compatibilidad con predecir_con_multiples_embeddings: la matriz
+        es float64 como los np.array de floats de Python del cálculo por bucles,
+        así los valores cercanos a los umbrales y al margen no cambian de lado.
+        El snapshot y el índice en memoria usan float32.
+        """
+        filas, etiquetas = [], []
+        for mascota_id, embeddings_mascota in embeddings_db.items():
+            for emb in embeddings_mascota or []:
+                filas.append(np.asarray(emb, dtype=np.float64).ravel())
+                etiquetas.append(mascota_id)
+
+        if not filas:
+            return cls(np.empty((0, 0), dtype=np.float64), np.empty(0, dtype=np.int64))
+
+        matriz = np.stack(filas)
+        normas = np.linalg.norm(matriz, axis=1)
+        # Los embeddings con norma 0 no participan (igual que en el cálculo por bucles)
+        validas = normas > 0
+        return cls(matriz[validas], np.asarray(etiquetas)[validas], normas[validas])
+
+    @property
+    def vacio(self) -> bool:
+        return self.mascotas.size == 0
+
+    def similitudes(self, consultas: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Similitud coseno de cada consulta contra todas las filas.
+
+        Returns:
+            Tuple con (similitudes (Q, N) en el orden de las filas, consultas válidas (Q,))
+        """
+        consultas = np.atleast_2d(np.asarray(consultas, dtype=self.bloques[0].dtype))
+        normas_consulta = np.linalg.norm(consultas, axis=1)
+        validas = normas_consulta > 0
+
+        if len(self.bloques) == 1:
+            similitudes = consultas @ self.bloques[0].T
+        else:
+            similitudes = np.hstack([consultas @ bloque.T for bloque in self.bloques])
+        similitudes /= np.where(validas, normas_consulta, 1.0)[:, None]
+        similitudes /= self.normas[None, :]
+        return similitudes, validas
+
+    def puntuar(self, consultas: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Puntúa un lote de consultas contra todas las mascotas en una pasada.
+
+        Args:
+            consultas: Embeddings a identificar (D,) o (Q, D)
+
+        Returns:
+            dict con arreglos por consulta:
+                - 'mascota_id': mejor mascota (-1 si no hay datos)
+                - 'puntuacion': puntuación de la mejor mascota
+                - 'margen': diferencia con la segunda mejor (inf si hay una sola)
+                - 'confianza': confianza final (0-1)
+                - 'puntuaciones': matriz (Q, M) con la puntuación de cada mascota
+            y 'mascotas' con el ID de cada columna de 'puntuaciones'.
+        """
+        consultas = np.atleast_2d(consultas)
+        if self.vacio:
+            return self.puntuar_similitudes(np.zeros((consultas.shape[0], 0)))
+
+        similitudes, validas = self.similitudes(consultas)
+        return self.puntuar_similitudes(similitudes, validas)
+
+    def puntuar_similitudes(self, similitudes: np.ndarray, validas: np.ndarray = None) -> Dict[str, np.ndarray]:
+        """
+        Puntúa similitudes ya calculadas (p. ej. las de un índice aproximado).
+
+        Args:
+            similitudes: Matriz (Q, N) alineada con las etiquetas del motor
+            validas: Consultas válidas (Q,); por defecto todas
+
+        Returns:
+            El mismo dict que puntuar()
+        """
+        similitudes = np.atleast_2d(similitudes)
+        q = similitudes.shape[0]
+        if validas is None:
+            validas = np.ones(q, dtype=bool)
+
+        if self.vacio:
+            return {
+                'mascota_id': np.full(q, -1, dtype=np.int64),
+                'puntuacion': np.zeros(q),
+                'margen': np.zeros(q),
+                'confianza': np.zeros(q),
+                'puntuaciones': np.zeros((q, 0)),
+                'mascotas': self.mascotas,
+            }
+
+        similitudes = similitudes[:, self.orden].astype(np.float64)
+
+        media_top = self._media_top_k(similitudes)
+        similares = np.add.reduceat(similitudes >= self.UMBRAL_SIMILITUD, self.inicios, axis=1)
+        factor_consistencia = similares / self.conteos
+        puntuaciones = media_top * (0.8 + 0.2 * factor_consistencia)
+
+        mejor = np.argmax(puntuaciones, axis=1)
+        filas = np.arange(q)
+        mejor_puntuacion = puntuaciones[filas, mejor]
+
+        if puntuaciones.shape[1] > 1:
+            segunda = -np.partition(-puntuaciones, 1, axis=1)[:, 1]
+            margen = mejor_puntuacion - segunda
+        else:
+            margen = np.full(q, np.inf)
+
+        confianza = self._confianza(mejor_puntuacion, margen)
+
+        mascota_id = np.where(validas, self.mascotas[mejor], -1)
+        confianza = np.where(validas, confianza, 0.0)
+
+        return {
+            'mascota_id': mascota_id,
+            'puntuacion': mejor_puntuacion,
+            'margen': margen,
+            'confianza': confianza,
+            'puntuaciones': puntuaciones,
+            'mascotas': self.mascotas,
+        }
+
+    def predecir(self, consultas: np.ndarray) -> List[Tuple[int, float]]:
+        """Retorna [(ID de mascota predicha, confianza), ...] por cada consulta"""
+        resultado = self.puntuar(consultas)
+        return [
+            (int(mascota_id), float(confianza))
+            for mascota_id, confianza in zip(resultado['mascota_id'], resultado['confianza'])
+        ]
+
+    def predecir_similitudes(self, similitudes: np.ndarray) -> List[Tuple[int, float]]:
+        """Como predecir(), a partir de similitudes ya calculadas"""
+        resultado = self.puntuar_similitudes(similitudes)
+        return [
+            (int(mascota_id), float(confianza))
+            for mascota_id, confianza in zip(resultado['mascota_id'], resultado['confianza'])
+        ]
+
+    def _media_top_k(self, similitudes: np.ndarray) -> np.ndarray:
+        """
+        Promedio de las TOP_K mayores similitudes de cada segmento (mascota).
+        Extrae el máximo de cada segmento TOP_K veces, contando los empates,
+        en lugar de ordenar todas las similitudes.
+        """
+        trabajo = similitudes.copy()
+        pendientes = np.minimum(self.TOP_K, self.conteos)[None, :].repeat(trabajo.shape[0], axis=0)
+        tomados = pendientes.copy()
+        suma = np.zeros(pendientes.shape)
+
+        for _ in range(self.TOP_K):
+            maximos = np.maximum.reduceat(trabajo, self.inicios, axis=1)
+            iguales = trabajo == np.repeat(maximos, self.conteos, axis=1)
+            cantidad = np.minimum(np.add.reduceat(iguales, self.inicios, axis=1), pendientes)
+            suma += cantidad * np.where(cantidad > 0, maximos, 0.0)
+            pendientes -= cantidad
+            if not pendientes.any():
+                break
+            trabajo[iguales] = -np.inf
+
+        return suma / tomados
+
+    def _confianza(self, mejor_similitud: np.ndarray, margen: np.ndarray) -> np.ndarray:
+        """Convierte la mejor puntuación en confianza (0-1)"""
+        # Solo alta confianza si la similitud es muy alta
+        confianza = np.where(
+            mejor_similitud >= 0.85,
+            np.minimum(0.98, mejor_similitud + 0.1),
+            np.where(mejor_similitud >= 0.75, mejor_similitud * 0.9, mejor_similitud * 0.6),
+        )
+        # Reducir confianza si la segunda mejor opción está muy cerca
+        confianza = np.where(margen < self.MARGEN_MINIMO, confianza * 0.7, confianza)
+        return np.clip(confianza, 0.0, 1.0)
+
+
+def puntuar_candidatos(etiquetas: np.ndarray, similitudes: np.ndarray) -> Tuple[int, float]:
+    """
+    Aplica la puntuación por mascota a una lista de candidatos ya filtrada
+    (p. ej. los devueltos por una búsqueda aproximada).
+
+    Args:
+        etiquetas: mascota_id de cada candidato (K,)
+        similitudes: Similitud de la consulta con cada candidato (K,)
+
+    Returns:
+        Tuple con (ID de mascota predicha, confianza)
+    """
+    motor = MotorPuntuacion(None, etiquetas)
+    return motor.predecir_similitudes(similitudes)[0]
@@ -0,0 +1,182 @@
+# apps/mascota/services/registro_modelos.py
+"""
+Registro de modelos a nivel de proceso para la biometría.
+
+Evita que cada reconocimiento vuelva a construir el extractor de
+características (EfficientNet-B0 / ResNet50) y a descargar y deserializar el
+clasificador de ModeloGlobal desde el storage.
+
+- Los BiometriaService se conservan por nombre de extractor: los pesos
+  preentrenados no cambian entre versiones del modelo global.
+- Los clasificadores se conservan por (extractor, ModeloGlobal.version); al
+  cargarse una versión nueva se descartan las anteriores del mismo extractor.
+- Con BIOMETRIA_EXTRACTOR_EXPORTADO el servicio ejecuta el extractor
+  exportado (TorchScript/ONNX) del ModeloGlobal activo en lugar del eager.
+"""
+
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RegistroModelos:
+    """Caché de servicios de extracción y clasificadores con contadores de aciertos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Un lock por clave para no bloquear otros modelos mientras uno se carga
+        self._locks_carga: Dict[object, threading.Lock] = {}
+        self._servicios: Dict[str, object] = {}
+        self._clasificadores: Dict[Tuple[str, int], object] = {}
+        # Versión de ModeloGlobal cuyo extractor exportado usa cada servicio
+        self._exportados: Dict[str, Optional[int]] = {}
+        self._contadores = {
+            'servicios_aciertos': 0,
+            'servicios_fallos': 0,
+            'clasificadores_aciertos': 0,
+            'clasificadores_fallos': 0,
+        }
+
+    def _lock_carga(self, clave) -> threading.Lock:
+        with self._lock:
+            return self._locks_carga.setdefault(clave, threading.Lock())
+
+    def _contar(self, nombre: str):
+        with self._lock:
+            self._contadores[nombre] += 1
+
+    def obtener_servicio(self, modelo_extractor: str = 'efficientnet_b0'):
+        """
+        Retorna un BiometriaService con el extractor ya inicializado.
+
+        Args:
+            modelo_extractor: Nombre del extractor ('efficientnet_b0', 'resnet50')
+        """
+        servicio = self._servicios.get(modelo_extractor)
+        if servicio is not None:
+            self._contar('servicios_aciertos')
+            return servicio
+
+        with self._lock_carga(('servicio', modelo_extractor)):
+            # Otro hilo pudo haberlo cargado mientras esperábamos
+            servicio = self._servicios.get(modelo_extractor)
+            if servicio is not None:
+                self._contar('servicios_aciertos')
+                return servicio
+
+            from .biometria import BiometriaService
+            self._contar('servicios_fallos')
+            servicio = BiometriaService(modelo_extractor=modelo_extractor)
+            if self._usar_exportado():
+                from ..models import ModeloGlobal
+                modelo_global = ModeloGlobal.get_active_model()
+                if modelo_global is not None and modelo_global.extractor_caracteristicas == modelo_extractor:
+                    self._asignar_exportado(servicio, modelo_global)
+            with self._lock:
+                self._servicios[modelo_extractor] = servicio
+            logger.info(f"Extractor '{modelo_extractor}' cargado en el registro de modelos")
+            return servicio
+
+    def obtener(self, modelo_global) -> Tuple[object, object]:
+        """
+        Retorna (servicio, clasificador) para un ModeloGlobal.
+
+        Args:
+            modelo_global: Instancia de ModeloGlobal con modelo_file
+
+        Returns:
+            Tuple con (BiometriaService, clasificador deserializado)
+        """
+        extractor = modelo_global.extractor_caracteristicas
+        clave = (extractor, modelo_global.version)
+        servicio = self.obtener_servicio(extractor)
+        if self._usar_exportado() and self._exportados.get(extractor) != modelo_global.version:
+            with self._lock_carga(('exportado', extractor)):
+                if self._exportados.get(extractor) != modelo_global.version:
+                    self._asignar_exportado(servicio, modelo_global)
+
+        clasificador = self._clasificadores.get(clave)
+        if clasificador is not None:
+            self._contar('clasificadores_aciertos')
+            return servicio, clasificador
+
+        with self._lock_carga(clave):
+            clasificador = self._clasificadores.get(clave)
+            if clasificador is not None:
+                self._contar('clasificadores_aciertos')
+                return servicio, clasificador
+
+            self._contar('clasificadores_fallos')
+            clasificador = servicio.cargar_modelo(modelo_global.modelo_file)
+            with self._lock:
+                self._clasificadores[clave] = clasificador
+                self._descartar_anteriores(extractor, modelo_global.version)
+            logger.info(f"Clasificador v{modelo_global.version} ('{extractor}') cargado en el registro de modelos")
+            return servicio, clasificador
+
+    @staticmethod
+    def _usar_exportado() -> bool:
+        return getattr(settings, 'BIOMETRIA_EXTRACTOR_EXPORTADO', False)
+
+    def _asignar_exportado(self, servicio, modelo_global):
+        """
+        Hace que el servicio use el extractor exportado de ese ModeloGlobal;
+        si no tiene uno (o no se puede cargar) vuelve al extractor eager.
+        """
+        from .exportacion_extractor import cargar_extractor_exportado
+
+        try:
+            servicio.extractor_exportado = cargar_extractor_exportado(modelo_global)
+        except Exception as e:
+            logger.error(f"No se pudo cargar el extractor exportado v{modelo_global.version}: {e}")
+            servicio.extractor_exportado = None
+        self._exportados[servicio.modelo_extractor] = modelo_global.version
+
+    def _descartar_anteriores(self, modelo_extractor: str, version: int):
+        """Libera los clasificadores de versiones anteriores del mismo extractor"""
+        anteriores = [
+            clave for clave in self._clasificadores
+            if clave[0] == modelo_extractor and clave[1] < version
+        ]
+        for clave in anteriores:
+            del self._clasificadores[clave]
+            self._locks_carga.pop(clave, None)
+        if anteriores:
+            logger.info(f"Descartadas {len(anteriores)} versiones anteriores del clasificador '{modelo_extractor}'")
+
+    def esta_cargado(self, modelo_global) -> bool:
+        """Indica si el clasificador de ese ModeloGlobal ya está en memoria"""
+        return (modelo_global.extractor_caracteristicas, modelo_global.version) in self._clasificadores
+
+    def estadisticas(self) -> Dict:
+        """Contadores de aciertos/fallos y modelos actualmente en memoria"""
+        with self._lock:
+            return {
+                **self._contadores,
+                'extractores_cargados': sorted(self._servicios),
+                'extractores_exportados': {
+                    nombre: getattr(getattr(servicio, 'extractor_exportado', None), 'descripcion', None)
+                    for nombre, servicio in self._servicios.items()
+                },
+                'clasificadores_cargados': sorted(f"{e}:v{v}" for e, v in self._clasificadores),
+            }
+
+    def limpiar(self):
+        """Vacía el registro (p. ej. para liberar memoria)"""
+        with self._lock:
+            self._servicios.clear()
+            self._clasificadores.clear()
+            self._exportados.clear()
+            self._locks_carga.clear()
+
+
+_registro = RegistroModelos()
+
+
+def get_registro_modelos() -> RegistroModelos:
+    """Obtiene el registro de modelos del proceso"""
+    return _registro
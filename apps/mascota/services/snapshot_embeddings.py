@@ -0,0 +1,239 @@
+# apps/mascota/services/snapshot_embeddings.py
+"""
+Instantáneas en disco de la matriz de embeddings, versionadas con ModeloGlobal.
+
+actualizar_modelo_global escribe, por cada versión del modelo, los arreglos
+ids / etiquetas / normas / matriz en formato .npy junto con un manifiesto JSON.
+Los procesos del servidor los abren con np.load(mmap_mode='r'), de modo que
+todos los workers comparten la misma copia en la caché de páginas del sistema
+operativo en lugar de reconstruir la matriz desde la base de datos.
+
+Cada archivo se escribe primero con un nombre temporal y se publica con
+os.replace; el manifiesto se publica al final, por lo que una instantánea solo
+es visible cuando está completa.
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ARREGLOS = ('ids', 'etiquetas', 'normas', 'matriz')
+VERSIONES_CONSERVADAS = 2
+
+
+def directorio_snapshots() -> Path:
+    """Directorio local donde se guardan las instantáneas"""
+    directorio = getattr(settings, 'BIOMETRIA_SNAPSHOT_DIR', None)
+    if not directorio:
+        directorio = Path(settings.BASE_DIR) / 'snapshots'
+    return Path(directorio)
+
+
+def _prefijo(modelo_extractor: str, version: int) -> Path:
+    return directorio_snapshots() / f"embeddings_{modelo_extractor}_v{int(version)}"
+
+
+def _ruta_manifiesto(modelo_extractor: str, version: int) -> Path:
+    return _prefijo(modelo_extractor, version).with_suffix('.json')
+
+
+def _ruta_arreglo(modelo_extractor: str, version: int, nombre: str) -> Path:
+    prefijo = _prefijo(modelo_extractor, version)
+    return prefijo.with_name(f"{prefijo.name}_{nombre}.npy")
+
+
+def _publicar(ruta: Path, escribir):
+    """Escribe en un archivo temporal del mismo directorio y lo reemplaza de forma atómica"""
+    temporal = ruta.with_name(f".{ruta.name}.{os.getpid()}.tmp")
+    try:
+        with open(temporal, 'wb') as f:
+            escribir(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+    finally:
+        if temporal.exists():
+            temporal.unlink()
+
+
+def existe_snapshot(modelo_extractor: str, version: Optional[int]) -> bool:
+    return version is not None and _ruta_manifiesto(modelo_extractor, version).exists()
+
+
+def escribir_snapshot(
+    modelo_extractor: str,
+    version: int,
+    ids: np.ndarray,
+    etiquetas: np.ndarray,
+    matriz: np.ndarray,
+    omitidos: Iterable[int] = (),
+) -> Path:
+    """
+    Guarda la instantánea de una versión del modelo.
+
+    Args:
+        modelo_extractor: Extractor al que pertenecen los vectores
+        version: ModeloGlobal.version
+        ids: IDs de EmbeddingStore (N,)
+        etiquetas: mascota_id de cada fila (N,)
+        matriz: Vectores (N, D)
+        omitidos: IDs de EmbeddingStore que existen pero no entran al índice
+
+    Returns:
+        Ruta del manifiesto publicado
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    etiquetas = np.asarray(etiquetas, dtype=np.int64)
+    matriz = np.ascontiguousarray(matriz, dtype=np.float32)
+    omitidos = set(int(i) for i in omitidos)
+
+    # Las filas de norma 0 no participan en el reconocimiento
+    normas = np.linalg.norm(matriz, axis=1).astype(np.float32) if matriz.size else np.empty(0, dtype=np.float32)
+    validas = normas > 0
+    if not validas.all():
+        omitidos.update(ids[~validas].tolist())
+        ids, etiquetas, matriz, normas = ids[validas], etiquetas[validas], matriz[validas], normas[validas]
+
+    # Filas ordenadas por id para poder cargar solo las posteriores
+    orden = np.argsort(ids, kind='stable')
+    arreglos = {
+        'ids': ids[orden],
+        'etiquetas': etiquetas[orden],
+        'normas': normas[orden],
+        'matriz': matriz[orden],
+    }
+
+    directorio_snapshots().mkdir(parents=True, exist_ok=True)
+    for nombre, arreglo in arreglos.items():
+        _publicar(
+            _ruta_arreglo(modelo_extractor, version, nombre),
+            lambda f, arreglo=arreglo: np.save(f, arreglo, allow_pickle=False),
+        )
+
+    ultimo_id = max(omitidos | set(arreglos['ids'][-1:].tolist()), default=0)
+    manifiesto = {
+        'version': int(version),
+        'modelo_extractor': modelo_extractor,
+        'total': int(ids.shape[0]),
+        'dimension': int(matriz.shape[1]) if matriz.ndim == 2 else 0,
+        'ultimo_id': ultimo_id,
+        'omitidos': sorted(omitidos),
+        'creado': timezone.now().isoformat(),
+    }
+    ruta_manifiesto = _ruta_manifiesto(modelo_extractor, version)
+    _publicar(ruta_manifiesto, lambda f: f.write(json.dumps(manifiesto).encode('utf-8')))
+
+    logger.info(
+        f"Instantánea de embeddings v{version} ('{modelo_extractor}') escrita: "
+        f"{manifiesto['total']} vectores en {ruta_manifiesto.parent}"
+    )
+    limpiar_snapshots(modelo_extractor, conservar_desde=version)
+    return ruta_manifiesto
+
+
+def cargar_snapshot(modelo_extractor: str, version: Optional[int]) -> Optional[Dict]:
+    """
+    Abre la instantánea de una versión con memory-mapping.
+
+    Returns:
+        dict con el manifiesto y los arreglos de solo lectura
+        ('ids', 'etiquetas', 'normas', 'matriz'), o None si no existe o está dañada
+    """
+    if not existe_snapshot(modelo_extractor, version):
+        return None
+
+    try:
+        with open(_ruta_manifiesto(modelo_extractor, version), 'r', encoding='utf-8') as f:
+            manifiesto = json.load(f)
+
+        arreglos = {
+            nombre: np.load(_ruta_arreglo(modelo_extractor, version, nombre), mmap_mode='r', allow_pickle=False)
+            for nombre in ARREGLOS
+        }
+    except (OSError, ValueError) as e:
+        logger.warning(f"No se pudo abrir la instantánea v{version} de '{modelo_extractor}': {e}")
+        return None
+
+    total = manifiesto.get('total', -1)
+    if any(arreglos[nombre].shape[0] != total for nombre in ARREGLOS) or (
+        total and arreglos['matriz'].shape[1] != manifiesto.get('dimension')
+    ):
+        logger.warning(f"Instantánea v{version} de '{modelo_extractor}' inconsistente con su manifiesto")
+        return None
+
+    return {'manifiesto': manifiesto, **arreglos}
+
+
+def publicar_arreglo(modelo_extractor: str, version: int, nombre: str, arreglo: np.ndarray) -> Path:
+    """Publica un arreglo adicional (p. ej. un índice ANN) junto a la instantánea de una versión"""
+    directorio_snapshots().mkdir(parents=True, exist_ok=True)
+    ruta = _ruta_arreglo(modelo_extractor, version, nombre)
+    _publicar(ruta, lambda f: np.save(f, np.ascontiguousarray(arreglo), allow_pickle=False))
+    return ruta
+
+
+def cargar_arreglo(modelo_extractor: str, version: int, nombre: str) -> np.ndarray:
+    """Abre con memory-mapping un arreglo adicional de una versión"""
+    return np.load(_ruta_arreglo(modelo_extractor, version, nombre), mmap_mode='r', allow_pickle=False)
+
+
+def _ruta_json(modelo_extractor: str, version: int, nombre: str) -> Path:
+    prefijo = _prefijo(modelo_extractor, version)
+    return prefijo.with_name(f"{prefijo.name}_{nombre}.json")
+
+
+def publicar_json(modelo_extractor: str, version: int, nombre: str, datos: Dict) -> Path:
+    """Publica metadatos adicionales de una versión (publicarlos al final marca el artefacto como completo)"""
+    directorio_snapshots().mkdir(parents=True, exist_ok=True)
+    ruta = _ruta_json(modelo_extractor, version, nombre)
+    _publicar(ruta, lambda f: f.write(json.dumps(datos).encode('utf-8')))
+    return ruta
+
+
+def cargar_json(modelo_extractor: str, version: Optional[int], nombre: str) -> Optional[Dict]:
+    """Lee metadatos adicionales de una versión; None si no existen"""
+    if version is None:
+        return None
+    try:
+        with open(_ruta_json(modelo_extractor, version, nombre), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"No se pudo leer '{nombre}' de la versión v{version} de '{modelo_extractor}': {e}")
+        return None
+
+
+def limpiar_snapshots(modelo_extractor: str, conservar_desde: int):
+    """Elimina las instantáneas más antiguas, conservando las últimas VERSIONES_CONSERVADAS"""
+    directorio = directorio_snapshots()
+    prefijo = f"embeddings_{modelo_extractor}_v"
+    versiones = set()
+    for ruta in directorio.glob(f"{prefijo}*.json"):
+        try:
+            versiones.add(int(ruta.stem[len(prefijo):]))
+        except ValueError:
+            continue
+
+    vigentes = sorted(v for v in versiones if v <= conservar_desde)[-VERSIONES_CONSERVADAS:]
+    for version in versiones:
+        if version in vigentes or version > conservar_desde:
+            continue
+        # En Linux los procesos que aún tengan el archivo mapeado conservan su copia.
+        # Incluye los artefactos adicionales de la versión (índices ANN, etc.)
+        prefijo_version = _prefijo(modelo_extractor, version).name
+        for ruta in [_ruta_manifiesto(modelo_extractor, version)] + list(
+            directorio.glob(f"{prefijo_version}_*")
+        ):
+            try:
+                ruta.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,167 @@
+# apps/mascota/services/trabajos_biometricos.py
+"""
+Cola persistente (tabla TrabajoBiometrico) para el procesamiento de imágenes
+biométricas.
+
+Las vistas de subida solo encolan las imágenes; el comando
+`manage.py procesar_trabajos_biometricos` reclama los trabajos pendientes con
+SELECT ... FOR UPDATE SKIP LOCKED, los procesa en un pool de procesos y los
+marca como completados o los reprograma con espera exponencial.
+"""
+
+import logging
+from datetime import timedelta
+from typing import Dict, Iterable, List
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Espera entre reintentos: ESPERA_BASE * 2^(intentos-1), con tope ESPERA_MAXIMA
+ESPERA_BASE = timedelta(seconds=30)
+ESPERA_MAXIMA = timedelta(hours=1)
+# Un trabajo 'procesando' sin terminar en este tiempo se considera abandonado
+# (p. ej. el worker se reinició) y vuelve a reclamarse
+TIEMPO_MAXIMO_PROCESANDO = timedelta(minutes=15)
+
+
+def encolar_imagenes(imagenes) -> int:
+    """
+    Crea un trabajo por cada imagen que aún no tenga uno.
+
+    Args:
+        imagenes: Instancias de ImagenMascota (con mascota_id)
+
+    Returns:
+        int: Cantidad de imágenes enviadas a la cola
+    """
+    from ..models import TrabajoBiometrico
+
+    trabajos = [
+        TrabajoBiometrico(imagen_id=imagen.id, mascota_id=imagen.mascota_id)
+        for imagen in imagenes
+    ]
+    if not trabajos:
+        return 0
+
+    # El OneToOne sobre la imagen hace idempotente el encolado
+    TrabajoBiometrico.objects.bulk_create(trabajos, ignore_conflicts=True)
+    logger.info(f"Encoladas {len(trabajos)} imágenes para procesamiento biométrico")
+    return len(trabajos)
+
+
+def calcular_espera(intentos: int) -> timedelta:
+    """Espera exponencial antes del siguiente intento"""
+    return min(ESPERA_BASE * (2 ** max(0, intentos - 1)), ESPERA_MAXIMA)
+
+
+def reclamar_trabajos(limite: int) -> List:
+    """
+    Marca como 'procesando' hasta `limite` trabajos listos para ejecutarse.
+    Varios workers pueden reclamar a la vez sin tomar el mismo trabajo.
+
+    Returns:
+        Lista de TrabajoBiometrico reclamados
+    """
+    from ..models import TrabajoBiometrico
+
+    ahora = timezone.now()
+    listos = (
+        Q(estado=TrabajoBiometrico.ESTADO_PENDIENTE, proximo_intento__lte=ahora)
+        | Q(estado=TrabajoBiometrico.ESTADO_PROCESANDO, iniciado__lt=ahora - TIEMPO_MAXIMO_PROCESANDO)
+    )
+
+    with transaction.atomic():
+        trabajos = list(
+            TrabajoBiometrico.objects
+            .select_for_update(skip_locked=True)
+            .filter(listos)
+            .order_by('proximo_intento', 'id')[:limite]
+        )
+        for trabajo in trabajos:
+            trabajo.estado = TrabajoBiometrico.ESTADO_PROCESANDO
+            trabajo.iniciado = ahora
+            trabajo.intentos += 1
+            trabajo.actualizado = ahora
+        TrabajoBiometrico.objects.bulk_update(trabajos, ['estado', 'iniciado', 'intentos', 'actualizado'])
+
+    return trabajos
+
+
+def ejecutar_lote(imagenes_ids: List[int]) -> Dict[int, str]:
+    """
+    Procesa un lote de imágenes. Se ejecuta dentro de los procesos del pool.
+
+    Returns:
+        dict {imagen_id: ''} si quedó procesada o {imagen_id: mensaje de error}
+    """
+    from ..models import ImagenMascota
+    from .biometria import procesar_imagenes_mascota
+
+    try:
+        procesar_imagenes_mascota(imagenes_ids)
+    except Exception as e:
+        logger.error(f"Error procesando lote {imagenes_ids}: {e}", exc_info=True)
+        return {imagen_id: str(e) for imagen_id in imagenes_ids}
+
+    # Idempotente: una imagen ya procesada (por este u otro intento) cuenta como éxito
+    procesadas = set(
+        ImagenMascota.objects.filter(id__in=imagenes_ids, procesada=True).values_list('id', flat=True)
+    )
+    return {
+        imagen_id: '' if imagen_id in procesadas else 'No se pudieron extraer embeddings (ver logs del worker)'
+        for imagen_id in imagenes_ids
+    }
+
+
+def finalizar_trabajos(trabajos: Iterable, errores: Dict[int, str]):
+    """
+    Registra el resultado de los trabajos reclamados.
+
+    Args:
+        trabajos: TrabajoBiometrico reclamados
+        errores: {imagen_id: mensaje}; cadena vacía si se procesó correctamente
+    """
+    from ..models import TrabajoBiometrico
+
+    ahora = timezone.now()
+    trabajos = list(trabajos)
+    for trabajo in trabajos:
+        error = errores.get(trabajo.imagen_id, 'Sin resultado del worker')
+        trabajo.actualizado = ahora
+        if not error:
+            trabajo.estado = TrabajoBiometrico.ESTADO_COMPLETADO
+            trabajo.finalizado = ahora
+            trabajo.ultimo_error = ''
+        elif trabajo.intentos >= trabajo.max_intentos:
+            trabajo.estado = TrabajoBiometrico.ESTADO_FALLIDO
+            trabajo.finalizado = ahora
+            trabajo.ultimo_error = error
+            logger.error(f"Trabajo {trabajo.id} (imagen {trabajo.imagen_id}) fallido tras {trabajo.intentos} intentos: {error}")
+        else:
+            trabajo.estado = TrabajoBiometrico.ESTADO_PENDIENTE
+            trabajo.proximo_intento = ahora + calcular_espera(trabajo.intentos)
+            trabajo.ultimo_error = error
+            logger.warning(f"Trabajo {trabajo.id} (imagen {trabajo.imagen_id}) reprogramado para {trabajo.proximo_intento}: {error}")
+
+    TrabajoBiometrico.objects.bulk_update(
+        trabajos,
+        ['estado', 'finalizado', 'proximo_intento', 'ultimo_error', 'actualizado'],
+    )
+
+
+def estado_procesamiento(mascota) -> Dict[str, int]:
+    """Cantidad de trabajos de la mascota en cada estado"""
+    from ..models import TrabajoBiometrico
+
+    conteos = dict(
+        TrabajoBiometrico.objects
+        .filter(mascota=mascota)
+        .order_by()
+        .values('estado')
+        .annotate(total=Count('id'))
+        .values_list('estado', 'total')
+    )
+    return {estado: conteos.get(estado, 0) for estado, _ in TrabajoBiometrico.ESTADO_CHOICES}
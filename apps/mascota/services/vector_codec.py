@@ -0,0 +1,100 @@
+# apps/mascota/services/vector_codec.py
+"""
+Codificación binaria de los vectores de EmbeddingStore.
+
+Formato (little-endian):
+    - 2 bytes: firma b'EV'
+    - 1 byte: versión del formato
+    - 1 byte: código de dtype (1 = float32, 2 = float16)
+    - 4 bytes: dimensión (uint32)
+    - dimension * itemsize bytes: datos del vector
+
+La decodificación devuelve una vista np.frombuffer sobre los bytes leídos de
+la base de datos, sin copiar ni parsear texto.
+"""
+
+import struct
+from typing import Optional
+
+import numpy as np
+
+FIRMA = b'EV'
+VERSION_FORMATO = 1
+
+_CABECERA = struct.Struct('<2sBBI')
+TAMANO_CABECERA = _CABECERA.size
+
+_CODIGOS_DTYPE = {
+    np.dtype(np.float32): 1,
+    np.dtype(np.float16): 2,
+}
+_DTYPES_POR_CODIGO = {codigo: dtype for dtype, codigo in _CODIGOS_DTYPE.items()}
+
+
+def codificar_vector(vector, dtype=np.float32) -> bytes:
+    """
+    Serializa un vector 1-D con su cabecera de dtype y dimensión.
+
+    Args:
+        vector: Lista o array con el embedding
+        dtype: np.float32 (por defecto) o np.float16
+
+    Returns:
+        bytes listos para guardar en un BinaryField
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in _CODIGOS_DTYPE:
+        raise ValueError(f"Tipo de dato no soportado para embeddings: {dtype}")
+
+    datos = np.ascontiguousarray(np.asarray(vector).ravel(), dtype=dtype.newbyteorder('<'))
+    cabecera = _CABECERA.pack(FIRMA, VERSION_FORMATO, _CODIGOS_DTYPE[dtype], datos.shape[0])
+    return cabecera + datos.tobytes()
+
+
+def leer_cabecera(datos) -> tuple:
+    """
+    Lee la cabecera de un vector codificado.
+
+    Returns:
+        Tuple con (dtype, dimensión)
+    """
+    if datos is None or len(datos) < TAMANO_CABECERA:
+        raise ValueError("Vector binario vacío o incompleto")
+
+    firma, version, codigo, dimension = _CABECERA.unpack_from(datos, 0)
+    if firma != FIRMA:
+        raise ValueError("Vector binario con firma desconocida")
+    if version != VERSION_FORMATO:
+        raise ValueError(f"Versión de formato de vector no soportada: {version}")
+    if codigo not in _DTYPES_POR_CODIGO:
+        raise ValueError(f"Código de tipo de dato desconocido: {codigo}")
+
+    return _DTYPES_POR_CODIGO[codigo].newbyteorder('<'), dimension
+
+
+def decodificar_vector(datos) -> np.ndarray:
+    """
+    Retorna una vista de solo lectura (np.frombuffer) sobre los datos del vector.
+
+    Args:
+        datos: bytes o memoryview leídos de un BinaryField
+    """
+    dtype, dimension = leer_cabecera(datos)
+    esperado = TAMANO_CABECERA + dimension * dtype.itemsize
+    if len(datos) != esperado:
+        raise ValueError(
+            f"Vector binario de longitud inválida: {len(datos)} bytes, se esperaban {esperado}"
+        )
+    return np.frombuffer(datos, dtype=dtype, count=dimension, offset=TAMANO_CABECERA)
+
+
+def vector_desde_campos(binario, legado) -> Optional[np.ndarray]:
+    """
+    Obtiene el vector de una fila de EmbeddingStore priorizando el formato
+    binario y usando la lista JSON solo en filas aún no convertidas.
+    """
+    if binario is not None:
+        return decodificar_vector(binario)
+    if legado is not None:
+        return np.asarray(legado, dtype=np.float32)
+    return None
@@ -1,3 +1,82 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.test import TestCase, override_settings
+from django.utils import timezone
 
-# Create your tests here.
+from apps.mascota.models import EnvioMasivo, Mascota
+from apps.mascota.services import envios_masivos
+
+BACKEND_LOTES = 'apps.mascota.tests.BackendLotes'
+
+
+class BackendLotes(locmem.EmailBackend):
+    """Backend locmem que registra el tamaño de cada lote y puede simular un servidor caído"""
+
+    lotes = []
+    fallar_lote = None
+
+    def send_messages(self, messages):
+        BackendLotes.lotes.append(len(messages))
+        if len(BackendLotes.lotes) == BackendLotes.fallar_lote:
+            return 0
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', EMAIL_ENVIOS_LOTE=3)
+class EnvioMasivoTests(TestCase):
+
+    def setUp(self):
+        BackendLotes.lotes = []
+        BackendLotes.fallar_lote = None
+        User = get_user_model()
+        propietario = User.objects.create_user('propietario', 'propietario@example.com', 'clave')
+        self.mascota = Mascota.objects.create(propietario=propietario, nombre='Toby', reportar_perdida=True)
+        self.correos = [
+            User.objects.create_user(f'usuario{i}', f'usuario{i}@example.com', 'clave').email
+            for i in range(8)
+        ]
+        self.envio = EnvioMasivo.objects.create(
+            mascota=self.mascota,
+            asunto='Alerta',
+            mensaje_texto='Toby se perdió',
+            total_destinatarios=len(self.correos),
+        )
+
+    def procesar(self):
+        envio = envios_masivos.reclamar_envio(self.envio.id)
+        self.assertIsNotNone(envio)
+        return envios_masivos.procesar_envio(envio, backend=BACKEND_LOTES)
+
+    def destinatarios_enviados(self):
+        return [correo for mensaje in mail.outbox for correo in mensaje.to]
+
+    def test_envia_en_lotes_de_email_envios_lote(self):
+        envio = self.procesar()
+
+        self.assertEqual(BackendLotes.lotes, [3, 3, 2])
+        self.assertEqual(envio.estado, EnvioMasivo.ESTADO_COMPLETADO)
+        self.assertEqual(envio.enviados, len(self.correos))
+        self.assertEqual(self.destinatarios_enviados(), self.correos)
+
+    def test_lote_fallido_se_reprograma_y_se_retoma_sin_saltos_ni_duplicados(self):
+        BackendLotes.fallar_lote = 2
+        envio = self.procesar()
+
+        self.assertEqual(envio.estado, EnvioMasivo.ESTADO_PENDIENTE)
+        self.assertGreater(envio.proximo_intento, timezone.now())
+        self.assertTrue(envio.ultimo_error)
+        envio.refresh_from_db()
+        self.assertEqual(envio.enviados, 3)
+        self.assertEqual(self.destinatarios_enviados(), self.correos[:3])
+
+        # Retomar el envío desde ultimo_usuario_id cuando llega su próximo intento
+        EnvioMasivo.objects.filter(id=envio.id).update(proximo_intento=timezone.now())
+        BackendLotes.fallar_lote = None
+        envio = self.procesar()
+
+        self.assertEqual(envio.estado, EnvioMasivo.ESTADO_COMPLETADO)
+        self.assertEqual(BackendLotes.lotes, [3, 3, 3, 2])
+        self.assertEqual(self.destinatarios_enviados(), self.correos)
+        envio.refresh_from_db()
+        self.assertEqual(envio.enviados, len(self.correos))
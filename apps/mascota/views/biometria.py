@@ -7,12 +7,10 @@ También incluye vistas para la gestión de mascotas como el detalle y listado.
 import base64
 import json
 import logging
-import os
 import uuid
 from datetime import datetime
 import time
 
-from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -30,12 +28,15 @@ from django.db.models import Count
 
 from ..models import Mascota, ImagenMascota, ModeloGlobal, EmbeddingStore, RegistroReconocimiento
 from ..services.biometria import (
-    procesar_imagen_mascota, 
+    procesar_imagenes_mascota,
     actualizar_modelo_global,
     reconocer_mascota,
     BiometriaService, 
     DEPS_INSTALLED
 )
+from ..services.imagen_decodificada import ImagenDecodificada
+from ..services.ingesta_imagenes import guardar_imagenes_biometricas
+from ..services.trabajos_biometricos import encolar_imagenes, estado_procesamiento
 
 # Configurar logger
 logger = logging.getLogger(__name__)
@@ -192,41 +193,64 @@ def upload_biometria_image(request):
             }, status=400)
             
         # Subir imágenes de forma optimizada
-        count = 0
-        imagenes_creadas = []
         imagenes_rechazadas = []
         
         # Obtener validador para verificar que sean imágenes de perros
         from ..services.canine_validator import get_validator
         validator = get_validator()
         
-        for file in files:
-            # Verificar límite durante el proceso
-            current_count = mascota.imagenes.filter(is_biometrica=True).count()
-            if current_count >= 20:
-                break  # Ya se alcanzó el límite máximo de 20, detener
-                
+        # Leer cada imagen una sola vez y descartar las que no son imágenes
+        rechazos = {}  # {posición: rechazo}
+        decodificadas = {}  # {posición: ImagenDecodificada}
+        for i, file in enumerate(files):
             # Verificar que sea una imagen
             if not file.content_type.startswith('image/'):
-                imagenes_rechazadas.append({
+                rechazos[i] = {
                     'nombre': file.name,
                     'razon': 'Tipo de archivo no válido',
                     'objeto_detectado': 'No es una imagen'
-                })
+                }
                 continue
-            
-            # ✨ VALIDACIÓN CANINA - Verificar que la imagen sea de un perro
             try:
-                resultado_validacion = validator.validar_desde_file(file)
+                # Se lee una sola vez; los bytes se reutilizan al guardarla
+                decodificadas[i] = ImagenDecodificada.desde_archivo(file)
             except Exception as e:
-                logger.error(f"Error al validar imagen '{file.name}': {e}", exc_info=True)
-                imagenes_rechazadas.append({
+                logger.error(f"Error al leer imagen '{file.name}': {e}", exc_info=True)
+                rechazos[i] = {
                     'nombre': file.name,
                     'razon': f'Error al procesar imagen: {str(e)}',
                     'objeto_detectado': 'Error de validación'
-                })
+                }
+        
+        # ✨ VALIDACIÓN CANINA - Todas las imágenes en una sola pasada del modelo
+        posiciones = list(decodificadas)
+        try:
+            validaciones = dict(zip(
+                posiciones,
+                validator.validar_lote([decodificadas[i] for i in posiciones])
+            ))
+        except Exception as e:
+            logger.error(f"Error al validar imágenes: {e}", exc_info=True)
+            validaciones = {}
+            for i in posiciones:
+                rechazos[i] = {
+                    'nombre': files[i].name,
+                    'razon': f'Error al procesar imagen: {str(e)}',
+                    'objeto_detectado': 'Error de validación'
+                }
+        
+        # Seleccionar las imágenes aceptadas sin superar el límite de 20
+        # (conteo hecho una sola vez al inicio)
+        aceptadas = []  # [(nombre, contenido)]
+        for i, file in enumerate(files):
+            if current_images + len(aceptadas) >= 20:
+                break  # Ya se alcanzó el límite máximo de 20, detener
+            
+            if i in rechazos:
+                imagenes_rechazadas.append(rechazos[i])
                 continue
             
+            resultado_validacion = validaciones[i]
             if not resultado_validacion['es_canino']:
                 logger.warning(f"Imagen '{file.name}' rechazada: {resultado_validacion['objeto_detectado']} ({resultado_validacion['confianza']}%)")
                 imagenes_rechazadas.append({
@@ -238,17 +262,17 @@ def upload_biometria_image(request):
                 continue
             
             logger.info(f"Imagen '{file.name}' validada: {resultado_validacion['objeto_detectado']} ({resultado_validacion['confianza']}%)")
-                
-            # Crear objeto ImagenMascota (sin procesar aún)
-            imagen = ImagenMascota.objects.create(
-                mascota=mascota,
-                imagen=file,
-                tipo='biometrica',
-                is_biometrica=True
-            )
-            
-            imagenes_creadas.append(imagen.id)
-            count += 1
+            aceptadas.append((file.name, decodificadas[i].contenido))
+        
+        # Subir al storage en paralelo y crear los registros (sin procesar aún) con un solo INSERT
+        imagenes_creadas, errores_subida = guardar_imagenes_biometricas(mascota, aceptadas)
+        for nombre, error in errores_subida:
+            imagenes_rechazadas.append({
+                'nombre': nombre,
+                'razon': f'Error al guardar imagen: {error}',
+                'objeto_detectado': 'Error de almacenamiento'
+            })
+        count = len(imagenes_creadas)
             
         # Si la biometría ya estaba entrenada, marcarla como no entrenada
         # porque ahora hay nuevas imágenes y necesita re-entrenamiento
@@ -256,21 +280,13 @@ def upload_biometria_image(request):
             mascota.biometria_entrenada = False
             mascota.save()
         
-        # Procesar todas las imágenes en un hilo separado para no bloquear la respuesta
+        # Encolar las imágenes; el worker (manage.py procesar_trabajos_biometricos)
+        # extrae los embeddings fuera de la petición
         if imagenes_creadas:
-            import threading
-            def procesar_imagenes_background():
-                for imagen_id in imagenes_creadas:
-                    try:
-                        procesar_imagen_mascota(imagen_id)
-                    except Exception as e:
-                        print(f"Error al procesar imagen {imagen_id}: {e}")
-            
-            # Ejecutar en segundo plano
-            threading.Thread(target=procesar_imagenes_background, daemon=True).start()
+            encolar_imagenes(imagenes_creadas)
             
-        # Obtener conteo final
-        final_count = mascota.imagenes.filter(is_biometrica=True).count()
+        # Conteo final a partir del conteo inicial
+        final_count = current_images + count
         
         # Construir mensaje de respuesta
         mensaje_partes = []
@@ -338,7 +354,7 @@ def upload_biometria_base64(request):
         try:
             from ..services.canine_validator import get_validator
             validator = get_validator()
-            resultado_validacion = validator.validar_desde_bytes(imagen_data)
+            resultado_validacion = validator.validar_imagen(ImagenDecodificada.desde_bytes(imagen_data))
         except Exception as e:
             logger.error(f"Error al validar imagen biométrica: {e}", exc_info=True)
             return JsonResponse({
@@ -389,11 +405,8 @@ def upload_biometria_base64(request):
             mascota.biometria_entrenada = False
             mascota.save()
         
-        # Procesar imagen en segundo plano
-        try:
-            procesar_imagen_mascota(imagen.id)
-        except Exception as e:
-            print(f"Error al procesar imagen: {e}")
+        # Encolar la imagen para extraer sus embeddings en segundo plano
+        encolar_imagenes([imagen])
         
         # Obtener conteo actualizado
         new_images_count = mascota.imagenes.filter(is_biometrica=True).count()
@@ -460,11 +473,16 @@ def get_mascota_stats(request, pk):
         biometria_entrenada = mascota.biometria_entrenada
         confianza = mascota.confianza_biometrica
         
+        # Estado de la cola de extracción de embeddings
+        procesamiento = estado_procesamiento(mascota)
+        
         return JsonResponse({
             'success': True,
             'images_count': images_count,
             'biometria_entrenada': biometria_entrenada,
             'confianza': confianza,
+            'procesamiento': procesamiento,
+            'procesamiento_pendiente': procesamiento['pendiente'] + procesamiento['procesando'],
             'reload_gallery': False
         })
         
@@ -498,11 +516,11 @@ def train_model(request, pk):
         if embeddings_count < 5:
             # Procesar todas las imágenes sin procesar
             imagenes_sin_procesar = mascota.imagenes.filter(is_biometrica=True, procesada=False)
-            for img in imagenes_sin_procesar:
-                try:
-                    procesar_imagen_mascota(img.id)
-                except Exception as e:
-                    print(f"Error al procesar imagen {img.id}: {e}")
+            try:
+                # Todas las imágenes pendientes en lotes del extractor
+                procesar_imagenes_mascota(list(imagenes_sin_procesar.values_list('id', flat=True)))
+            except Exception as e:
+                print(f"Error al procesar imágenes de la mascota {mascota.id}: {e}")
             
             # Verificar nuevamente
             embeddings_count = EmbeddingStore.objects.filter(mascota=mascota).count()
@@ -515,7 +533,7 @@ def train_model(request, pk):
         # Entrenar modelo
         try:
             start_time = time.time()
-            modelo = actualizar_modelo_global(tipo_modelo='knn', extractor='efficientnet_b0', n_neighbors=5)
+            modelo = actualizar_modelo_global(tipo_modelo='knn', extractor='efficientnet_b0', incremental=True, n_neighbors=5)
             end_time = time.time()
             
             if modelo:
@@ -697,17 +715,6 @@ def upload_image_for_recognition(request):
             
         # Decodificar base64
         imagen_data = base64.b64decode(imagen_base64)
-        
-        # Crear archivo temporal
-        temp_dir = os.path.join(settings.MEDIA_ROOT, 'temp')
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        # Crear nombre de archivo único
-        filename = os.path.join(temp_dir, f"{uuid.uuid4().hex}.jpg")
-        
-        # Guardar imagen temporal
-        with open(filename, 'wb') as f:
-            f.write(imagen_data)
     else:
         # Procesar archivo subido
         if 'imagen' not in request.FILES:
@@ -718,22 +725,19 @@ def upload_image_for_recognition(request):
         # Verificar que sea una imagen
         if not imagen_file.content_type.startswith('image/'):
             return JsonResponse({'success': False, 'error': 'El archivo no es una imagen'}, status=400)
-            
-        # Crear archivo temporal
-        temp_dir = os.path.join(settings.MEDIA_ROOT, 'temp')
-        os.makedirs(temp_dir, exist_ok=True)
         
-        # Crear nombre de archivo único
-        filename = os.path.join(temp_dir, f"{uuid.uuid4().hex}.jpg")
-        
-        # Guardar imagen temporal
-        with open(filename, 'wb') as f:
-            for chunk in imagen_file.chunks():
-                f.write(chunk)
+        imagen_data = imagen_file.read()
+    
+    if not imagen_data:
+        return JsonResponse({'success': False, 'error': 'La imagen está vacía'}, status=400)
+    
+    # La imagen se decodifica una sola vez y se comparte con el reconocimiento
+    # (sin archivo temporal en MEDIA_ROOT)
+    imagen = ImagenDecodificada.desde_bytes(imagen_data, f"{uuid.uuid4().hex}.jpg")
     
     try:
         # Reconocer mascota (pasar el usuario directamente)
-        resultado = reconocer_mascota(filename, usuario=request.user)
+        resultado = reconocer_mascota(imagen, usuario=request.user)
         
         # Si hay un error
         if 'error' in resultado:
@@ -775,10 +779,3 @@ def upload_image_for_recognition(request):
             
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
-    finally:
-        # Eliminar archivo temporal
-        try:
-            if os.path.exists(filename):
-                os.remove(filename)
-        except Exception:
-            pass
@@ -3,14 +3,19 @@ Vistas para el sistema de mascotas perdidas
 """
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import etag, require_http_methods
+from django.views.decorators.vary import vary_on_cookie
+from django.core.files.storage import default_storage
 from django.http import JsonResponse
 from django.contrib import messages
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+import hashlib
 import logging
 import json
+import time
 
 from ..models import Mascota
 from ..services.mascota_perdida_service import MascotaPerdidaService
@@ -54,10 +59,14 @@ def reportar_perdida(request, mascota_id):
         
         # Obtener ubicación opcional del POST
         ubicacion_perdida = request.POST.get('ubicacion_perdida', '').strip()
+        # Coordenadas opcionales (GPS del navegador) para alertar solo a los usuarios cercanos
+        coordenadas = MascotaPerdidaService.parsear_coordenadas(
+            request.POST.get('latitud'), request.POST.get('longitud')
+        )
         
         # Reportar como perdida
         exito, mensaje = MascotaPerdidaService.reportar_como_perdida(
-            mascota, request.user, ubicacion_perdida
+            mascota, request.user, ubicacion_perdida, coordenadas
         )
         
         if request.headers.get('Accept') == 'application/json':
@@ -231,13 +240,73 @@ def listar_mascotas_perdidas(request):
         return redirect('mascota:main_register')
 
 
+# Tamaño de página de la API de mascotas perdidas (parámetro `limite`)
+API_PERDIDAS_LIMITE = 50
+API_PERDIDAS_LIMITE_MAXIMO = 200
+
+
+def _version_mascotas_perdidas(request):
+    """(cantidad, última actualización) de las mascotas perdidas, una sola consulta por petición"""
+    if not hasattr(request, '_version_mascotas_perdidas'):
+        request._version_mascotas_perdidas = MascotaPerdidaService.version_mascotas_perdidas()
+    return request._version_mascotas_perdidas
+
+
+def _ventana_urls_firmadas():
+    """
+    Número de la ventana de tiempo actual para las URLs firmadas de las fotos.
+    Dura la vigencia mínima de una URL servida, así un 304 nunca deja al cliente
+    con URLs de fotos vencidas.
+    """
+    vigencia = getattr(default_storage, 'vigencia_minima_url', lambda: None)()
+    return int(time.time() // vigencia) if vigencia else 0
+
+
+def _etag_mascotas_perdidas(request):
+    """
+    ETag débil de la respuesta: versión de la lista (cantidad + última actualización),
+    la ventana de las URLs firmadas de las fotos y la variante pedida (página, tamaño
+    y si se muestran los datos de contacto)
+    """
+    total, ultima = _version_mascotas_perdidas(request)
+    variante = '|'.join([
+        request.GET.get('cursor', ''),
+        request.GET.get('limite', ''),
+        '1' if request.user.is_authenticated else '0',
+    ])
+    huella = hashlib.sha1(variante.encode()).hexdigest()[:12]
+    return f'W/"{total}-{ultima.timestamp() if ultima else 0}-{_ventana_urls_firmadas()}-{huella}"'
+
+
 @require_http_methods(["GET"])
+@etag(_etag_mascotas_perdidas)
+@cache_control(private=True, no_cache=True)
+@vary_on_cookie
 def api_mascotas_perdidas(request):
     """
     API para obtener la lista de mascotas perdidas en formato JSON
+    
+    Paginada por cursor: `limite` mascotas por página y `cursor` con el valor de
+    `siguiente_cursor` de la respuesta anterior. Los clientes que consultan
+    periódicamente deben reenviar el ETag en `If-None-Match`; si la lista no
+    cambió la respuesta es 304 sin contenido.
     """
     try:
-        mascotas_perdidas = MascotaPerdidaService.obtener_mascotas_perdidas()
+        try:
+            limite = int(request.GET.get('limite', API_PERDIDAS_LIMITE))
+        except ValueError:
+            limite = API_PERDIDAS_LIMITE
+        limite = max(1, min(limite, API_PERDIDAS_LIMITE_MAXIMO))
+        
+        try:
+            mascotas_perdidas, siguiente_cursor = MascotaPerdidaService.pagina_mascotas_perdidas(
+                request.GET.get('cursor') or None, limite
+            )
+        except ValueError as e:
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=400)
         
         data = []
         for mascota in mascotas_perdidas:
@@ -258,9 +327,12 @@ def api_mascotas_perdidas(request):
                 'caracteristicas': mascota.caracteristicas_especiales
             })
         
+        total, _ = _version_mascotas_perdidas(request)
         return JsonResponse({
             'success': True,
-            'total': len(data),
+            'total': total,
+            'limite': limite,
+            'siguiente_cursor': siguiente_cursor,
             'mascotas': data
         })
         
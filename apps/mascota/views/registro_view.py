@@ -8,7 +8,6 @@ from django.views.decorators.http import require_http_methods
 import json
 
 from apps.mascota.forms.registro_form import MascotaRegistroForm
-from apps.mascota.services.ai_predictor import predictor
 from apps.mascota.models import Mascota
 
 
@@ -90,6 +89,9 @@ def predict_from_image_ajax(request):
                 'error': 'La imagen no puede ser mayor a 5MB'
             })
         
+        # Importación diferida: el predictor (torch) solo se carga al usarlo
+        from apps.mascota.services.ai_predictor import predictor
+        
         # Verificar estado de los modelos antes de predecir
         models_loaded = (predictor.multitask_model is not None or predictor.body_condition_model is not None)
         if not models_loaded:
@@ -202,6 +204,8 @@ def _get_breed_display_name(breed_internal):
 def check_ai_model_status(request):
     """Vista para verificar el estado del modelo de IA"""
     try:
+        from apps.mascota.services.ai_predictor import predictor
+        
         # Verificar si el modelo está cargado
         model_available = predictor.model is not None
         
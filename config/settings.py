@@ -199,7 +199,7 @@ AZURE_CONTAINER = env('AZURE_CONTAINER')
 # Configuración de STORAGES para Django >= 4.2
 STORAGES = {
     "default": {
-        "BACKEND": "storages.backends.azure_storage.AzureStorage",
+        "BACKEND": "apps.mascota.services.almacenamiento_azure.AzureStorageConCache",
         "OPTIONS": {
             "account_name": AZURE_ACCOUNT_NAME,
             "account_key": AZURE_ACCOUNT_KEY,
@@ -230,3 +230,49 @@ DEFAULT_FROM_EMAIL = env('DEFAULT_FROM_EMAIL')
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB (por defecto es 2.5MB)
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB (por defecto es 2.5MB)
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 10240  # Por defecto es 1000
+
+# Biometría: tipo de dato con el que se guardan los embeddings ('float32' o 'float16')
+BIOMETRIA_EMBEDDING_DTYPE = env('BIOMETRIA_EMBEDDING_DTYPE', default='float32')
+# Directorio local para las instantáneas .npy de embeddings (compartidas por los workers vía mmap)
+BIOMETRIA_SNAPSHOT_DIR = env('BIOMETRIA_SNAPSHOT_DIR', default=str(BASE_DIR / 'snapshots'))
+# Procesos del worker de la cola biométrica (manage.py procesar_trabajos_biometricos)
+BIOMETRIA_WORKER_PROCESOS = env.int('BIOMETRIA_WORKER_PROCESOS', default=2)
+# Búsqueda en el índice biométrico: 'exacto' (producto completo) o 'ivfpq' (aproximada,
+# para poblaciones grandes; el índice se construye al entrenar el modelo global)
+BIOMETRIA_BACKEND_BUSQUEDA = env('BIOMETRIA_BACKEND_BUSQUEDA', default='exacto')
+# Listas invertidas que recorre cada consulta IVF-PQ (más listas: más recall y más latencia)
+BIOMETRIA_IVF_NPROBE = env.int('BIOMETRIA_IVF_NPROBE', default=8)
+# Subidas simultáneas al storage al ingerir un lote de imágenes biométricas
+BIOMETRIA_SUBIDAS_PARALELAS = env.int('BIOMETRIA_SUBIDAS_PARALELAS', default=4)
+# Ejecutar el extractor exportado (manage.py exportar_extractor) del modelo activo en lugar del eager
+BIOMETRIA_EXTRACTOR_EXPORTADO = env.bool('BIOMETRIA_EXTRACTOR_EXPORTADO', default=False)
+# Predictor de IA del registro (raza, etapa de vida y condición corporal): 'eager' (checkpoints .pth),
+# 'torchscript', 'int8_dinamico' o 'int8_estatico' (generado con manage.py optimizar_predictor --generar-int8)
+IA_PREDICTOR_MODO = env('IA_PREDICTOR_MODO', default='eager')
+# Predecir raza, etapa y condición corporal con un solo tronco resnet18 (requiere models/dog_fused_model.pth,
+# generado con manage.py destilar_condicion_corporal); si falta se usan los dos modelos por separado
+IA_PREDICTOR_FUSIONADO = env.bool('IA_PREDICTOR_FUSIONADO', default=False)
+# Cargar los modelos de IA en segundo plano al arrancar el servidor WSGI (por defecto se cargan en el primer uso)
+IA_PRECARGAR_MODELOS = env.bool('IA_PRECARGAR_MODELOS', default=False)
+# Variante del histograma LBP del descriptor facial: 'clasico', 'uniforme' o 'uniforme_ri'
+# (cambiarla obliga a registrar de nuevo los rostros)
+FACIAL_LBP_MODO = env('FACIAL_LBP_MODO', default='clasico')
+# Envíos masivos de email (alerta de mascota perdida): destinatarios por conexión SMTP y worker que envía los
+# lotes y la bandeja de notificaciones: 'hilo' (en segundo plano dentro del servidor) o 'comando'
+# (manage.py procesar_envios_masivos y manage.py procesar_notificaciones)
+EMAIL_ENVIOS_LOTE = env.int('EMAIL_ENVIOS_LOTE', default=100)
+EMAIL_ENVIOS_WORKER = env('EMAIL_ENVIOS_WORKER', default='hilo')
+# Alertas de mascota perdida con coordenadas: radio (km) alrededor del punto donde se perdió y si también
+# se envían a los usuarios sin ubicación de casa registrada (sin coordenadas se alerta a todos)
+ALERTAS_RADIO_KM = env.float('ALERTAS_RADIO_KM', default=5.0)
+ALERTAS_INCLUIR_SIN_UBICACION = env.bool('ALERTAS_INCLUIR_SIN_UBICACION', default=False)
+# Bandeja de salida de notificaciones de mascotas perdidas: eventos repetidos de una mascota dentro de la
+# ventana (segundos) se combinan en uno, máximo de emails por destinatario en el periodo (segundos) y tamaño de lote
+NOTIFICACIONES_VENTANA_SEGUNDOS = env.int('NOTIFICACIONES_VENTANA_SEGUNDOS', default=600)
+NOTIFICACIONES_MAX_POR_DESTINATARIO = env.int('NOTIFICACIONES_MAX_POR_DESTINATARIO', default=5)
+NOTIFICACIONES_PERIODO_LIMITE = env.int('NOTIFICACIONES_PERIODO_LIMITE', default=3600)
+NOTIFICACIONES_LOTE = env.int('NOTIFICACIONES_LOTE', default=50)
+# Caché de URLs firmadas de Azure (AzureStorageConCache): segundos antes de la expiración en que se deja de
+# reutilizar la URL de un blob y máximo de URLs guardadas por proceso
+AZURE_URL_CACHE_MARGEN = env.int('AZURE_URL_CACHE_MARGEN', default=300)
+AZURE_URL_CACHE_MAXIMO = env.int('AZURE_URL_CACHE_MAXIMO', default=10000)
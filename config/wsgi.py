@@ -14,3 +14,21 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# Precarga opcional de los modelos de IA en segundo plano: el proceso atiende requests
+# mientras tanto y el primer request de IA no paga la carga
+from django.conf import settings
+
+if getattr(settings, 'IA_PRECARGAR_MODELOS', False):
+    import threading
+
+    from apps.mascota.services.carga_diferida import precargar
+
+    threading.Thread(target=precargar, name='precarga-modelos', daemon=True).start()
+
+# Con EMAIL_ENVIOS_WORKER='hilo', retomar las notificaciones y los envíos masivos que quedaron
+# pendientes, reprogramados o a medias antes del reinicio (sin esperar a que llegue uno nuevo)
+from apps.mascota.services import envios_masivos, notificaciones
+
+notificaciones.lanzar_worker()
+envios_masivos.lanzar_worker()
@@ -15,7 +15,7 @@ async function reportarMascotaPerdida(mascotaId, mascotaNombre) {
         html: `
             <div class="text-left mb-4">
                 <p class="text-gray-700 mb-4">
-                    Al confirmar, se enviará una alerta a todos los usuarios registrados 
+                    Al confirmar, se enviará una alerta a los usuarios registrados 
                     para ayudar en la búsqueda de ${mascotaNombre}.
                 </p>
                 <label for="ubicacion-perdida" class="block text-sm font-medium text-gray-700 mb-2">
@@ -27,6 +27,10 @@ async function reportarMascotaPerdida(mascotaId, mascotaNombre) {
                     class="swal2-input w-full" 
                     placeholder="Ej: Cerca del parque central, Barrio Los Álamos..."
                     maxlength="255">
+                <label class="flex items-center mt-3 text-sm text-gray-700">
+                    <input id="usar-ubicacion-perdida" type="checkbox" class="mr-2" checked>
+                    Usar mi ubicación actual (la alerta llegará a los usuarios cercanos)
+                </label>
             </div>
         `,
         focusConfirm: false,
@@ -37,16 +41,20 @@ async function reportarMascotaPerdida(mascotaId, mascotaNombre) {
         cancelButtonColor: '#6b7280',
         preConfirm: () => {
             return {
-                ubicacion: document.getElementById('ubicacion-perdida').value.trim()
+                ubicacion: document.getElementById('ubicacion-perdida').value.trim(),
+                usarUbicacion: document.getElementById('usar-ubicacion-perdida').checked
             };
         }
     });
 
     if (formValues) {
+        // Coordenadas del navegador (si el usuario las permite)
+        const coordenadas = formValues.usarUbicacion ? await obtenerCoordenadasActuales() : null;
+
         // Mostrar loading
         Swal.fire({
             title: 'Reportando mascota perdida...',
-            html: 'Enviando alertas a todos los usuarios...',
+            html: 'Enviando alertas a los usuarios...',
             allowOutsideClick: false,
             showConfirmButton: false,
             willOpen: () => {
@@ -60,6 +68,10 @@ async function reportarMascotaPerdida(mascotaId, mascotaNombre) {
             if (formValues.ubicacion) {
                 formData.append('ubicacion_perdida', formValues.ubicacion);
             }
+            if (coordenadas) {
+                formData.append('latitud', coordenadas.latitud);
+                formData.append('longitud', coordenadas.longitud);
+            }
 
             const response = await fetch(`/mascota/${mascotaId}/reportar-perdida/`, {
                 method: 'POST',
@@ -108,6 +120,27 @@ async function reportarMascotaPerdida(mascotaId, mascotaNombre) {
     }
 }
 
+/**
+ * Obtiene la ubicación actual del dispositivo
+ * @returns {Promise<{latitud: number, longitud: number}|null>} null si no está disponible o se deniega
+ */
+function obtenerCoordenadasActuales() {
+    return new Promise((resolve) => {
+        if (!navigator.geolocation) {
+            resolve(null);
+            return;
+        }
+        navigator.geolocation.getCurrentPosition(
+            (posicion) => resolve({
+                latitud: posicion.coords.latitude,
+                longitud: posicion.coords.longitude
+            }),
+            () => resolve(null),
+            { enableHighAccuracy: true, timeout: 10000, maximumAge: 60000 }
+        );
+    });
+}
+
 /**
  * Cancela el reporte de mascota perdida
  * @param {number} mascotaId - ID de la mascota